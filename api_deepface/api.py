@@ -1,19 +1,71 @@
+import asyncio
 from typing import Annotated
-from io import BytesIO
-from PIL import Image
-import numpy as np
 
-from fastapi import APIRouter, File, UploadFile, status, Body
+import numpy as np
+from fastapi import APIRouter, File, UploadFile, status, Body, Response, Query
 from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from deepface import DeepFace
-from deepface.modules.detection import extract_faces
-
-from config import log
+from config import compare_batch_max, log
+from embeddings import embedding_cache
+from executor import InferenceOverloaded, inference
+from gallery import gallery
+from pipeline import (
+    StageTimer,
+    compare_embeddings,
+    count_faces,
+    distance_threshold,
+    embed,
+    embed_batch,
+    rank_candidates,
+    recognize,
+)
+from warmup import warm_up
 
 router = APIRouter()
 
 
+async def get_embedding(contents: bytes, model_name: str, timer: StageTimer):
+    """Эмбеддинг лица на изображении, из кэша или через детектор и модель"""
+    key = embedding_cache.key(contents, model_name)
+    with timer.stage("cache"):
+        embedding = await embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    embedding, stages = await inference.run(embed, contents, model_name, timer=timer)
+    timer.add(stages)
+    await embedding_cache.put(key, embedding)
+    return embedding
+
+
+async def get_embeddings(
+    contents: list[bytes], model_name: str, timer: StageTimer
+) -> tuple[dict[int, np.ndarray], dict[int, str]]:
+    """
+    Эмбеддинги лиц на нескольких изображениях по их индексам.
+    Найденные в кэше не пересчитываются, остальные считаются одним пакетом.
+    """
+    keys = [embedding_cache.key(image_bytes, model_name) for image_bytes in contents]
+    with timer.stage("cache"):
+        cached = await embedding_cache.get_many(keys)
+    embeddings = {
+        index: embedding for index, embedding in enumerate(cached) if embedding is not None
+    }
+    missing = [index for index in range(len(contents)) if index not in embeddings]
+    if not missing:
+        return embeddings, {}
+    (computed, failed), stages = await inference.run(
+        embed_batch, [contents[index] for index in missing], model_name, timer=timer
+    )
+    timer.add(stages)
+    for position, embedding in computed.items():
+        embeddings[missing[position]] = embedding
+    await embedding_cache.put_many(
+        {keys[missing[position]]: embedding for position, embedding in computed.items()}
+    )
+    return embeddings, {missing[position]: error for position, error in failed.items()}
+
+
 @router.post(
     "/recognize-face",
     status_code=status.HTTP_200_OK,
@@ -35,24 +87,22 @@ router = APIRouter()
         }
     }
 )
-async def recognize_face(file: UploadFile = File(...)):
+async def recognize_face(response: Response, file: UploadFile = File(...)):
     """
     Определяет возраст, пол и эмоцию лица на изображении.
     """
 
+    timer = StageTimer()
     try:
         contents = await file.read()
-        img = Image.open(BytesIO(contents))
-        image_array = np.array(img)
+        result, stages = await inference.run(recognize, contents, timer=timer)
+        timer.add(stages)
+        response.headers["Server-Timing"] = timer.header()
+        log.info("recognize-face timing: %s", timer.header())
 
-        faces = extract_faces(image_array, detector_backend='yolov8n')
-        if len(faces) != 1:
-            raise ValueError('На изображении должно быть одно лицо')
-
-        result = DeepFace.analyze(image_array, actions=('age', 'gender', 'emotion'), detector_backend='yolov8n')
-        img_age = result[0].get('age')
-        img_gender = 'мужчина' if result[0].get('dominant_gender') == 'Man' else 'женщина'
-        img_emotion = result[0].get('dominant_emotion')
+        img_age = result.get('age')
+        img_gender = 'мужчина' if result.get('dominant_gender') == 'Man' else 'женщина'
+        img_emotion = result.get('dominant_emotion')
         match img_emotion:
             case 'angry':
                 img_emotion = 'сердитый'
@@ -71,9 +121,11 @@ async def recognize_face(file: UploadFile = File(...)):
         return {
             "result": f"Возраст: {img_age}, Пол: {img_gender}, Эмоция: {img_emotion}",
             "age": img_age,
-            "gender": result[0].get('dominant_gender'),
-            "emotion": result[0].get('dominant_emotion'),
+            "gender": result.get('dominant_gender'),
+            "emotion": result.get('dominant_emotion'),
         }
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         log.error("An exception occurred: %s", str(e))
         return JSONResponse(
@@ -102,6 +154,7 @@ async def recognize_face(file: UploadFile = File(...)):
     }
 )
 async def compare_faces(
+        response: Response,
         file1: UploadFile = File(...),
         file2: UploadFile = File(...),
         model_name: Annotated[str,
@@ -113,21 +166,91 @@ async def compare_faces(
     Сравнивает два загруженных изображения на предмет схожести лиц.
     """
 
+    timer = StageTimer()
     try:
-        images = []
+        embeddings = []
         for file in file1, file2:
             contents = await file.read()
-            img = Image.open(BytesIO(contents))
-            image_array = np.array(img)
-            faces = extract_faces(image_array, detector_backend='yolov8n')
-            if len(faces) != 1:
-                raise ValueError('На изображении должно быть одно лицо')
-            images.append(image_array)
-        result = DeepFace.verify(images[0], images[1], model_name=model_name)
+            embeddings.append(await get_embedding(contents, model_name, timer))
+        with timer.stage("distance"):
+            result = compare_embeddings(embeddings[0], embeddings[1], model_name)
+        response.headers["Server-Timing"] = timer.header()
+        log.info("compare-faces timing: %s", timer.header())
+        return result
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        log.error("An exception occurred: %s", str(e))
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": str(e)},
+        )
+
+
+@router.post(
+    "/compare-faces/batch",
+    status_code=status.HTTP_200_OK,
+    summary="Compare Faces Batch",
+    tags=["DeepFace"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Compare one probe with many candidates",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "results": [
+                            {"index": 1, "filename": "b.jpg", "verified": True, "distance": 0.21},
+                            {"index": 0, "filename": "a.jpg", "verified": False, "distance": 0.83},
+                        ],
+                        "errors": [
+                            {"index": 2, "filename": "c.jpg", "error": "На изображении должно быть одно лицо"},
+                        ],
+                    }
+                }
+            }
+        }
+    }
+)
+async def compare_faces_batch(
+        response: Response,
+        probe: UploadFile = File(...),
+        candidates: list[UploadFile] = File(...),
+        model_name: Annotated[str,
+        Body(...,
+             description="Model for face recognition. Options: VGG-Face, Facenet, Facenet512, DeepFace, ArcFace"
+             )] = "VGG-Face"
+):
+    """
+    Сравнивает лицо на эталонном изображении с лицами на изображениях-кандидатах.
+    Возвращает кандидатов по возрастанию расстояния.
+    """
+
+    if len(candidates) > compare_batch_max:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"Не больше {compare_batch_max} изображений для сравнения"},
+        )
+    timer = StageTimer()
+    try:
+        probe_embedding = await get_embedding(await probe.read(), model_name, timer)
+        contents = [await file.read() for file in candidates]
+        embeddings, errors = await get_embeddings(contents, model_name, timer)
+        with timer.stage("distance"):
+            results = rank_candidates(probe_embedding, embeddings, model_name)
+        response.headers["Server-Timing"] = timer.header()
+        log.info("compare-faces/batch timing: %s", timer.header())
         return {
-            "verified": result.get("verified"),
-            "distance": result.get("distance"),
+            "results": [
+                {**result, "filename": candidates[result["index"]].filename}
+                for result in results
+            ],
+            "errors": [
+                {"index": index, "filename": candidates[index].filename, "error": error}
+                for index, error in sorted(errors.items())
+            ],
         }
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         log.error("An exception occurred: %s", str(e))
         return JSONResponse(
@@ -154,22 +277,182 @@ async def compare_faces(
         }
     }
 )
-async def count_people(file: UploadFile = File(...)):
+async def count_people(response: Response, file: UploadFile = File(...)):
     """
     Сравнивает два загруженных изображения на предмет схожести лиц.
     """
 
+    timer = StageTimer()
     try:
         contents = await file.read()
-        img = Image.open(BytesIO(contents))
-        image_array = np.array(img)
-        result = extract_faces(image_array, detector_backend='yolov8n')
+        count, stages = await inference.run(count_faces, contents, timer=timer)
+        timer.add(stages)
+        response.headers["Server-Timing"] = timer.header()
         return {
-            "count people": len(result),
+            "count people": count,
         }
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         log.error("An exception occurred: %s", str(e))
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": str(e)},
         )
+
+
+@router.post(
+    "/gallery/{user_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Enrol Face",
+    tags=["Gallery"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Face added to the gallery",
+            "content": {
+                "application/json": {
+                    "example": {"user_id": 1, "faces": 2, "size": 100000}
+                }
+            }
+        }
+    }
+)
+async def enrol_face(user_id: int, response: Response, file: UploadFile = File(...)):
+    """
+    Добавляет лицо пользователя в галерею для идентификации.
+    """
+
+    timer = StageTimer()
+    try:
+        embedding = await get_embedding(await file.read(), gallery.model_name, timer)
+        with timer.stage("enrol"):
+            await asyncio.to_thread(gallery.add, [user_id], embedding)
+        response.headers["Server-Timing"] = timer.header()
+        return {"user_id": user_id, "faces": gallery.count(user_id), "size": gallery.size}
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        log.error("An exception occurred: %s", str(e))
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": str(e)},
+        )
+
+
+@router.delete(
+    "/gallery/{user_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Remove Faces",
+    tags=["Gallery"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Faces removed from the gallery",
+            "content": {"application/json": {"example": {"user_id": 1, "removed": 2}}}
+        }
+    }
+)
+async def remove_faces(user_id: int):
+    """
+    Удаляет все лица пользователя из галереи.
+    """
+
+    removed = await asyncio.to_thread(gallery.remove, user_id)
+    return {"user_id": user_id, "removed": removed}
+
+
+@router.post(
+    "/identify",
+    status_code=status.HTTP_200_OK,
+    summary="Identify Face",
+    tags=["Gallery"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Closest users from the gallery",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "matches": [
+                            {"user_id": 1, "distance": 0.18, "verified": True},
+                            {"user_id": 7, "distance": 0.64, "verified": False},
+                        ]
+                    }
+                }
+            }
+        }
+    }
+)
+async def identify(
+        response: Response,
+        file: UploadFile = File(...),
+        k: Annotated[int, Query(ge=1, le=100)] = 5,
+):
+    """
+    Находит в галерее пользователей, наиболее похожих на лицо на изображении.
+    """
+
+    timer = StageTimer()
+    try:
+        embedding = await get_embedding(await file.read(), gallery.model_name, timer)
+        with timer.stage("search"):
+            matches = await asyncio.to_thread(gallery.search, embedding, k)
+        threshold = distance_threshold(gallery.model_name)
+        response.headers["Server-Timing"] = timer.header()
+        log.info("identify timing: %s", timer.header())
+        return {
+            "matches": [
+                {**match, "verified": match["distance"] <= threshold} for match in matches
+            ]
+        }
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        log.error("An exception occurred: %s", str(e))
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": str(e)},
+        )
+
+
+@router.get(
+    "/health/ready",
+    summary="Readiness",
+    tags=["Health"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Models are loaded",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "status": "ready",
+                        "models": {"yolov8n": 1.2, "age": 3.4, "VGG-Face": 5.6},
+                    }
+                }
+            }
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Models are loading"},
+    }
+)
+async def health_ready():
+    """
+    Готовность сервиса: модели загружены и прогреты.
+    """
+
+    if not warm_up.ready:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "status": "failed" if warm_up.error else "loading",
+                "detail": warm_up.error,
+                "models": warm_up.timings,
+            },
+        )
+    return {"status": "ready", "models": warm_up.timings}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Метрики сервиса в формате Prometheus.
+    """
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,62 @@
+"""
+Задержка и полнота (recall@1) идентификации в зависимости от размера галереи.
+Эмбеддинги синтетические: случайный вектор на пользователя, запрос -
+тот же вектор с шумом. Приближенный индекс замеряется, если установлен faiss.
+
+Запуск из каталога api_deepface:
+    python benchmark_gallery.py [--sizes 1000 10000 100000] [--dim 512]
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+import gallery as gallery_module
+from gallery import FaceGallery
+
+QUERIES = 200
+NOISE = 0.35
+
+
+def measure(face_gallery: FaceGallery, queries: np.ndarray, truth: np.ndarray, exact: bool):
+    latencies, hits = [], 0
+    for query, user_id in zip(queries, truth):
+        started = time.perf_counter()
+        matches = face_gallery.search(query, k=1, exact=exact)
+        latencies.append(time.perf_counter() - started)
+        hits += bool(matches) and matches[0]["user_id"] == user_id
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), hits / len(truth)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+
+    print(f"{'size':>7} | {'index':>6} | {'p50 ms':>7} | {'p99 ms':>7} | recall@1")
+    for size in args.sizes:
+        embeddings = rng.standard_normal((size, args.dim), dtype=np.float32)
+        truth = rng.integers(0, size, QUERIES)
+        queries = embeddings[truth] + NOISE * rng.standard_normal(
+            (QUERIES, args.dim), dtype=np.float32
+        ) * np.linalg.norm(embeddings[truth], axis=1, keepdims=True) / np.sqrt(args.dim)
+        with tempfile.TemporaryDirectory() as path:
+            face_gallery = FaceGallery(path, "benchmark", ann_min_size=1)
+            face_gallery.load()
+            face_gallery.add(np.arange(size), embeddings)
+            kinds = ["exact"] + (["hnsw"] if gallery_module.faiss is not None else [])
+            for kind in kinds:
+                p50, p99, recall = measure(face_gallery, queries, truth, kind == "exact")
+                print(f"{size:>7} | {kind:>6} | {p50:>7.2f} | {p99:>7.2f} | {recall:.3f}")
+            del face_gallery
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Время декодирования и пиковая память процесса при подготовке фото с телефона
+(JPEG 4000x3000): прежнее полное декодирование против load_image.
+Каждый способ замеряется в отдельном процессе, чтобы пиковая память не смешивалась.
+Пиковая память (ru_maxrss) - Linux, в мегабайтах.
+
+Запуск из каталога api_deepface:
+    python benchmark_ingest.py
+"""
+
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+SIZE = (4000, 3000)
+RUNS = 10
+
+
+def make_photo() -> bytes:
+    """Синтетическое фото: шум на градиенте, чтобы JPEG не сжимался до нуля"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, SIZE[0], dtype=np.float32)[np.newaxis, :, np.newaxis]
+    pixels = gradient + rng.normal(0, 4, (SIZE[1], SIZE[0], 3))
+    buffer = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(
+        buffer, format="JPEG", quality=90
+    )
+    return buffer.getvalue()
+
+
+def full_decode(contents: bytes) -> np.ndarray:
+    """Прежний способ: полное разрешение и копия при смене порядка каналов"""
+    img = Image.open(BytesIO(contents)).convert("RGB")
+    return np.array(img)[:, :, ::-1]
+
+
+def run(method: str, path: str):
+    from ingest import load_image
+
+    decode = full_decode if method == "full" else load_image
+    with open(path, "rb") as file:
+        contents = file.read()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        image = decode(contents)
+    elapsed = (time.perf_counter() - started) / RUNS * 1000
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024
+    print(f"{method:>6} | {elapsed:>8.1f} | {peak:>12.1f} | {image.shape[1]}x{image.shape[0]}")
+
+
+def main():
+    if len(sys.argv) > 3 and sys.argv[1] == "--run":
+        run(sys.argv[2], sys.argv[3])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "--make":
+        with open(sys.argv[2], "wb") as file:
+            file.write(make_photo())
+        return
+    print(f"{'method':>6} | {'ms/image':>8} | {'peak RSS MB':>12} | array")
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as photo:
+        # фото создается отдельным процессом: пиковая память наследуется при запуске
+        subprocess.run([sys.executable, __file__, "--make", photo.name], check=True)
+        for method in ("full", "ingest"):
+            subprocess.run(
+                [sys.executable, __file__, "--run", method, photo.name], check=True
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import logging
+import os
 
 logging.basicConfig(
     level=logging.INFO,
@@ -8,3 +9,43 @@ logging.basicConfig(
 
 log = logging.getLogger(__name__)
 
+# Детектор лиц, используется один раз на изображение
+detector_backend = os.getenv("DETECTOR_BACKEND", "yolov8n")
+
+# Кэш эмбеддингов: размер в памяти процесса и время хранения в Redis, секунды
+embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+embedding_cache_ttl = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# Redis для общего кэша эмбеддингов, без REDIS_HOST используется только память
+redis_host = os.getenv("REDIS_HOST", "")
+redis_port = int(os.getenv("REDIS_PORT", "6379"))
+redis_db = int(os.getenv("REDIS_DB", "2"))
+
+# Пул процессов для инференса: у каждого процесса свои экземпляры моделей
+inference_workers = int(os.getenv("INFERENCE_WORKERS", "1"))
+# Количество запросов, ожидающих свободный процесс, сверх занятых
+inference_max_queue = int(os.getenv("INFERENCE_MAX_QUEUE", "8"))
+# Время ожидания запуска и прогрева всех процессов пула, секунды
+inference_start_timeout = int(os.getenv("INFERENCE_START_TIMEOUT", "600"))
+# Значение заголовка Retry-After при переполнении очереди, секунды
+inference_retry_after = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+
+# Максимальное количество кандидатов в пакетном сравнении лиц
+compare_batch_max = int(os.getenv("COMPARE_BATCH_MAX", "32"))
+
+# Галерея лиц для идентификации: каталог хранения и модель эмбеддингов
+gallery_path = os.getenv("GALLERY_PATH", "gallery")
+gallery_model = os.getenv("GALLERY_MODEL", "Facenet512")
+
+# Модели, загружаемые и прогреваемые при старте сервиса.
+# По умолчанию прогревается и модель галереи, с ней работают идентификация и пополнение галереи
+warmup_models = [
+    m for m in os.getenv("WARMUP_MODELS", f"VGG-Face,{gallery_model}").split(",") if m
+]
+warmup_actions = [a for a in os.getenv("WARMUP_ACTIONS", "age,gender,emotion").split(",") if a]
+# Размер галереи, начиная с которого используется приближенный индекс (faiss)
+gallery_ann_min_size = int(os.getenv("GALLERY_ANN_MIN_SIZE", "10000"))
+# Ширина поиска HNSW: больше - выше полнота и задержка
+gallery_ann_ef_search = int(os.getenv("GALLERY_ANN_EF_SEARCH", "128"))
+
+# Длинная сторона изображения перед поиском лиц, пиксели
+ingest_max_edge = int(os.getenv("INGEST_MAX_EDGE", "1280"))
@@ -0,0 +1,142 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config import (
+    detector_backend,
+    embedding_cache_size,
+    embedding_cache_ttl,
+    log,
+    redis_db,
+    redis_host,
+    redis_port,
+)
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов лиц по содержимому изображения.
+    Первый уровень - LRU в памяти процесса, второй (необязательный) - Redis,
+    где вектор хранится как байты float32.
+    """
+
+    def __init__(self, max_size: int, ttl: int, host: str, port: int, db: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.host = host
+        self.port = port
+        self.db = db
+        self.connection: Redis | None = None
+        self._items: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def connect(self):
+        """Подключаемся к Redis, если он задан. Без Redis кэш работает только в памяти"""
+        if not self.host:
+            return
+        connection = Redis(host=self.host, port=self.port, db=self.db)
+        try:
+            await connection.ping()
+        except RedisError as e:
+            log.warning("Embedding cache works without Redis: %s", str(e))
+            await connection.aclose()
+            return
+        self.connection = connection
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.aclose()
+            self.connection = None
+
+    @staticmethod
+    def key(contents: bytes, model_name: str) -> str:
+        """Ключ кэша: хэш изображения, модель и детектор"""
+        digest = hashlib.sha256(contents).hexdigest()
+        return f"deepface:embedding:{model_name}:{detector_backend}:{digest}"
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._items[key] = embedding
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    async def get(self, key: str) -> np.ndarray | None:
+        embedding = self._items.get(key)
+        if embedding is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return embedding
+        if self.connection is not None:
+            try:
+                data = await self.connection.get(key)
+            except RedisError as e:
+                log.warning("Embedding cache read failed: %s", str(e))
+                data = None
+            if data is not None:
+                embedding = np.frombuffer(data, dtype=np.float32)
+                self._remember(key, embedding)
+                self.hits += 1
+                return embedding
+        self.misses += 1
+        return None
+
+    async def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """Эмбеддинги по нескольким ключам: ненайденные в памяти читаются одним MGET"""
+        embeddings: list[np.ndarray | None] = []
+        for key in keys:
+            embedding = self._items.get(key)
+            if embedding is not None:
+                self._items.move_to_end(key)
+            embeddings.append(embedding)
+        missing = [
+            index for index, embedding in enumerate(embeddings) if embedding is None
+        ]
+        if missing and self.connection is not None:
+            try:
+                values = await self.connection.mget([keys[index] for index in missing])
+            except RedisError as e:
+                log.warning("Embedding cache read failed: %s", str(e))
+                values = [None] * len(missing)
+            for index, data in zip(missing, values):
+                if data is not None:
+                    embeddings[index] = np.frombuffer(data, dtype=np.float32)
+                    self._remember(keys[index], embeddings[index])
+        found = sum(embedding is not None for embedding in embeddings)
+        self.hits += found
+        self.misses += len(keys) - found
+        return embeddings
+
+    async def put_many(self, items: dict[str, np.ndarray]):
+        """Сохраняем несколько эмбеддингов, в Redis - одним пакетом команд"""
+        items = {
+            key: np.asarray(embedding, dtype=np.float32)
+            for key, embedding in items.items()
+        }
+        for key, embedding in items.items():
+            self._remember(key, embedding)
+        if self.connection is not None and items:
+            try:
+                async with self.connection.pipeline(transaction=False) as pipe:
+                    for key, embedding in items.items():
+                        pipe.set(key, embedding.tobytes(), ex=self.ttl)
+                    await pipe.execute()
+            except RedisError as e:
+                log.warning("Embedding cache write failed: %s", str(e))
+
+    async def put(self, key: str, embedding: np.ndarray):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self.connection is not None:
+            try:
+                await self.connection.set(key, embedding.tobytes(), ex=self.ttl)
+            except RedisError as e:
+                log.warning("Embedding cache write failed: %s", str(e))
+
+
+embedding_cache = EmbeddingCache(
+    embedding_cache_size, embedding_cache_ttl, redis_host, redis_port, redis_db
+)
@@ -0,0 +1,159 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from config import inference_max_queue, inference_start_timeout, inference_workers, log
+from pipeline import StageTimer
+from warmup import init_worker, warm_up, worker_started
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+QUEUE_WAIT = Histogram(
+    "deepface_inference_queue_wait_seconds",
+    "Время ожидания запроса в очереди пула инференса",
+    ["operation"],
+    buckets=BUCKETS,
+)
+INFERENCE_TIME = Histogram(
+    "deepface_inference_duration_seconds",
+    "Время обработки запроса моделями",
+    ["operation"],
+    buckets=BUCKETS,
+)
+REJECTED = Counter(
+    "deepface_inference_rejected_total",
+    "Количество запросов, отклоненных из-за переполнения очереди",
+)
+PENDING = Gauge(
+    "deepface_inference_pending",
+    "Количество запросов в очереди и в работе",
+)
+
+
+def _timed_call(func: Callable, *args) -> tuple:
+    """Выполнение функции в пуле с отметками времени начала и окончания"""
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time()
+
+
+class InferenceOverloaded(Exception):
+    """Очередь пула инференса заполнена"""
+
+
+class InferenceExecutor:
+    """
+    Пул процессов для TensorFlow и PIL вне цикла событий.
+    Каждый процесс при запуске загружает и прогревает свои экземпляры моделей.
+    Если все процессы заняты и очередь заполнена, запрос сразу отклоняется.
+    После аварийного завершения процесса пул создается и прогревается заново.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor: ProcessPoolExecutor | None = None
+        self.statuses: multiprocessing.Queue | None = None
+        self.warm_up_task: asyncio.Task | None = None
+        self.pending = 0
+
+    def start(self) -> None:
+        """Создаем пул процессов"""
+        if self.executor is None:
+            # TensorFlow не переносит fork после инициализации, процессы запускаются заново
+            context = multiprocessing.get_context("spawn")
+            self.statuses = context.Queue()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(context.Barrier(self.workers), self.statuses),
+            )
+
+    def shutdown(self) -> None:
+        """Останавливаем пул процессов"""
+        if self.warm_up_task is not None:
+            self.warm_up_task.cancel()
+            self.warm_up_task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    async def warm_up(self) -> None:
+        """
+        Запускаем все процессы пула и ждем окончания прогрева моделей в них.
+        Процессы ждут друг друга на барьере, поэтому каждая пустая задача
+        запускает свой процесс, а состояние прогрева приходит через очередь
+        от каждого процесса, а не от того, который успел взять задачу.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        statuses = self.statuses
+        try:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(self.executor, worker_started)
+                    for _ in range(self.workers)
+                )
+            )
+            results = [
+                await asyncio.to_thread(statuses.get, True, inference_start_timeout)
+                for _ in range(self.workers)
+            ]
+        except queue.Empty:
+            results = [
+                {
+                    "ready": False,
+                    "error": "Inference workers did not start",
+                    "timings": {},
+                }
+            ]
+        except Exception as e:
+            results = [{"ready": False, "error": str(e), "timings": {}}]
+        warm_up.collect(results)
+
+    def restart(self, executor: ProcessPoolExecutor) -> None:
+        """Пересоздаем сломанный пул и прогреваем его в фоне"""
+        if self.executor is not executor:
+            return  # пул уже пересоздан по ошибке другого запроса
+        log.error("Inference worker died, restarting the pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        warm_up.ready = False
+        self.start()
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def run(self, func: Callable, *args, timer: StageTimer | None = None):
+        if self.pending >= self.workers + self.max_queue:
+            REJECTED.inc()
+            raise InferenceOverloaded("Inference pool is saturated")
+        self.start()
+        self.pending += 1
+        PENDING.inc()
+        submitted = time.time()
+        executor = self.executor
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                executor, _timed_call, func, *args
+            )
+        except BrokenProcessPool as e:
+            self.restart(executor)
+            raise InferenceOverloaded("Inference pool is restarting") from e
+        finally:
+            self.pending -= 1
+            PENDING.dec()
+        queue_wait = max(started - submitted, 0.0)
+        QUEUE_WAIT.labels(func.__name__).observe(queue_wait)
+        INFERENCE_TIME.labels(func.__name__).observe(finished - started)
+        if timer is not None:
+            timer.add({"queue": queue_wait})
+        return result
+
+
+inference = InferenceExecutor(inference_workers, inference_max_queue)
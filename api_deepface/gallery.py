@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from config import (
+    gallery_ann_ef_search,
+    gallery_ann_min_size,
+    gallery_model,
+    gallery_path,
+    log,
+)
+
+try:
+    import faiss
+except ImportError:  # приближенный поиск необязателен
+    faiss = None
+
+
+class FaceGallery:
+    """
+    Галерея лиц пользователей для идентификации 1:N.
+    Нормированные эмбеддинги хранятся на диске матрицей float32 и отображаются
+    в память (memmap), идентификаторы пользователей - отдельным массивом.
+    Поиск точный (одно матричное умножение), для больших галерей при наличии
+    faiss - приближенный по индексу HNSW.
+    """
+
+    def __init__(
+        self, path: str, model_name: str, ann_min_size: int, ann_ef_search: int = 128
+    ):
+        self.path = path
+        self.model_name = model_name
+        self.ann_min_size = ann_min_size
+        self.ann_ef_search = ann_ef_search
+        # матрица, идентификаторы и индекс заменяются вместе, точный поиск читает их без блокировки
+        self._state = (
+            np.empty((0, 0), dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+            None,
+        )
+        # размерность эмбеддингов хранится рядом с идентификаторами
+        self.dim: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._state[0]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._state[1]
+
+    @property
+    def matrix_file(self) -> str:
+        return os.path.join(self.path, f"{self.model_name}.f32")
+
+    @property
+    def ids_file(self) -> str:
+        return os.path.join(self.path, f"{self.model_name}.ids.npy")
+
+    @property
+    def meta_file(self) -> str:
+        return os.path.join(self.path, f"{self.model_name}.meta.json")
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def count(self, user_id: int) -> int:
+        return int(np.count_nonzero(self.ids == user_id))
+
+    def load(self):
+        """Открываем галерею с диска"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self.dim = self._load_dim()
+            ids = None
+            if os.path.exists(self.ids_file):
+                if os.path.exists(self.matrix_file):
+                    ids = np.load(self.ids_file)
+                else:
+                    # идентификаторы без матрицы эмбеддингов: галерея считается пустой
+                    log.warning("Gallery %s has no embeddings file", self.model_name)
+            if os.path.exists(self.matrix_file):
+                # строки, записанные без идентификаторов (сбой при добавлении), отбрасываются
+                rows = len(ids) if ids is not None else 0
+                os.truncate(self.matrix_file, rows * (self.dim or 0) * 4)
+            if ids is not None:
+                self._replace(ids, self.dim or 0)
+        log.info("Gallery %s loaded: %d faces", self.model_name, self.size)
+
+    def _load_dim(self) -> int | None:
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as file:
+                return int(json.load(file)["dim"])
+        if not os.path.exists(self.ids_file) or not os.path.exists(self.matrix_file):
+            return None
+        # галерея, сохраненная до появления файла с размерностью
+        rows = len(np.load(self.ids_file))
+        size = os.path.getsize(self.matrix_file) // 4
+        if rows and size % rows:
+            raise ValueError(
+                f"Размерность галереи {self.model_name} не определяется: "
+                f"{size} значений на {rows} идентификаторов"
+            )
+        dim = size // rows if rows else None
+        if dim:
+            self._save_dim(dim)
+        return dim
+
+    def _save_dim(self, dim: int):
+        tmp_file = f"{self.meta_file}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump({"dim": dim}, file)
+        os.replace(tmp_file, self.meta_file)
+        self.dim = dim
+
+    def _save_ids(self, ids: np.ndarray):
+        tmp_file = f"{self.ids_file}.tmp.npy"
+        np.save(tmp_file, ids)
+        os.replace(tmp_file, self.ids_file)
+
+    def _replace(self, ids: np.ndarray, dim: int):
+        """Открываем матрицу с диска и заменяем состояние галереи целиком"""
+        if not len(ids):
+            self._state = (np.empty((0, 0), dtype=np.float32), ids, None)
+            return
+        matrix = np.memmap(
+            self.matrix_file, dtype=np.float32, mode="r", shape=(len(ids), dim)
+        )
+        self._state = (matrix, ids, self._build_index(matrix))
+
+    def _build_index(self, matrix: np.ndarray):
+        """Приближенный индекс строится только для больших галерей и при наличии faiss"""
+        if faiss is None or len(matrix) < self.ann_min_size:
+            return None
+        index = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = self.ann_ef_search
+        index.add(np.ascontiguousarray(matrix))
+        return index
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def add(self, user_ids: list[int], embeddings: np.ndarray):
+        """Добавляем лица пользователей в конец матрицы на диске"""
+        embeddings = self.normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                # размерность записывается до первых строк матрицы
+                self._save_dim(embeddings.shape[1])
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError("Размерность эмбеддинга не совпадает с галереей")
+            with open(self.matrix_file, "ab") as file:
+                file.write(embeddings.tobytes())
+            ids = np.concatenate([self.ids, np.asarray(user_ids, dtype=np.int64)])
+            self._save_ids(ids)
+            index = self._state[2]
+            if index is None:
+                self._replace(ids, embeddings.shape[1])
+                return
+            # большой индекс дополняется, а не перестраивается
+            index.add(embeddings)
+            matrix = np.memmap(
+                self.matrix_file,
+                dtype=np.float32,
+                mode="r",
+                shape=(len(ids), embeddings.shape[1]),
+            )
+            self._state = (matrix, ids, index)
+
+    def remove(self, user_id: int) -> int:
+        """Удаляем все лица пользователя, матрица на диске перезаписывается"""
+        with self._lock:
+            keep = self.ids != user_id
+            removed = self.size - int(np.count_nonzero(keep))
+            if not removed:
+                return 0
+            dim = self.matrix.shape[1]
+            tmp_file = f"{self.matrix_file}.tmp"
+            np.asarray(self.matrix[keep]).tofile(tmp_file)
+            # старая матрица остается отображенной в памяти до замены состояния
+            os.replace(tmp_file, self.matrix_file)
+            ids = self.ids[keep]
+            self._save_ids(ids)
+            self._replace(ids, dim)
+            return removed
+
+    def search(self, embedding: np.ndarray, k: int = 5, exact: bool = False) -> list[dict]:
+        """Ближайшие пользователи по косинусному расстоянию, по одному лучшему лицу на пользователя"""
+        matrix, ids, index = self._state
+        if not len(ids):
+            return []
+        query = self.normalize(embedding)
+        # у пользователя может быть несколько лиц, берем строк с запасом
+        rows_k = min(k * 4, len(ids))
+        if index is not None and not exact:
+            # HNSW в faiss не допускает поиск одновременно с добавлением
+            with self._lock:
+                scores, rows = index.search(query, rows_k)
+            scores, rows = scores[0], rows[0]
+            found = (rows >= 0) & (rows < len(ids))
+            scores, rows = scores[found], rows[found]
+        else:
+            all_scores = np.asarray(matrix @ query[0])
+            rows = np.argpartition(-all_scores, rows_k - 1)[:rows_k]
+            rows = rows[np.argsort(-all_scores[rows])]
+            scores = all_scores[rows]
+        matches, seen = [], set()
+        for row, score in zip(rows, scores):
+            user_id = int(ids[row])
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            matches.append({"user_id": user_id, "distance": max(float(1 - score), 0.0)})
+            if len(matches) == k:
+                break
+        return matches
+
+
+gallery = FaceGallery(
+    gallery_path, gallery_model, gallery_ann_min_size, gallery_ann_ef_search
+)
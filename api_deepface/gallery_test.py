@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+from gallery import FaceGallery
+
+
+def test_gallery_reload_after_partial_append(tmp_path):
+    """
+    Строки матрицы, записанные без идентификаторов (сбой при добавлении),
+    отбрасываются при загрузке, размерность берется из файла галереи
+    """
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((10, 512), dtype=np.float32)
+    face_gallery = FaceGallery(str(tmp_path), "test", ann_min_size=1_000_000)
+    face_gallery.load()
+    face_gallery.add(list(range(10)), embeddings)
+    with open(face_gallery.matrix_file, "ab") as file:
+        file.write(rng.standard_normal((3, 512), dtype=np.float32).tobytes())
+
+    reloaded = FaceGallery(str(tmp_path), "test", ann_min_size=1_000_000)
+    reloaded.load()
+    assert reloaded.size == 10
+    assert reloaded.matrix.shape == (10, 512)
+    assert reloaded.search(embeddings[7], k=1)[0]["user_id"] == 7
+    reloaded.add([10], embeddings[:1] * -1)
+    assert reloaded.search(-embeddings[0], k=1)[0]["user_id"] == 10
+
+
+def test_gallery_without_matrix_file(tmp_path):
+    """Файл идентификаторов без матрицы эмбеддингов открывается как пустая галерея"""
+    embeddings = np.random.default_rng(0).standard_normal((2, 512), dtype=np.float32)
+    face_gallery = FaceGallery(str(tmp_path), "test", ann_min_size=1_000_000)
+    face_gallery.load()
+    face_gallery.add([1, 2], embeddings)
+    os.remove(face_gallery.matrix_file)
+
+    reloaded = FaceGallery(str(tmp_path), "test", ann_min_size=1_000_000)
+    reloaded.load()
+    assert reloaded.size == 0
+    reloaded.add([3], embeddings[:1])
+    assert reloaded.search(embeddings[0], k=1)[0]["user_id"] == 3
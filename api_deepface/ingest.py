@@ -0,0 +1,25 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import ingest_max_edge
+
+
+def load_image(contents: bytes, max_edge: int = ingest_max_edge) -> np.ndarray:
+    """
+    Декодируем изображение в непрерывный массив BGR, как ожидает DeepFace.
+    JPEG сразу декодируется в уменьшенном размере (draft), ориентация по EXIF
+    и режим приводятся один раз, длинная сторона ограничивается max_edge
+    до перевода в массив.
+    """
+    img = Image.open(BytesIO(contents))
+    if img.format == "JPEG":
+        # декодер уменьшает изображение в 2, 4 или 8 раз, но не меньше запрошенного
+        img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
@@ -1,10 +1,44 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
 from api import router
+from config import inference_retry_after
+from embeddings import embedding_cache
+from executor import InferenceOverloaded, inference
+from gallery import gallery
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await embedding_cache.connect()
+    await asyncio.to_thread(gallery.load)
+    inference.start()
+    # Прогрев идет в фоне, чтобы /health/ready отвечал во время загрузки моделей
+    warm_up_task = asyncio.create_task(inference.warm_up())
+    yield
+    warm_up_task.cancel()
+    inference.shutdown()
+    await embedding_cache.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
+
+@app.exception_handler(InferenceOverloaded)
+async def inference_overloaded_handler(
+    request: Request, exc: InferenceOverloaded
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": str(inference_retry_after)},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8002)
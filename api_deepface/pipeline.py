@@ -0,0 +1,208 @@
+"""
+Обработка изображений с однократным поиском лиц.
+Детектор запускается один раз на изображение, найденные выровненные лица
+передаются в модели атрибутов и эмбеддингов с detector_backend="skip".
+"""
+
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from deepface import DeepFace
+from deepface.modules import verification
+from deepface.modules.detection import extract_faces
+
+from config import detector_backend
+from ingest import load_image
+
+ACTIONS = ("age", "gender", "emotion")
+DISTANCE_METRIC = "cosine"
+
+
+class StageTimer:
+    """Замер времени этапов обработки запроса"""
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (
+                self.stages.get(name, 0.0) + time.perf_counter() - started
+            )
+
+    def add(self, stages: dict[str, float]):
+        """Добавляем длительности этапов, замеренных в другом процессе"""
+        for name, seconds in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        """Значение заголовка Server-Timing, длительности в миллисекундах"""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()
+        )
+
+
+def detect_faces(image: np.ndarray) -> list[np.ndarray]:
+    """Находим и выравниваем лица, возвращаем вырезанные лица в BGR"""
+    faces = extract_faces(
+        image,
+        detector_backend=detector_backend,
+        color_face="bgr",
+        normalize_face=False,
+    )
+    return [np.asarray(face["face"], dtype=np.uint8) for face in faces]
+
+
+def detect_single_face(image: np.ndarray) -> np.ndarray:
+    """Лицо с изображения, на котором должно быть ровно одно лицо"""
+    faces = detect_faces(image)
+    if len(faces) != 1:
+        raise ValueError('На изображении должно быть одно лицо')
+    return faces[0]
+
+
+def analyze_face(face: np.ndarray) -> dict:
+    """Возраст, пол и эмоция по уже найденному лицу"""
+    return DeepFace.analyze(
+        face,
+        actions=ACTIONS,
+        detector_backend="skip",
+        enforce_detection=False,
+        silent=True,
+    )[0]
+
+
+def represent_face(face: np.ndarray, model_name: str) -> np.ndarray:
+    """Эмбеддинг уже найденного лица"""
+    result = DeepFace.represent(
+        face,
+        model_name=model_name,
+        detector_backend="skip",
+        enforce_detection=False,
+    )
+    return np.asarray(result[0]["embedding"], dtype=np.float32)
+
+
+def represent_faces(faces: list[np.ndarray], model_name: str) -> np.ndarray:
+    """Эмбеддинги нескольких найденных лиц одним пакетом через модель"""
+    if len(faces) == 1:
+        return represent_face(faces[0], model_name)[np.newaxis]
+    results = DeepFace.represent(
+        faces,
+        model_name=model_name,
+        detector_backend="skip",
+        enforce_detection=False,
+    )
+    return np.asarray(
+        [result[0]["embedding"] for result in results], dtype=np.float32
+    )
+
+
+def distance_threshold(model_name: str) -> float:
+    """Порог косинусного расстояния модели, как в DeepFace.verify"""
+    return verification.find_threshold(model_name, DISTANCE_METRIC)
+
+
+def cosine_distances(probe: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Косинусные расстояния от эмбеддинга до каждой строки матрицы"""
+    probe = probe / np.linalg.norm(probe)
+    candidates = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+    return 1 - candidates @ probe
+
+
+def rank_candidates(
+    probe: np.ndarray, candidates: dict[int, np.ndarray], model_name: str
+) -> list[dict]:
+    """Кандидаты по возрастанию расстояния до эталона с решением по порогу модели"""
+    if not candidates:
+        return []
+    indices = list(candidates)
+    distances = cosine_distances(probe, np.stack([candidates[i] for i in indices]))
+    threshold = distance_threshold(model_name)
+    return [
+        {
+            "index": indices[i],
+            "verified": bool(distances[i] <= threshold),
+            "distance": float(distances[i]),
+        }
+        for i in np.argsort(distances, kind="stable")
+    ]
+
+
+def compare_embeddings(
+    embedding1: np.ndarray, embedding2: np.ndarray, model_name: str
+) -> dict:
+    """Расстояние между эмбеддингами и решение по порогу модели, как в DeepFace.verify"""
+    distance = float(verification.find_cosine_distance(embedding1, embedding2))
+    threshold = distance_threshold(model_name)
+    return {
+        "verified": distance <= threshold,
+        "distance": distance,
+    }
+
+
+def recognize(contents: bytes) -> tuple[dict, dict[str, float]]:
+    """Атрибуты лица на изображении и длительности этапов"""
+    timer = StageTimer()
+    with timer.stage("decode"):
+        image = load_image(contents)
+    with timer.stage("detect"):
+        face = detect_single_face(image)
+    with timer.stage("analyze"):
+        result = analyze_face(face)
+    return result, timer.stages
+
+
+def embed(contents: bytes, model_name: str) -> tuple[np.ndarray, dict[str, float]]:
+    """Эмбеддинг лица на изображении и длительности этапов"""
+    timer = StageTimer()
+    with timer.stage("decode"):
+        image = load_image(contents)
+    with timer.stage("detect"):
+        face = detect_single_face(image)
+    with timer.stage("represent"):
+        embedding = represent_face(face, model_name)
+    return embedding, timer.stages
+
+
+def count_faces(contents: bytes) -> tuple[int, dict[str, float]]:
+    """Количество лиц на изображении и длительности этапов"""
+    timer = StageTimer()
+    with timer.stage("decode"):
+        image = load_image(contents)
+    with timer.stage("detect"):
+        faces = detect_faces(image)
+    return len(faces), timer.stages
+
+
+def embed_batch(
+    contents: list[bytes], model_name: str
+) -> tuple[tuple[dict[int, np.ndarray], dict[int, str]], dict[str, float]]:
+    """
+    Эмбеддинги лиц на нескольких изображениях: поиск лица на каждом,
+    затем все лица одним пакетом через модель.
+    Изображения без единственного лица попадают в ошибки по своему индексу.
+    """
+    timer = StageTimer()
+    faces, indices, errors = [], [], {}
+    for index, image_bytes in enumerate(contents):
+        try:
+            with timer.stage("decode"):
+                image = load_image(image_bytes)
+            with timer.stage("detect"):
+                faces.append(detect_single_face(image))
+        except Exception as e:
+            errors[index] = str(e)
+            continue
+        indices.append(index)
+    embeddings = {}
+    if faces:
+        with timer.stage("represent"):
+            embeddings = dict(zip(indices, represent_faces(faces, model_name)))
+    return (embeddings, errors), timer.stages
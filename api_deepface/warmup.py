@@ -0,0 +1,101 @@
+import threading
+import time
+
+import numpy as np
+
+from deepface import DeepFace
+from deepface.modules.detection import extract_faces
+
+from config import (
+    detector_backend,
+    inference_start_timeout,
+    log,
+    warmup_actions,
+    warmup_models,
+)
+from pipeline import represent_face
+
+
+class WarmUp:
+    """
+    Загрузка моделей и пробный запуск на синтетическом изображении при старте.
+    Выполняется в каждом процессе пула инференса, пока прогрев
+    не завершен во всех процессах, сервис не сообщает о готовности.
+    """
+
+    def __init__(self, models: list[str], actions: list[str]):
+        self.models = models
+        self.actions = actions
+        self.ready = False
+        self.error: str | None = None
+        self.timings: dict[str, float] = {}
+
+    def _measure(self, name: str, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[name] = round(time.perf_counter() - started, 3)
+        log.info("Model %s warmed up in %.1f s", name, self.timings[name])
+        return result
+
+    def run(self):
+        """Прогрев детектора, моделей атрибутов и моделей эмбеддингов"""
+        image = np.random.default_rng(0).integers(0, 255, (224, 224, 3), dtype=np.uint8)
+        try:
+            self._measure(
+                detector_backend,
+                extract_faces,
+                image,
+                detector_backend=detector_backend,
+                enforce_detection=False,
+            )
+            for action in self.actions:
+                self._measure(
+                    action,
+                    DeepFace.analyze,
+                    image,
+                    actions=(action,),
+                    detector_backend="skip",
+                    enforce_detection=False,
+                    silent=True,
+                )
+            for model_name in self.models:
+                self._measure(model_name, represent_face, image, model_name)
+        except Exception as e:
+            self.error = str(e)
+            log.error("Warm-up failed: %s", self.error)
+            return
+        self.ready = True
+        log.info("Models ready in %.1f s", sum(self.timings.values()))
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "error": self.error, "timings": self.timings}
+
+    def collect(self, statuses: list[dict]):
+        """Готовность сервиса по состоянию прогрева процессов пула инференса"""
+        errors = [status["error"] for status in statuses if status["error"]]
+        self.timings = statuses[0]["timings"] if statuses else {}
+        self.error = errors[0] if errors else None
+        self.ready = all(status["ready"] for status in statuses)
+        if self.ready:
+            log.info("Service ready, %d inference workers warmed up", len(statuses))
+
+
+warm_up = WarmUp(warmup_models, warmup_actions)
+
+
+def init_worker(barrier, statuses):
+    """
+    Инициализация процесса пула инференса: модели загружаются один раз на процесс.
+    Состояние прогрева передается основному процессу через очередь, затем процесс
+    ждет на барьере остальные, поэтому до конца прогрева задачи не берет.
+    """
+    warm_up.run()
+    statuses.put(warm_up.status())
+    try:
+        barrier.wait(inference_start_timeout)
+    except threading.BrokenBarrierError:
+        log.warning("Not all inference workers started in %d s", inference_start_timeout)
+
+
+def worker_started() -> None:
+    """Пустая задача: запускает процесс пула, если он еще не запущен"""
@@ -1,13 +1,117 @@
-from io import BytesIO
-from PIL import Image
+import asyncio
+from collections.abc import Awaitable
+from typing import Literal, TypeVar
 
-from fastapi import APIRouter, File, UploadFile, status, Form
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, File, Request, UploadFile, status, Form
+from fastapi.responses import Response, JSONResponse
 
-from config import pipe, pipe_prior, pipe_text, log
+from cache import image_cache
+from config import ProfileName, default_profile, log
+from jobs import JobLimitExceeded, job_queue
 
 router = APIRouter()
 
+T = TypeVar("T")
+
+# Клиент закрыл соединение до ответа (код nginx), ответ никто не получит
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение, не дождавшись результата"""
+
+
+async def wait_disconnect(request: Request) -> None:
+    """Ждем отключения клиента, тело запроса к этому моменту уже прочитано"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """Ожидаем результат, пока клиент на связи; при отключении ожидание отменяется"""
+    task = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(wait_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+    if task.cancelled():
+        raise ClientDisconnected
+    return task.result()
+
+
+def job_response(job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "position": job["position"],
+        "eta": job["eta"],
+        "error": job.get("error") or None,
+    }
+
+
+def owned_job(job: dict | None, user: str) -> dict | None:
+    """Задача доступна только пользователю, который ее поставил"""
+    if job is None or (job["user"] and job["user"] != user):
+        return None
+    return job
+
+
+def limit_response(e: JobLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(e)},
+    )
+
+
+async def submit_job(
+    kind: str,
+    prompt: str,
+    user: str,
+    image: bytes | None = None,
+    seed: int | None = None,
+    profile: str = default_profile,
+) -> dict | JSONResponse:
+    try:
+        return await job_queue.submit(
+            kind, prompt, user=user, image=image, seed=seed, profile=profile
+        )
+    except JobLimitExceeded as e:
+        return limit_response(e)
+
+
+async def wait_result(job_id: str) -> bytes | None:
+    """Ожидаем выполнения задачи и возвращаем изображение"""
+    job = await job_queue.wait(job_id)
+    result = await job_queue.result(job_id) if job else None
+    if result is None:
+        log.error("Job %s failed: %s", job_id, job.get("error") if job else "expired")
+    return result
+
+
+def image_response(result: bytes | None) -> Response:
+    if result is None:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Server Error"},
+        )
+    return Response(content=result, media_type="image/png")
+
+
+async def job_result(job_id: str, request: Request) -> Response:
+    """Изображение задачи; если клиент ушел, не дождавшись, задача снимается"""
+    try:
+        result = await until_disconnected(request, wait_result(job_id))
+    except ClientDisconnected:
+        await job_queue.cancel(job_id)
+        log.info("Client disconnected, job %s cancelled", job_id)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    return image_response(result)
+
 
 @router.post(
     "/generate_image",
@@ -15,28 +119,43 @@ router = APIRouter()
     summary="Generate image",
     tags=["Kandinsky"],
 )
-async def generate_image(prompt: str = Form(...)):
+async def generate_image(
+    request: Request,
+    prompt: str = Form(...),
+    user: str = Form(""),
+    seed: int | None = Form(None, ge=0, lt=2**63),
+    profile: ProfileName = Form(default_profile),
+):
     """
     Генерирует изображение по описанию.
+    Задача выполняется воркером очереди, веб-процесс только ожидает результат.
+    Изображение с заданным seed берется из кэша, одинаковые одновременные
+    запросы ждут одну генерацию.
+    Если клиент отключился, задача снимается с очереди; общая генерация
+    с seed продолжается для остальных запросов и сохраняется в кэш.
     """
 
+    if seed is None or not image_cache.enabled:
+        job = await submit_job("image", prompt, user, seed=seed, profile=profile)
+        if isinstance(job, JSONResponse):
+            return job
+        return await job_result(job["id"], request)
+
+    async def generate() -> bytes | None:
+        job = await job_queue.submit(
+            "image", prompt, user=user, seed=seed, profile=profile
+        )
+        return await wait_result(job["id"])
+
     try:
-        image = pipe_text(
-            prompt,
-            num_inference_steps=50,
-        ).images[0]
-
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-
-        return StreamingResponse(buffer, media_type="image/png")
-    except Exception as e:
-        log.error("An exception occurred: %s", str(e))
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"detail": "Server Error"},
+        result = await until_disconnected(
+            request, image_cache.fetch(image_cache.key(prompt, seed, profile), generate)
         )
+    except JobLimitExceeded as e:
+        return limit_response(e)
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    return image_response(result)
 
 
 @router.post(
@@ -45,38 +164,117 @@ async def generate_image(prompt: str = Form(...)):
     summary="Generate avatar",
     tags=["Kandinsky"],
 )
-async def generate_avatar(file: UploadFile = File(...), prompt: str = Form(...)):
+async def generate_avatar(
+    request: Request,
+    file: UploadFile = File(...),
+    prompt: str = Form(...),
+    user: str = Form(""),
+    profile: ProfileName = Form(default_profile),
+):
     """
     Генерирует уникальный аватар по фотографии пользователя и возвращает результат в виде потока байтов.
     """
 
-    try:
-        img_bytes = await file.read()
-        input_image = Image.open(BytesIO(img_bytes))
-        input_image.thumbnail((768, 768))
-
-        image_emb, zero_image_emb = pipe_prior(prompt, return_dict=False)
-
-        image = pipe(
-            prompt,
-            image=input_image,
-            image_embeds=image_emb,
-            negative_image_embeds=zero_image_emb,
-            height=768,
-            width=768,
-            num_inference_steps=120,
-            strength=0.15,
-        ).images[0]
-
-        output_buffer = BytesIO()
-        image.save(output_buffer, format='PNG')
-        output_buffer.seek(0)
-
-        return StreamingResponse(output_buffer, media_type="image/png")
-
-    except Exception as e:
-        log.error("An exception occurred: %s", str(e))
+    job = await submit_job(
+        "avatar", prompt, user, image=await file.read(), profile=profile
+    )
+    if isinstance(job, JSONResponse):
+        return job
+    return await job_result(job["id"], request)
+
+
+@router.post(
+    "/jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit generation job",
+    tags=["Jobs"],
+    responses={
+        status.HTTP_202_ACCEPTED: {
+            "description": "Job queued",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "id": "0f8fad5bd9cb469fa16570867728950e",
+                        "kind": "image",
+                        "status": "queued",
+                        "position": 3,
+                        "eta": 180.0,
+                        "error": None,
+                    }
+                }
+            },
+        },
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many jobs"},
+    },
+)
+async def create_job(
+    kind: Literal["image", "avatar"] = Form(...),
+    prompt: str = Form(...),
+    user: str = Form(""),
+    file: UploadFile | None = File(None),
+    seed: int | None = Form(None, ge=0, lt=2**63),
+    profile: ProfileName = Form(default_profile),
+):
+    """
+    Ставит задачу генерации в очередь и возвращает ее идентификатор.
+    """
+
+    if kind == "avatar" and file is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": "Для аватара требуется изображение"},
+        )
+    image = await file.read() if kind == "avatar" and file is not None else None
+    job = await submit_job(kind, prompt, user, image=image, seed=seed, profile=profile)
+    if isinstance(job, JSONResponse):
+        return job
+    return job_response(job)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Get job status",
+    tags=["Jobs"],
+)
+async def get_job(job_id: str, user: str = ""):
+    """
+    Состояние задачи, позиция в очереди и оценка времени готовности в секундах.
+    """
+
+    job = owned_job(await job_queue.get(job_id), user)
+    if job is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Job not found"}
+        )
+    return job_response(job)
+
+
+@router.get(
+    "/jobs/{job_id}/result",
+    status_code=status.HTTP_200_OK,
+    summary="Get job result",
+    tags=["Jobs"],
+)
+async def get_job_result(job_id: str, user: str = ""):
+    """
+    Возвращает сгенерированное изображение выполненной задачи.
+    """
+
+    job = owned_job(await job_queue.get(job_id), user)
+    if job is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Job not found"}
+        )
+    if job["status"] == "failed":
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": "Server Error"},
         )
+    result = await job_queue.result(job_id) if job["status"] == "done" else None
+    if result is None:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"detail": "Job is not finished", "status": job["status"]},
+        )
+    return Response(content=result, media_type="image/png")
@@ -0,0 +1,143 @@
+"""
+Задержка генерации аватара: prior на каждый запрос против сохраненных
+prior-эмбеддингов, при одинаковом расписании img2img.
+
+По умолчанию вместо Kandinsky используются модели-заглушки с тем же интерфейсом:
+prior выполняет 25 шагов над эмбеддингом описания, img2img, как и в diffusers,
+пропускает начало расписания и выполняет только strength * num_inference_steps шагов.
+С флагом --real загружаются настоящие модели (долго).
+
+Запуск из каталога api_kandinsky:
+    python benchmark_avatar.py [--real] [--runs 5] [--profile standard]
+"""
+
+import argparse
+import logging
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import generation
+from config import PROFILES
+
+PROMPT = "стиль анимации, уникальный, добрый"
+
+
+def make_layers(dim: int, layers: int, seed: int) -> list[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return [
+        rng.standard_normal((dim, dim), dtype=np.float32) / np.sqrt(dim)
+        for _ in range(layers)
+    ]
+
+
+def forward(hidden: np.ndarray, weights: list[np.ndarray]) -> np.ndarray:
+    for weight in weights:
+        hidden = np.tanh(hidden @ weight)
+    return hidden
+
+
+class StandInPrior:
+    """Заглушка KandinskyPriorPipeline: шаги диффузии над эмбеддингом описания"""
+
+    def __init__(self, dim: int = 1024, steps: int = 25):
+        self.weights = make_layers(dim, 8, 1)
+        self.dim, self.steps = dim, steps
+
+    def __call__(self, prompt, return_dict: bool = True):
+        tokens = np.random.default_rng(abs(hash(prompt)) % 2**32).standard_normal(
+            (77, self.dim), dtype=np.float32
+        )
+        # описание и пустое описание для classifier-free guidance
+        latents = np.stack([tokens, np.zeros_like(tokens)])
+        for _ in range(self.steps):
+            latents = latents - 0.1 * forward(latents, self.weights)
+        embeddings = latents.mean(axis=1)
+        return embeddings[:1], embeddings[1:]
+
+
+class StandInImg2Img:
+    """Заглушка KandinskyImg2ImgPipeline с пропуском начала расписания"""
+
+    def __init__(self, channels: int = 256):
+        self.weights = make_layers(channels, 6, 2)
+        self.channels = channels
+
+    def enable_attention_slicing(self):
+        pass
+
+    def disable_attention_slicing(self):
+        pass
+
+    def __call__(
+        self,
+        prompt,
+        image,
+        image_embeds,
+        negative_image_embeds,
+        height: int,
+        width: int,
+        num_inference_steps: int,
+        strength: float,
+    ):
+        latents = np.random.default_rng(0).standard_normal(
+            (2, (height // 16) * (width // 16), self.channels), dtype=np.float32
+        )
+        for _ in range(int(num_inference_steps * strength)):
+            latents = latents - 0.1 * forward(latents, self.weights)
+        pixels = ((np.tanh(latents[0, :, :3]) + 1) * 127.5).astype(np.uint8)
+        side = int(np.sqrt(len(pixels)))
+        return SimpleNamespace(
+            images=[Image.fromarray(pixels[: side * side].reshape(side, side, 3))]
+        )
+
+
+def make_photo() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (1024, 1024), "gray").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def measure(photo: bytes, profile_name: str, runs: int, cached: bool) -> float:
+    """Средняя задержка генерации аватара, секунды"""
+    started = time.perf_counter()
+    for _ in range(runs):
+        if not cached:
+            generation.prior_cache.clear()
+        generation.generate_avatar(PROMPT, photo, profile_name)
+    return (time.perf_counter() - started) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--real", action="store_true", help="настоящие модели")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", default="standard", choices=list(PROFILES))
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if not args.real:
+        prior, img2img = StandInPrior(), StandInImg2Img()
+        generation.load_pipelines = lambda *args: (None, prior, img2img)
+    photo = make_photo()
+    profile = PROFILES[args.profile]
+    # Прогрев: загрузка моделей и первый проход не входят в замер
+    generation.generate_avatar(PROMPT, photo, args.profile)
+
+    print(
+        f"profile {args.profile}: {profile.avatar_schedule_steps} scheduled, "
+        f"{profile.avatar_denoise_steps} denoising steps"
+    )
+    print(f"{'prior':>10} | {'s/avatar':>8}")
+    baseline = measure(photo, args.profile, args.runs, cached=False)
+    print(f"{'per call':>10} | {baseline:>8.3f}")
+    generation.precompute_priors()
+    cached = measure(photo, args.profile, args.runs, cached=True)
+    print(f"{'cached':>10} | {cached:>8.3f} | x{baseline / cached:.2f}")
+
+
+if __name__ == "__main__":
+    main()
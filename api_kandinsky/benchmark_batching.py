@@ -0,0 +1,97 @@
+"""
+Пропускная способность генерации по описанию (изображений в минуту)
+при размере пакета 1, 4 и 8 на CPU.
+
+По умолчанию вместо Kandinsky используется небольшая модель-заглушка:
+на каждом шаге латенты всего пакета проходят через одни и те же веса,
+как в UNet, поэтому выигрыш от пакетной обработки сохраняется.
+С флагом --real загружаются настоящие модели (долго).
+
+Запуск из каталога api_kandinsky:
+    python benchmark_batching.py [--real] [--images 16]
+"""
+
+import argparse
+import logging
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import generation
+
+BATCH_SIZES = (1, 4, 8)
+
+
+class StandInPipeline:
+    """Заглушка KandinskyCombinedPipeline с тем же интерфейсом вызова"""
+
+    def __init__(self, dim: int = 2048, layers: int = 4, size: int = 32):
+        rng = np.random.default_rng(0)
+        self.weights = [
+            rng.standard_normal((dim, dim), dtype=np.float32) / np.sqrt(dim)
+            for _ in range(layers)
+        ]
+        self.dim, self.size = dim, size
+
+    def enable_attention_slicing(self):
+        pass
+
+    def disable_attention_slicing(self):
+        pass
+
+    def __call__(self, prompt, num_inference_steps: int = 50, **kwargs):
+        prompts = [prompt] if isinstance(prompt, str) else prompt
+        latents = np.stack(
+            [
+                np.random.default_rng(abs(hash(p)) % 2**32)
+                .standard_normal(self.dim)
+                .astype(np.float32)
+                for p in prompts
+            ]
+        )
+        for _ in range(num_inference_steps):
+            hidden = latents
+            for weight in self.weights:
+                hidden = np.tanh(hidden @ weight)
+            latents = latents - 0.1 * hidden
+        pixels = latents[:, : self.size * self.size].reshape(-1, self.size, self.size)
+        pixels = ((np.tanh(pixels) + 1) * 127.5).astype(np.uint8)
+        return SimpleNamespace(
+            images=[Image.fromarray(p).convert("RGB") for p in pixels]
+        )
+
+
+def measure(batch_size: int, images: int) -> float:
+    """Изображений в минуту при заданном размере пакета"""
+    prompts = [f"a red cat #{i}" for i in range(images)]
+    started = time.perf_counter()
+    for i in range(0, images, batch_size):
+        generation.generate_images(prompts[i : i + batch_size])
+    return images / (time.perf_counter() - started) * 60
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--real", action="store_true", help="настоящие модели")
+    parser.add_argument("--images", type=int, default=16)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if not args.real:
+        pipe = StandInPipeline()
+        generation.load_pipelines = lambda *args: (pipe, None, None)
+    # Прогрев: загрузка моделей и первый проход не входят в замер
+    generation.generate_images(["warm-up"])
+
+    baseline = None
+    print(f"{'batch':>5} | {'images/min':>10} | speedup")
+    for batch_size in BATCH_SIZES:
+        rate = measure(batch_size, args.images)
+        baseline = baseline or rate
+        print(f"{batch_size:>5} | {rate:>10.1f} | x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from config import PROFILES, image_cache_max_bytes, image_cache_path, log
+
+
+class ImageCache:
+    """
+    Кэш сгенерированных изображений на диске.
+    Изображение с заданным seed воспроизводимо, поэтому хранится по хэшу
+    описания, seed и параметров профиля генерации. Общий объем ограничен:
+    при превышении удаляются давно не запрашиваемые файлы.
+    Одинаковые одновременные запросы ждут одну генерацию.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        # имя файла -> размер, в порядке последнего обращения
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.total = 0
+        self.inflight: dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.max_bytes > 0
+
+    @staticmethod
+    def key(prompt: str, seed: int, profile_name: str) -> str:
+        profile = PROFILES[profile_name]
+        params = {
+            "prompt": prompt,
+            "seed": seed,
+            "steps": profile.steps,
+            "size": profile.size,
+            "scheduler": profile.scheduler,
+            "dtype": profile.dtype,
+        }
+        return hashlib.sha256(
+            json.dumps(params, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.png")
+
+    def load(self):
+        """Восстанавливаем порядок файлов по времени последнего обращения"""
+        if not self.enabled:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        with self._lock:
+            self.entries.clear()
+            for _, key, size in sorted(files):
+                self.entries[key] = size
+            self.total = sum(self.entries.values())
+        log.info("Image cache: %d files, %d bytes", len(self.entries), self.total)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.file(key), "rb") as file:
+                data = file.read()
+            os.utime(self.file(key))
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        tmp_file = f"{self.file(key)}.tmp"
+        with open(tmp_file, "wb") as file:
+            file.write(data)
+        os.replace(tmp_file, self.file(key))
+        with self._lock:
+            self.total += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            evicted = []
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                name, size = self.entries.popitem(last=False)
+                self.total -= size
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(self.file(name))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, key: str):
+        with self._lock:
+            self.total -= self.entries.pop(key, 0)
+
+    async def _generate(
+        self, key: str, generate: Callable[[], Awaitable[bytes | None]]
+    ) -> bytes | None:
+        data = await generate()
+        if data is not None:
+            try:
+                await asyncio.to_thread(self.put, key, data)
+            except OSError as e:
+                log.warning("Image cache write failed: %s", str(e))
+        return data
+
+    def _done(self, key: str, task: asyncio.Task):
+        self.inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибка уже передана ожидавшим запросам
+
+    async def fetch(
+        self, key: str, generate: Callable[[], Awaitable[bytes | None]]
+    ) -> bytes | None:
+        """
+        Изображение из кэша или результат одной общей генерации.
+        Ошибка чужой генерации (например, превышен лимит задач ее автора)
+        не передается присоединившимся: они повторяют запрос со своей функцией.
+        """
+        while True:
+            task = self.inflight.get(key)
+            if task is None:
+                data = await asyncio.to_thread(self.get, key)
+                if data is not None:
+                    return data
+                task = self.inflight.get(key)
+            owner = task is None
+            if task is None:
+                task = asyncio.create_task(self._generate(key, generate))
+                self.inflight[key] = task
+                task.add_done_callback(lambda done: self._done(key, done))
+            try:
+                # отключение одного клиента не отменяет генерацию для остальных
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if owner:
+                    raise
+
+image_cache = ImageCache(image_cache_path, image_cache_max_bytes)
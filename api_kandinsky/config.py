@@ -1,9 +1,9 @@
 import logging
-from diffusers import (
-    KandinskyCombinedPipeline,
-    KandinskyPriorPipeline,
-    KandinskyImg2ImgPipeline,
-)
+import math
+import os
+from dataclasses import dataclass
+from functools import cache
+from typing import Literal
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,11 +14,125 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 model_id = "kandinsky-community/kandinsky-2-1"
 
-# Загрузка модели для генерации изображения по описанию
-pipe_text = KandinskyCombinedPipeline.from_pretrained(model_id)
+# Очередь задач генерации
+redis_host = os.getenv("REDIS_HOST", "redis")
+redis_port = int(os.getenv("REDIS_PORT", "6379"))
+redis_db = int(os.getenv("REDIS_DB", "1"))
+# Время хранения задачи и результата, секунды
+job_ttl = int(os.getenv("JOB_TTL", "3600"))
+# Количество задач одного пользователя в очереди и в работе
+user_max_jobs = int(os.getenv("USER_MAX_JOBS", "2"))
+# Синхронные методы ждут уведомления о завершении задачи, статус
+# перепроверяется не реже чем раз в JOB_WAIT_TIMEOUT секунд
+job_wait_timeout = float(os.getenv("JOB_WAIT_TIMEOUT", "5"))
+# Задача, при выполнении которой воркер аварийно завершался столько раз, считается ошибочной
+job_max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+# Максимальное количество описаний в одном проходе генерации
+batch_max_size = int(os.getenv("BATCH_MAX_SIZE", "4"))
+# Время ожидания задач для пакета, миллисекунды
+batch_max_wait_ms = int(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+# Кэш изображений, сгенерированных с заданным seed (пустой путь - без кэша)
+image_cache_path = os.getenv("IMAGE_CACHE_PATH", "/cache/images")
+image_cache_max_bytes = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024**3)))
+# Описания аватаров, для которых prior-эмбеддинги считаются при запуске воркера
+avatar_prompts = [
+    prompt
+    for prompt in os.getenv("AVATAR_PROMPTS", "стиль анимации, уникальный, добрый").split("|")
+    if prompt
+]
+# Количество описаний с сохраненными prior-эмбеддингами
+prior_cache_size = int(os.getenv("PRIOR_CACHE_SIZE", "32"))
+
+
+ProfileName = Literal["draft", "standard", "high"]
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Параметры генерации профиля качества"""
+
+    steps: int
+    size: int
+    # шаги img2img, которые действительно выполняются над исходным фото
+    avatar_denoise_steps: int
+    avatar_size: int
+    # доля шума, добавляемого к исходному фото
+    avatar_strength: float = 0.15
+    scheduler: Literal["ddim", "dpm", "unipc"] = "ddim"
+    dtype: Literal["float32", "float16", "bfloat16"] = "float32"
+    attention_slicing: bool = False
+
+    @property
+    def avatar_schedule_steps(self) -> int:
+        """
+        Длина расписания img2img: pipeline пропускает первые шаги и выполняет
+        только последние strength * num_inference_steps из них.
+        """
+        return math.ceil(self.avatar_denoise_steps / self.avatar_strength)
+
+
+# Профили с одинаковым dtype используют одни и те же веса моделей
+PROFILES: dict[str, Profile] = {
+    "draft": Profile(
+        steps=20, size=512, avatar_denoise_steps=9, avatar_size=512, scheduler="dpm"
+    ),
+    "standard": Profile(steps=50, size=512, avatar_denoise_steps=18, avatar_size=768),
+    "high": Profile(
+        steps=100,
+        size=768,
+        avatar_denoise_steps=30,
+        avatar_size=768,
+        attention_slicing=True,
+    ),
+}
+default_profile: ProfileName = os.getenv("DEFAULT_PROFILE", "standard")  # type: ignore[assignment]
+
+
+@cache
+def load_base_pipeline(dtype: str):
+    """
+    Загрузка моделей в заданной точности. Выполняется один раз в процессе
+    воркера очереди, веб-процессы модели не загружают.
+    Комбинированный pipeline сам загружает prior-модель.
+    """
+    import torch
+    from diffusers import KandinskyCombinedPipeline
+
+    return KandinskyCombinedPipeline.from_pretrained(
+        model_id, torch_dtype=getattr(torch, dtype)
+    )
+
 
-# Загрузка модели для генерации предварительных изображений
-pipe_prior = KandinskyPriorPipeline.from_pretrained(f"{model_id}-prior")
+@cache
+def load_pipelines(profile_name: str = default_profile):
+    """
+    Pipelines профиля: генерация по описанию, prior и img2img для аватара.
+    Собираются один раз из общих моделей, у профиля только свой scheduler.
+    """
+    from diffusers import (
+        DDIMScheduler,
+        DPMSolverMultistepScheduler,
+        KandinskyCombinedPipeline,
+        KandinskyImg2ImgPipeline,
+        UniPCMultistepScheduler,
+    )
 
-# Загрузка модели для генерации изображений
-pipe = KandinskyImg2ImgPipeline.from_pretrained(model_id)
+    schedulers = {
+        "ddim": DDIMScheduler,
+        "dpm": DPMSolverMultistepScheduler,
+        "unipc": UniPCMultistepScheduler,
+    }
+    profile = PROFILES[profile_name]
+    base = load_base_pipeline(profile.dtype)
+    components = {
+        **base.components,
+        "scheduler": schedulers[profile.scheduler].from_config(base.scheduler.config),
+    }
+    pipe_text = KandinskyCombinedPipeline(**components)
+    pipe = KandinskyImg2ImgPipeline(
+        **{
+            name: components[name]
+            for name in ("text_encoder", "tokenizer", "unet", "scheduler", "movq")
+        }
+    )
+    return pipe_text, pipe_text.prior_pipe, pipe
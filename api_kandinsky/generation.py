@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+from config import (
+    PROFILES,
+    Profile,
+    avatar_prompts,
+    default_profile,
+    load_pipelines,
+    log,
+    prior_cache_size,
+)
+
+# (описание, dtype) -> эмбеддинги prior для описания и пустого изображения
+prior_cache: OrderedDict[tuple[str, str], tuple] = OrderedDict()
+
+
+def to_png(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def job_seed(job: dict) -> int | None:
+    return int(job["seed"]) if job.get("seed") else None
+
+
+def job_profile(job: dict) -> str:
+    return job.get("profile") or default_profile
+
+
+def set_attention_slicing(pipeline, profile: Profile):
+    """
+    UNet общий для профилей с одинаковым dtype, поэтому нарезка внимания
+    переключается перед запуском, это только замена обработчиков внимания.
+    """
+    if profile.attention_slicing:
+        pipeline.enable_attention_slicing()
+    else:
+        pipeline.disable_attention_slicing()
+
+
+def make_generators(seeds: list[int | None]) -> list:
+    """Генераторы случайных чисел для каждого описания пакета, без seed - случайный"""
+    import torch
+
+    generators = []
+    for seed in seeds:
+        generator = torch.Generator()
+        if seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(seed)
+        generators.append(generator)
+    return generators
+
+
+def generate_images(
+    prompts: list[str],
+    seeds: list[int | None] | None = None,
+    profile_name: str = default_profile,
+) -> list[bytes]:
+    """
+    Генерирует изображения по нескольким описаниям за один проход модели.
+    Изображение с заданным seed воспроизводимо.
+    """
+    profile = PROFILES[profile_name]
+    pipe_text, _, _ = load_pipelines(profile_name)
+    set_attention_slicing(pipe_text, profile)
+    seeds = seeds or [None] * len(prompts)
+    images = pipe_text(
+        prompts,
+        num_inference_steps=profile.steps,
+        height=profile.size,
+        width=profile.size,
+        generator=make_generators(seeds) if any(s is not None for s in seeds) else None,
+    ).images
+    return [to_png(image) for image in images]
+
+
+def generate_image(
+    prompt: str, seed: int | None = None, profile_name: str = default_profile
+) -> bytes:
+    """
+    Генерирует изображение по описанию.
+    """
+    return generate_images([prompt], [seed], profile_name)[0]
+
+
+def prior_embeddings(prompt: str, profile_name: str = default_profile) -> tuple:
+    """
+    Эмбеддинги prior для описания аватара. Описания аватаров повторяются,
+    поэтому результат сохраняется: prior-модель выполняется один раз на описание.
+    Prior и его веса общие для профилей с одинаковым dtype.
+    """
+    key = (prompt, PROFILES[profile_name].dtype)
+    embeddings = prior_cache.get(key)
+    if embeddings is not None:
+        prior_cache.move_to_end(key)
+        return embeddings
+    _, pipe_prior, _ = load_pipelines(profile_name)
+    embeddings = pipe_prior(prompt, return_dict=False)
+    prior_cache[key] = embeddings
+    while len(prior_cache) > prior_cache_size:
+        prior_cache.popitem(last=False)
+    return embeddings
+
+
+def precompute_priors():
+    """Считаем prior-эмбеддинги известных описаний аватаров для всех профилей"""
+    for prompt in avatar_prompts:
+        for profile_name in PROFILES:
+            prior_embeddings(prompt, profile_name)
+    log.info("Prior embeddings precomputed for %d prompts", len(avatar_prompts))
+
+
+def generate_avatar(
+    prompt: str, image_bytes: bytes, profile_name: str = default_profile
+) -> bytes:
+    """
+    Генерирует уникальный аватар по фотографии пользователя.
+    """
+    profile = PROFILES[profile_name]
+    _, _, pipe = load_pipelines(profile_name)
+    set_attention_slicing(pipe, profile)
+    input_image = Image.open(BytesIO(image_bytes))
+    input_image.thumbnail((profile.avatar_size, profile.avatar_size))
+
+    image_emb, zero_image_emb = prior_embeddings(prompt, profile_name)
+
+    image = pipe(
+        prompt,
+        image=input_image,
+        image_embeds=image_emb,
+        negative_image_embeds=zero_image_emb,
+        height=profile.avatar_size,
+        width=profile.avatar_size,
+        num_inference_steps=profile.avatar_schedule_steps,
+        strength=profile.avatar_strength,
+    ).images[0]
+    return to_png(image)
+
+
+def run_job(job: dict, image: bytes | None) -> bytes:
+    """Выполнение задачи из очереди"""
+    match job["kind"]:
+        case "image":
+            return generate_image(job["prompt"], job_seed(job), job_profile(job))
+        case "avatar":
+            if image is None:
+                raise ValueError("Нет исходного изображения для аватара")
+            return generate_avatar(job["prompt"], image, job_profile(job))
+    raise ValueError(f"Неизвестный тип задачи '{job['kind']}'")
@@ -0,0 +1,297 @@
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from config import (
+    default_profile,
+    job_max_attempts,
+    job_ttl,
+    job_wait_timeout,
+    log,
+    redis_db,
+    redis_host,
+    redis_port,
+    user_max_jobs,
+)
+
+QUEUE_KEY = "kandinsky:queue"
+# Задачи, которые воркер забрал из очереди и еще не завершил
+PROCESSING_KEY = "kandinsky:processing"
+DURATION_KEY = "kandinsky:stats:duration"
+# Начальная оценка длительности задачи до первых замеров, секунды
+DEFAULT_DURATION = 60.0
+
+# Проверка ограничения задач пользователя и постановка в очередь одной операцией.
+# KEYS: очередь, задача, входное изображение, счетчик задач пользователя
+# ARGV: лимит, ttl, id задачи, учитывать лимит, есть изображение, изображение, поля задачи
+SUBMIT_SCRIPT = """
+local limit, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+if ARGV[4] == "1" then
+    local active = redis.call("INCR", KEYS[4])
+    redis.call("EXPIRE", KEYS[4], ttl)
+    if active > limit then
+        redis.call("DECR", KEYS[4])
+        return 0
+    end
+end
+redis.call("HSET", KEYS[2], unpack(ARGV, 7))
+redis.call("EXPIRE", KEYS[2], ttl)
+if ARGV[5] == "1" then
+    redis.call("SET", KEYS[3], ARGV[6], "EX", ttl)
+end
+redis.call("LPUSH", KEYS[1], ARGV[3])
+return 1
+"""
+
+
+class JobLimitExceeded(Exception):
+    """У пользователя слишком много задач в очереди и в работе"""
+
+
+class JobQueue:
+    """
+    Очередь задач генерации изображений в Redis.
+    Веб-процессы ставят задачи и отдают результат, воркер выполняет задачи по очереди.
+    Забранная воркером задача до завершения хранится в списке обрабатываемых,
+    после аварийной остановки воркера она возвращается в очередь.
+    """
+
+    def __init__(self, host, port, db):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.connection: Redis | None = None
+
+    async def connect(self):
+        """Создаем соединение с Redis"""
+        connection = Redis(host=self.host, port=self.port, db=self.db)
+        await connection.ping()  # проверяем доступность сервера
+        self.connection = connection
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.aclose()
+            self.connection = None
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        return f"kandinsky:job:{job_id}"
+
+    @staticmethod
+    def input_key(job_id: str) -> str:
+        return f"kandinsky:job:{job_id}:input"
+
+    @staticmethod
+    def result_key(job_id: str) -> str:
+        return f"kandinsky:job:{job_id}:result"
+
+    @staticmethod
+    def done_key(job_id: str) -> str:
+        """Список-уведомление о завершении задачи для ожидающих веб-процессов"""
+        return f"kandinsky:job:{job_id}:done"
+
+    @staticmethod
+    def user_key(user: str) -> str:
+        return f"kandinsky:user:{user}:active"
+
+    async def submit(
+        self,
+        kind: str,
+        prompt: str,
+        user: str = "",
+        image: bytes | None = None,
+        seed: int | None = None,
+        profile: str = default_profile,
+    ) -> dict:
+        """Ставим задачу в очередь с учетом ограничения задач пользователя"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "prompt": prompt,
+            "user": user,
+            "seed": "" if seed is None else seed,
+            "profile": profile,
+            "status": "queued",
+            "created": time.time(),
+        }
+        queued = await self.connection.eval(
+            SUBMIT_SCRIPT,
+            4,
+            QUEUE_KEY,
+            self.job_key(job_id),
+            self.input_key(job_id),
+            self.user_key(user),
+            user_max_jobs,
+            job_ttl,
+            job_id,
+            1 if user else 0,
+            0 if image is None else 1,
+            b"" if image is None else image,
+            *(item for field in job.items() for item in field),
+        )
+        if not queued:
+            raise JobLimitExceeded(
+                f"Превышено количество одновременных задач ({user_max_jobs})"
+            )
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> dict | None:
+        """Состояние задачи с позицией в очереди и оценкой времени готовности"""
+        data = await self.connection.hgetall(self.job_key(job_id))
+        if not data:
+            return None
+        job = {key.decode(): value.decode() for key, value in data.items()}
+        duration = float(await self.connection.get(DURATION_KEY) or DEFAULT_DURATION)
+        job["position"], job["eta"] = None, None
+        if job["status"] == "queued":
+            index = await self.connection.lpos(QUEUE_KEY, job_id)
+            length = await self.connection.llen(QUEUE_KEY)
+            # Задачи забираются с конца списка, позиция 1 - следующая на выполнение
+            job["position"] = length - index if index is not None else 1
+            job["eta"] = round(job["position"] * duration, 1)
+        elif job["status"] == "running":
+            job["position"] = 0
+            elapsed = time.time() - float(job["started"])
+            job["eta"] = round(max(duration - elapsed, 0), 1)
+        return job
+
+    async def result(self, job_id: str) -> bytes | None:
+        return await self.connection.get(self.result_key(job_id))
+
+    async def wait(self, job_id: str) -> dict | None:
+        """
+        Ожидаем завершения задачи по уведомлению воркера вместо опроса состояния.
+        Получивший уведомление возвращает его в список для остальных ожидающих,
+        статус дополнительно перепроверяется раз в job_wait_timeout.
+        """
+        while True:
+            status = await self.connection.hget(self.job_key(job_id), "status")
+            if status is None or status.decode() in ("done", "failed"):
+                return await self.get(job_id)
+            done_key = self.done_key(job_id)
+            if await self.connection.blpop([done_key], timeout=job_wait_timeout):
+                await self.connection.rpush(done_key, 1)
+
+    async def next_job(self, timeout: float = 5) -> tuple[dict, bytes | None] | None:
+        """
+        Забираем следующую задачу из очереди (для воркера).
+        Задача атомарно переносится в список обрабатываемых до вызова finish.
+        """
+        item = await self.connection.blmove(
+            QUEUE_KEY, PROCESSING_KEY, timeout, src="RIGHT", dest="LEFT"
+        )
+        if item is None:
+            return None
+        job_id = item.decode()
+        data = await self.connection.hgetall(self.job_key(job_id))
+        if not data:
+            await self.connection.lrem(PROCESSING_KEY, 0, job_id)
+            return None
+        job = {key.decode(): value.decode() for key, value in data.items()}
+        job["status"], job["started"] = "running", str(time.time())
+        await self.connection.hset(
+            self.job_key(job_id),
+            mapping={"status": job["status"], "started": job["started"]},
+        )
+        image = await self.connection.get(self.input_key(job_id))
+        return job, image
+
+    async def reclaim(self) -> int:
+        """
+        Возвращаем в очередь задачи, оставшиеся в работе после аварийной
+        остановки воркера. Вызывается воркером при запуске, до первой задачи.
+        Задача, на которой воркер падал job_max_attempts раз, завершается ошибкой.
+        """
+        reclaimed = 0
+        for item in await self.connection.lrange(PROCESSING_KEY, 0, -1):
+            job_id = item.decode()
+            data = await self.connection.hgetall(self.job_key(job_id))
+            if not data:
+                await self.connection.lrem(PROCESSING_KEY, 0, job_id)
+                continue
+            job = {key.decode(): value.decode() for key, value in data.items()}
+            attempts = int(job.get("attempts") or 0) + 1
+            if attempts >= job_max_attempts:
+                log.error("Job %s failed after %d attempts", job_id, attempts)
+                await self.finish(job, error="Worker stopped while running the job")
+                continue
+            async with self.connection.pipeline(transaction=True) as pipe:
+                pipe.hset(
+                    self.job_key(job_id),
+                    mapping={"status": "queued", "attempts": attempts},
+                )
+                pipe.lrem(PROCESSING_KEY, 0, job_id)
+                # следующей на выполнение будет прерванная задача
+                pipe.rpush(QUEUE_KEY, job_id)
+                await pipe.execute()
+            reclaimed += 1
+        return reclaimed
+
+    async def cancel(self, job_id: str):
+        """
+        Снимаем задачу, результат которой больше никто не ждет.
+        Задача из очереди удаляется и освобождает место пользователя.
+        Уже забранная воркером задача помечается: воркер пропустит ее,
+        если не начал генерацию, а начатую генерацию пакета прервать нельзя.
+        """
+        data = await self.connection.hgetall(self.job_key(job_id))
+        if not data:
+            return
+        job = {key.decode(): value.decode() for key, value in data.items()}
+        if job["status"] in ("done", "failed"):
+            return
+        if await self.connection.lrem(QUEUE_KEY, 0, job_id):
+            await self.finish(job, error="Job cancelled")
+        else:
+            await self.connection.hset(self.job_key(job_id), "cancelled", 1)
+
+    async def drop_cancelled(self, batch: list) -> list:
+        """Завершаем снятые задачи пакета перед генерацией, возвращаем остальные"""
+        async with self.connection.pipeline(transaction=False) as pipe:
+            for job, _ in batch:
+                pipe.hget(self.job_key(job["id"]), "cancelled")
+            flags = await pipe.execute()
+        active = []
+        for item, cancelled in zip(batch, flags):
+            if cancelled:
+                await self.finish(item[0], error="Job cancelled")
+            else:
+                active.append(item)
+        return active
+
+    async def finish(
+        self, job: dict, result: bytes | None = None, error: str | None = None
+    ):
+        """Сохраняем результат или ошибку задачи и освобождаем место пользователя"""
+        finished = time.time()
+        async with self.connection.pipeline(transaction=True) as pipe:
+            if result is not None:
+                pipe.set(self.result_key(job["id"]), result, ex=job_ttl)
+            pipe.hset(
+                self.job_key(job["id"]),
+                mapping={
+                    "status": "failed" if error else "done",
+                    "finished": finished,
+                    "error": error or "",
+                },
+            )
+            pipe.delete(self.input_key(job["id"]))
+            pipe.lrem(PROCESSING_KEY, 0, job["id"])
+            if job["user"]:
+                pipe.decr(self.user_key(job["user"]))
+            pipe.rpush(self.done_key(job["id"]), 1)
+            pipe.expire(self.done_key(job["id"]), job_ttl)
+            await pipe.execute()
+        if error is None and job.get("started"):
+            await self.update_duration(finished - float(job["started"]))
+
+    async def update_duration(self, duration: float):
+        """Скользящее среднее длительности задачи для оценки времени готовности"""
+        previous = await self.connection.get(DURATION_KEY)
+        average = duration if previous is None else 0.8 * float(previous) + 0.2 * duration
+        await self.connection.set(DURATION_KEY, average)
+
+
+job_queue = JobQueue(host=redis_host, port=redis_port, db=redis_db)
@@ -1,10 +1,23 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from api import router
+from cache import image_cache
+from jobs import job_queue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.connect()
+    image_cache.load()
+    yield
+    await job_queue.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
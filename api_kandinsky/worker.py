@@ -0,0 +1,107 @@
+"""
+Воркер очереди генерации изображений.
+Единственный процесс, который загружает модели Kandinsky и выполняет генерацию.
+Задачи генерации по описанию, поступившие почти одновременно, выполняются
+одним пакетом за один проход модели.
+
+Запуск:
+    python worker.py
+"""
+
+import asyncio
+import time
+
+from config import PROFILES, batch_max_size, batch_max_wait_ms, load_pipelines, log
+from generation import (
+    generate_images,
+    job_profile,
+    job_seed,
+    precompute_priors,
+    run_job,
+)
+from jobs import job_queue
+
+
+async def collect_batch(first: tuple) -> tuple[list, list]:
+    """
+    Собираем в пакет задачи генерации по описанию, поступившие
+    в течение batch_max_wait_ms, но не больше batch_max_size.
+    Задача другого типа или профиля завершает сбор и выполняется следующей.
+    """
+    batch, other = [first], []
+    deadline = time.monotonic() + batch_max_wait_ms / 1000
+    while len(batch) < batch_max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        item = await job_queue.next_job(timeout=remaining)
+        if item is None:
+            break
+        if item[0]["kind"] != "image" or job_profile(item[0]) != job_profile(first[0]):
+            other.append(item)
+            break
+        batch.append(item)
+    return batch, other
+
+
+async def run_batch(batch: list):
+    """Выполнение пакета задач и сохранение результатов"""
+    batch = await job_queue.drop_cancelled(batch)
+    if not batch:
+        return
+    jobs = [job for job, _ in batch]
+    started = time.perf_counter()
+    try:
+        if len(batch) > 1:
+            results = await asyncio.to_thread(
+                generate_images,
+                [job["prompt"] for job in jobs],
+                [job_seed(job) for job in jobs],
+                job_profile(jobs[0]),
+            )
+        else:
+            results = [await asyncio.to_thread(run_job, *batch[0])]
+    except Exception as e:
+        log.error("An exception occurred: %s", str(e))
+        for job in jobs:
+            await job_queue.finish(job, error=str(e))
+        return
+    for job, result in zip(jobs, results):
+        await job_queue.finish(job, result=result)
+    log.info(
+        "Jobs %s (%s) finished in %.1f s",
+        ", ".join(job["id"] for job in jobs),
+        jobs[0]["kind"],
+        time.perf_counter() - started,
+    )
+
+
+async def main():
+    started = time.perf_counter()
+    for profile_name in PROFILES:
+        load_pipelines(profile_name)
+    precompute_priors()
+    log.info("Pipelines loaded in %.1f s", time.perf_counter() - started)
+    await job_queue.connect()
+    reclaimed = await job_queue.reclaim()
+    if reclaimed:
+        log.warning("Requeued %d interrupted jobs", reclaimed)
+    log.info("Kandinsky worker started")
+    pending: list = []
+    try:
+        while True:
+            item = pending.pop(0) if pending else await job_queue.next_job()
+            if item is None:
+                continue
+            if item[0]["kind"] == "image":
+                batch, other = await collect_batch(item)
+                pending.extend(other)
+            else:
+                batch = [item]
+            await run_batch(batch)
+    finally:
+        await job_queue.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,7 @@ from app.api.auth import router as auth_router
 from app.api.users import router as users_router
 from app.api.profiles import router as profile_router
 from app.api.image import router as image_router
+from app.api.metrics import router as metrics_router
 
 from fastapi import APIRouter
 
@@ -13,3 +14,4 @@ router.include_router(auth_router)
 router.include_router(users_router)
 router.include_router(profile_router)
 router.include_router(image_router)
+router.include_router(metrics_router)
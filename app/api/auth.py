@@ -27,7 +27,7 @@ log = logging.getLogger(__name__)
         },
     },
 )
-def login(
+async def login(
     user_in: Annotated[dict, Depends(auth_user_oath2)],
 ) -> Token:
     """
@@ -36,7 +36,7 @@ def login(
     token = create_jwt_token(
         {"sub": user_in.get("username"), "role": user_in.get("role")}
     )
-    token_dict.add_token(token=token, username=str(user_in.get("username")))
+    await token_dict.add_token(token=token, username=str(user_in.get("username")))
     log.info("Login username %s", user_in.get("username"))
     return Token(access_token=token, token_type="bearer")
 
@@ -56,20 +56,20 @@ def login(
         },
     },
 )
-def logout(token: str = Depends(oauth2_scheme)):
+async def logout(token: str = Depends(oauth2_scheme)):
     """
     Выход из авторизации.
     """
-    username = token_dict.del_token(token)
+    username = await token_dict.del_token(token)
     log.info("Logout username %s", username)
     return {"msg": "Successfully logged out"}
 
 
 @router.get("/protected")
-def protected_route(token: str = Depends(oauth2_scheme)):
+async def protected_route(token: str = Depends(oauth2_scheme)):
     """
     Проверка токена на доступ к ресурсу.
     """
-    if not token_dict.get_user_by_token(token):
+    if not await token_dict.get_user_by_token(token):
         raise HTTPException(status_code=403, detail="Token has been blacklisted")
     return {"msg": "Access granted"}
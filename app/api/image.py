@@ -1,22 +1,192 @@
-from typing import Annotated
-from io import BytesIO
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Annotated, Literal
+import anyio
 import httpx
-from fastapi import APIRouter, File, UploadFile, status, Body, Form, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, File, UploadFile, status, Body, Form, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 
 from app.dependencies.dependencies import get_current_user
-from app.core.config import settings
+from app.crud.user import UsersCRUD, users_crud
+from app.core.config import QUALITY_PROFILES, QualityProfile, settings
+from app.core.http_client import upstream
+from app.core.images import ImageRejected, image_processor
+from app.core.store import response_cache
 
 router = APIRouter(prefix="/api/image")
 
-ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+STREAM_CHUNK_SIZE = 64 * 1024
+# Клиент закрыл соединение до ответа (код nginx), ответ никто не получит
+CLIENT_CLOSED_REQUEST = 499
 
 
-def allowed_file(filename: str | None) -> bool:
-    return (
-        filename is not None
-        and "." in filename
-        and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def upstream_error(response: httpx.Response) -> JSONResponse:
+    """
+    Ответ на ошибку сервиса обработки изображений.
+    Отказ из-за перегрузки передается клиенту с тем же кодом и Retry-After,
+    ошибки запроса (например, задача не найдена) - с тем же кодом.
+    """
+    if response.status_code in (
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+    ):
+        retry_after = response.headers.get("retry-after")
+        return JSONResponse(
+            status_code=response.status_code,
+            content={"error": "Сервис обработки изображений перегружен, повторите запрос позже"},
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+    if response.is_client_error:
+        return JSONResponse(
+            status_code=response.status_code,
+            content={"error": f"Ошибка внешнего сервиса ({response.status_code})"},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={
+            "error": f"Ошибка обработки изображения внешним сервисом ({response.status_code})"
+        },
+    )
+
+
+def job_response(response: httpx.Response) -> JSONResponse:
+    """Состояние задачи генерации из ответа сервиса, ошибки - через upstream_error"""
+    if not response.is_success:
+        return upstream_error(response)
+    try:
+        content = response.json()
+    except ValueError:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": "Некорректный ответ сервиса генерации"},
+        )
+    return JSONResponse(status_code=response.status_code, content=content)
+
+
+def quality_profile(current_user: dict, profile: str | None) -> str | None:
+    """
+    Профиль качества генерации с учетом ограничения роли пользователя.
+    Без явного выбора берется профиль по умолчанию, но не дороже допустимого роли.
+    None, если запрошенный профиль роли недоступен.
+    """
+    limit = QUALITY_PROFILES.index(
+        settings.generation.max_profile.get(current_user.get("role", ""), QUALITY_PROFILES[0])
+    )
+    if profile is None:
+        default = QUALITY_PROFILES.index(settings.generation.default_profile)
+        return QUALITY_PROFILES[min(default, limit)]
+    if QUALITY_PROFILES.index(profile) > limit:
+        return None
+    return profile
+
+
+def profile_forbidden(profile: str | None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_403_FORBIDDEN,
+        content={"error": f"Профиль качества '{profile}' недоступен"},
+    )
+
+
+async def cached_analysis(endpoint: str, file: UploadFile) -> Response:
+    """
+    Анализ изображения сервисом DeepFace с кэшированием ответа.
+    Ключ строится по исходному содержимому файла, поэтому при попадании
+    в кэш изображение не пережимается и не отправляется сервису.
+    """
+    contents = await image_processor.read(file)
+    key = response_cache.key(
+        endpoint,
+        contents,
+        **settings.image.model_dump(include={"reencode", "max_edge", "format", "quality"}),
+    )
+
+    async def fetch() -> httpx.Response:
+        filename, image_bytes = await image_processor.encode(str(file.filename), contents)
+        return await upstream.client.post(
+            f"{settings.api.deepface_url}/{endpoint}",
+            files={"file": (filename, image_bytes)},
+            timeout=upstream.deepface_timeout,
+        )
+
+    try:
+        response = await response_cache.fetch(key, fetch)
+        if response.status_code != 200:
+            return upstream_error(response)
+
+        return Response(content=response.content, media_type="application/json")
+    except ImageRejected:
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)},
+        )
+
+
+async def wait_disconnect(client_request: Request) -> None:
+    """Ждем отключения клиента, тело запроса к этому моменту уже прочитано"""
+    while (await client_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_until_disconnect(
+    request: httpx.Request, client_request: Request
+) -> httpx.Response | None:
+    """
+    Отправляем запрос сервису, пока клиент на связи.
+    Сервис генерации отвечает только после окончания генерации, поэтому
+    отключение клиента отслеживается параллельно: запрос к сервису
+    отменяется, соединение закрывается, и сервис снимает задачу.
+    Если клиент отключился, возвращается None.
+    """
+    send = asyncio.ensure_future(upstream.client.send(request, stream=True))
+    disconnect = asyncio.ensure_future(wait_disconnect(client_request))
+    try:
+        await asyncio.wait({send, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not send.done():
+            send.cancel()
+            await asyncio.wait({send})
+    if send.cancelled():
+        return None
+    return send.result()
+
+
+async def proxy_stream(request: httpx.Request, client_request: Request) -> Response:
+    """
+    Передает клиенту ответ сервиса по частям, по мере их получения.
+    Следующая часть читается только после отправки предыдущей, поэтому
+    в памяти держится не больше одной части. При отключении клиента
+    (и во время генерации, и во время передачи) соединение с сервисом
+    закрывается и генерация прерывается.
+    """
+    try:
+        response = await send_until_disconnect(request, client_request)
+    except httpx.HTTPError as e:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)},
+        )
+    if response is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    if response.status_code != status.HTTP_200_OK:
+        await response.aclose()
+        return upstream_error(response)
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await response.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=response.headers.get("content-type", "image/png"),
+        background=BackgroundTask(response.aclose),
     )
 
 
@@ -46,29 +216,59 @@ async def recognize_face(file: UploadFile = File(...)):
     """
     Определяет возраст, пол и эмоцию лица на изображении.
     """
-    if not allowed_file(file.filename):
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={
-                "error": f"Неверное расширение файла '{file.filename}'. "
-                f"Допустимые расширения {list(ALLOWED_EXTENSIONS)}"
+    return await cached_analysis("recognize-face", file)
+
+
+@router.post(
+    "/compare-faces",
+    status_code=status.HTTP_200_OK,
+    summary="Compare Faces",
+    tags=["DeepFace"],
+    dependencies=[Depends(get_current_user)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Compare Faces",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "verified": True,
+                        "distance": 0.516673,
+                    }
+                }
             },
-        )
+        }
+    },
+)
+async def compare_faces(
+    file1: UploadFile = File(...),
+    file2: UploadFile = File(...),
+    model_name: Annotated[
+        str,
+        Body(
+            ...,
+            description="Model for face recognition. Options: VGG-Face, Facenet, Facenet512, DeepFace, ArcFace",
+        ),
+    ] = "VGG-Face",
+):
+    """
+    Сравнивает два загруженных изображения на предмет схожести лиц.
+    """
+
+    filename1, image_bytes1 = await image_processor.prepare(file1)
+    filename2, image_bytes2 = await image_processor.prepare(file2)
     try:
-        image_bytes = await file.read()
-        async with httpx.AsyncClient() as client:  # Используем асинхронный клиент httpx
-            response = await client.post(
-                f"http://{settings.api.deepface_host}:{settings.api.deepface_port}/recognize-face",
-                files={"file": (file.filename, image_bytes)},
-                timeout=None,
-            )
+        response = await upstream.client.post(
+            f"{settings.api.deepface_url}/compare-faces",
+            files={
+                "file1": (filename1, image_bytes1),
+                "file2": (filename2, image_bytes2),
+            },
+            params={"model_name": model_name},
+            timeout=upstream.deepface_timeout,
+        )
+
         if response.status_code != 200:
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "error": f"Ошибка обработки изображения внешним сервисом ({response.status_code})"
-                },
-            )
+            return upstream_error(response)
 
         return response.json()
     except Exception as e:
@@ -79,28 +279,31 @@ async def recognize_face(file: UploadFile = File(...)):
 
 
 @router.post(
-    "/compare-faces",
+    "/compare-faces/batch",
     status_code=status.HTTP_200_OK,
-    summary="Compare Faces",
+    summary="Compare Faces Batch",
     tags=["DeepFace"],
     dependencies=[Depends(get_current_user)],
     responses={
         status.HTTP_200_OK: {
-            "description": "Compare Faces",
+            "description": "Compare one probe with many candidates",
             "content": {
                 "application/json": {
                     "example": {
-                        "verified": True,
-                        "distance": 0.516673,
+                        "results": [
+                            {"index": 1, "filename": "b.jpg", "verified": True, "distance": 0.21},
+                            {"index": 0, "filename": "a.jpg", "verified": False, "distance": 0.83},
+                        ],
+                        "errors": [],
                     }
                 }
             },
         }
     },
 )
-async def compare_faces(
-    file1: UploadFile = File(...),
-    file2: UploadFile = File(...),
+async def compare_faces_batch(
+    probe: UploadFile = File(...),
+    candidates: list[UploadFile] = File(...),
     model_name: Annotated[
         str,
         Body(
@@ -110,38 +313,29 @@ async def compare_faces(
     ] = "VGG-Face",
 ):
     """
-    Сравнивает два загруженных изображения на предмет схожести лиц.
+    Сравнивает лицо на эталонном изображении с лицами на изображениях-кандидатах.
     """
 
-    if not allowed_file(file1.filename) and not allowed_file(file2.filename):
+    if len(candidates) > settings.api.compare_batch_max:
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={
-                "error": f"Неверное расширение файлов '{file1.filename}' или '{file2.filename}'. "
-                f"Допустимые расширения {list(ALLOWED_EXTENSIONS)}"
+                "error": f"Не больше {settings.api.compare_batch_max} изображений для сравнения"
             },
         )
+    files = [("probe", await image_processor.prepare(probe))]
+    for file in candidates:
+        files.append(("candidates", await image_processor.prepare(file)))
     try:
-        image_bytes1 = await file1.read()
-        image_bytes2 = await file2.read()
-        async with httpx.AsyncClient() as client:  # Используем асинхронный клиент httpx
-            response = await client.post(
-                f"http://{settings.api.deepface_host}:{settings.api.deepface_port}/compare-faces",
-                files={
-                    "file1": (file1.filename, image_bytes1),
-                    "file2": (file2.filename, image_bytes2),
-                },
-                params={"model_name": model_name},
-                timeout=None,
-            )
+        response = await upstream.client.post(
+            f"{settings.api.deepface_url}/compare-faces/batch",
+            files=files,
+            params={"model_name": model_name},
+            timeout=upstream.deepface_timeout,
+        )
 
         if response.status_code != 200:
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "error": f"Ошибка обработки изображения внешним сервисом ({response.status_code})"
-                },
-            )
+            return upstream_error(response)
 
         return response.json()
     except Exception as e:
@@ -152,46 +346,75 @@ async def compare_faces(
 
 
 @router.post(
-    "/count-people",
+    "/gallery",
     status_code=status.HTTP_200_OK,
-    summary="Count people",
+    summary="Enrol Face",
     tags=["DeepFace"],
-    dependencies=[Depends(get_current_user)],
     responses={
         status.HTTP_200_OK: {
-            "description": "Count people",
-            "content": {"application/json": {"example": {"count people": 2}}},
+            "description": "Face added to the gallery",
+            "content": {
+                "application/json": {"example": {"user_id": 1, "faces": 2, "size": 100000}}
+            },
         }
     },
 )
-async def count_people(file: UploadFile = File(...)):
+async def enrol_face(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    crud: Annotated[UsersCRUD, Depends(users_crud)],
+    file: UploadFile = File(...),
+):
     """
-    Определяет количество лиц на изображении.
+    Добавляет лицо текущего пользователя в галерею для идентификации.
     """
 
-    if not allowed_file(file.filename):
+    filename, image_bytes = await image_processor.prepare(file)
+    try:
+        user_id = await crud.get_id_by_name(current_user["username"])
+        response = await upstream.client.post(
+            f"{settings.api.deepface_url}/gallery/{user_id}",
+            files={"file": (filename, image_bytes)},
+            timeout=upstream.deepface_timeout,
+        )
+        if response.status_code != 200:
+            return upstream_error(response)
+
+        return response.json()
+    except Exception as e:
         return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={
-                "error": f"Неверное расширение файла '{file.filename}'. "
-                f"Допустимые расширения {list(ALLOWED_EXTENSIONS)}"
-            },
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)},
         )
+
+
+@router.delete(
+    "/gallery",
+    status_code=status.HTTP_200_OK,
+    summary="Remove Faces",
+    tags=["DeepFace"],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Faces removed from the gallery",
+            "content": {"application/json": {"example": {"user_id": 1, "removed": 2}}},
+        }
+    },
+)
+async def remove_faces(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    crud: Annotated[UsersCRUD, Depends(users_crud)],
+):
+    """
+    Удаляет все лица текущего пользователя из галереи.
+    """
+
     try:
-        image_bytes = await file.read()
-        async with httpx.AsyncClient() as client:  # Используем асинхронный клиент httpx
-            response = await client.post(
-                f"http://{settings.api.deepface_host}:{settings.api.deepface_port}/count-people",
-                files={"file": (file.filename, image_bytes)},
-                timeout=None,
-            )
+        user_id = await crud.get_id_by_name(current_user["username"])
+        response = await upstream.client.delete(
+            f"{settings.api.deepface_url}/gallery/{user_id}",
+            timeout=upstream.deepface_timeout,
+        )
         if response.status_code != 200:
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "error": f"Ошибка обработки изображения внешним сервисом ({response.status_code})"
-                },
-            )
+            return upstream_error(response)
 
         return response.json()
     except Exception as e:
@@ -202,92 +425,271 @@ async def count_people(file: UploadFile = File(...)):
 
 
 @router.post(
-    "/generate_image",
+    "/identify",
     status_code=status.HTTP_200_OK,
-    summary="Generate image",
-    tags=["Kandinsky"],
+    summary="Identify Face",
+    tags=["DeepFace"],
     dependencies=[Depends(get_current_user)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Closest users from the gallery",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "matches": [
+                            {"user_id": 1, "username": "user", "distance": 0.18, "verified": True},
+                        ]
+                    }
+                }
+            },
+        }
+    },
 )
-async def generate_image(prompt: str = Form(..., max_length=60)):
+async def identify(
+    crud: Annotated[UsersCRUD, Depends(users_crud)],
+    file: UploadFile = File(...),
+    k: Annotated[int, Query(ge=1, le=100)] = 5,
+):
     """
-    Генерирует изображение по описанию.
+    Находит в галерее пользователей, наиболее похожих на лицо на изображении.
     """
 
+    filename, image_bytes = await image_processor.prepare(file)
     try:
-        buffer = BytesIO()
-        with httpx.stream(
-            "POST",
-            f"http://{settings.api.kandinsky_host}:{settings.api.kandinsky_port}/generate_image",
-            data={"prompt": prompt},
-            timeout=None,
-        ) as response:
-            response.raise_for_status()
-            for chunk in response.iter_bytes():
-                if chunk:
-                    buffer.write(chunk)
-            buffer.seek(0)
-            return StreamingResponse(buffer, media_type="image/png")
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR:
-            return JSONResponse(
-                status_code=e.response.status_code,
-                content={
-                    "error": f"Ошибка обработки изображения внешним сервисом ({e.response.status_code})"
-                },
-            )
+        response = await upstream.client.post(
+            f"{settings.api.deepface_url}/identify",
+            files={"file": (filename, image_bytes)},
+            params={"k": k},
+            timeout=upstream.deepface_timeout,
+        )
+        if response.status_code != 200:
+            return upstream_error(response)
+
+        matches = response.json()["matches"]
+        usernames = await crud.get_names_by_ids([match["user_id"] for match in matches])
+        return {
+            "matches": [
+                {**match, "username": usernames[match["user_id"]]}
+                for match in matches
+                if match["user_id"] in usernames
+            ]
+        }
+    except Exception as e:
         return JSONResponse(
-            status_code=e.response.status_code,
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"error": str(e)},
         )
 
 
+@router.post(
+    "/count-people",
+    status_code=status.HTTP_200_OK,
+    summary="Count people",
+    tags=["DeepFace"],
+    dependencies=[Depends(get_current_user)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Count people",
+            "content": {"application/json": {"example": {"count people": 2}}},
+        }
+    },
+)
+async def count_people(file: UploadFile = File(...)):
+    """
+    Определяет количество лиц на изображении.
+    """
+
+    return await cached_analysis("count-people", file)
+
+
+@router.post(
+    "/generate_image",
+    status_code=status.HTTP_200_OK,
+    summary="Generate image",
+    tags=["Kandinsky"],
+)
+async def generate_image(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    client_request: Request,
+    prompt: str = Form(..., max_length=60),
+    seed: int | None = Form(None, ge=0, lt=2**63),
+    profile: QualityProfile | None = Form(None),
+):
+    """
+    Генерирует изображение по описанию.
+    С одинаковыми описанием, seed и профилем возвращается одно и то же изображение.
+    """
+
+    quality = quality_profile(current_user, profile)
+    if quality is None:
+        return profile_forbidden(profile)
+    data = {"prompt": prompt, "user": current_user.get("username"), "profile": quality}
+    if seed is not None:
+        data["seed"] = str(seed)
+    request = upstream.client.build_request(
+        "POST",
+        f"{settings.api.kandinsky_url}/generate_image",
+        data=data,
+        timeout=upstream.kandinsky_timeout,
+    )
+    return await proxy_stream(request, client_request)
+
+
 @router.post(
     "/generate_avatar",
     status_code=status.HTTP_200_OK,
     summary="Generate avatar",
     tags=["Kandinsky"],
-    dependencies=[Depends(get_current_user)],
 )
-async def generate_avatar(file: UploadFile = File(...)):
+async def generate_avatar(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    client_request: Request,
+    file: UploadFile = File(...),
+    profile: QualityProfile | None = Form(None),
+):
     """
     Генерирует уникальный аватар по фотографии пользователя и возвращает результат в виде потока байтов.
     """
 
-    if not allowed_file(file.filename):
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={
-                "error": f"Неверное расширение файла '{file.filename}'. "
-                f"Допустимые расширения {list(ALLOWED_EXTENSIONS)}"
-            },
-        )
+    quality = quality_profile(current_user, profile)
+    if quality is None:
+        return profile_forbidden(profile)
+    filename, image_bytes = await image_processor.prepare(file)
 
     prompt = "стиль анимации, уникальный, добрый"
-    try:
-        image_bytes = await file.read()
-        buffer = BytesIO()
-        with httpx.stream(
-            "POST",
-            f"http://{settings.api.kandinsky_host}:{settings.api.kandinsky_port}/generate_avatar",
-            files={"file": (file.filename, image_bytes)},
-            data={"prompt": prompt},
-            timeout=None,
-        ) as response:
-            response.raise_for_status()
-            for chunk in response.iter_bytes():
-                if chunk:
-                    buffer.write(chunk)
-            buffer.seek(0)
-            return StreamingResponse(buffer, media_type="image/png")
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR:
+    request = upstream.client.build_request(
+        "POST",
+        f"{settings.api.kandinsky_url}/generate_avatar",
+        files={"file": (filename, image_bytes)},
+        data={
+            "prompt": prompt,
+            "user": current_user.get("username"),
+            "profile": quality,
+        },
+        timeout=upstream.kandinsky_timeout,
+    )
+    return await proxy_stream(request, client_request)
+
+
+@router.post(
+    "/jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit generation job",
+    tags=["Kandinsky"],
+    responses={
+        status.HTTP_202_ACCEPTED: {
+            "description": "Job queued",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "id": "0f8fad5bd9cb469fa16570867728950e",
+                        "kind": "image",
+                        "status": "queued",
+                        "position": 3,
+                        "eta": 180.0,
+                        "error": None,
+                    }
+                }
+            },
+        },
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Too many jobs"},
+    },
+)
+async def create_job(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    kind: Literal["image", "avatar"] = Form(...),
+    prompt: str = Form(..., max_length=60),
+    file: UploadFile | None = File(None),
+    seed: int | None = Form(None, ge=0, lt=2**63),
+    profile: QualityProfile | None = Form(None),
+):
+    """
+    Ставит задачу генерации изображения (image) или аватара (avatar) в очередь.
+    С заданным seed генерация по описанию воспроизводима.
+    Состояние задачи доступно по /api/image/jobs/{id}, результат - по /api/image/jobs/{id}/result.
+    """
+
+    quality = quality_profile(current_user, profile)
+    if quality is None:
+        return profile_forbidden(profile)
+    files = None
+    if kind == "avatar":
+        if file is None:
             return JSONResponse(
-                status_code=e.response.status_code,
-                content={
-                    "error": f"Ошибка обработки изображения внешним сервисом ({e.response.status_code})"
-                },
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"error": "Для аватара требуется изображение"},
             )
+        files = {"file": await image_processor.prepare(file)}
+    data = {
+        "kind": kind,
+        "prompt": prompt,
+        "user": current_user.get("username"),
+        "profile": quality,
+    }
+    if seed is not None:
+        data["seed"] = str(seed)
+    try:
+        response = await upstream.client.post(
+            f"{settings.api.kandinsky_url}/jobs",
+            data=data,
+            files=files,
+            timeout=upstream.jobs_timeout,
+        )
+    except httpx.HTTPError as e:
         return JSONResponse(
-            status_code=e.response.status_code,
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"error": str(e)},
         )
+    return job_response(response)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Get generation job",
+    tags=["Kandinsky"],
+)
+async def get_job(
+    job_id: str,
+    current_user: Annotated[dict, Depends(get_current_user)],
+):
+    """
+    Состояние задачи генерации, позиция в очереди и оценка времени готовности в секундах.
+    """
+
+    try:
+        response = await upstream.client.get(
+            f"{settings.api.kandinsky_url}/jobs/{job_id}",
+            params={"user": current_user.get("username")},
+            timeout=upstream.jobs_timeout,
+        )
+    except httpx.HTTPError as e:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)},
+        )
+    return job_response(response)
+
+
+@router.get(
+    "/jobs/{job_id}/result",
+    status_code=status.HTTP_200_OK,
+    summary="Get generation job result",
+    tags=["Kandinsky"],
+)
+async def get_job_result(
+    job_id: str,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    client_request: Request,
+):
+    """
+    Возвращает изображение выполненной задачи генерации.
+    """
+
+    request = upstream.client.build_request(
+        "GET",
+        f"{settings.api.kandinsky_url}/jobs/{job_id}/result",
+        params={"user": current_user.get("username")},
+        timeout=upstream.kandinsky_timeout,
+    )
+    return await proxy_stream(request, client_request)
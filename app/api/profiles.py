@@ -1,11 +1,15 @@
 from typing import Annotated
-from fastapi import APIRouter, Body, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Body, status, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from sqlalchemy.exc import NoResultFound, InterfaceError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from app.core.config import settings
+from app.crud.base_crud import export_ndjson, get_session_maker
 from app.crud.profile import ProfileCRUD, profile_crud
 from app.core.schemas.profile import Profile, default_profile
+from app.core.store import user_cache
 from app.dependencies.dependencies import get_current_user, get_current_admin
 
 router = APIRouter(tags=["Profile"], prefix="/api/users")
@@ -41,9 +45,13 @@ async def my_profile(
 ):
     """
     Этот маршрут защищен и требует токен. Если токен действителен, мы возвращаем профиль пользователя.
+    Ответ кэшируется в Redis до изменения профиля или удаления пользователя.
     """
+    username = current_user["username"]
     try:
-        profile = await crud.get_by_name(current_user.get("username"))
+        profile = await user_cache.fetch(
+            "profile", username, lambda: crud.get_by_name(username)
+        )
     except NoResultFound:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND, content={"detail": "User not found"}
@@ -113,22 +121,55 @@ async def update_my_profile(
     "/profiles",
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(get_current_admin)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Page of profiles",
+            "content": {"application/json": {"example": {"items": [], "next_after": None}}},
+        },
+    },
 )
 async def all_profiles(
     crud: Annotated[ProfileCRUD, Depends(profile_crud)],
+    after: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=settings.api.page_max)] = settings.api.page_size,
 ):
     """
     Этот маршрут защищен и требует токен администратора. Если токен действителен, мы возвращаем профили всех пользователей.
+    Список постраничный: следующая страница запрашивается с after=next_after.
     """
     try:
-        users = await crud.get()
-    except NoResultFound:
-        return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND, content={"detail": "User not found"}
-        )
+        items = await crud.get(after=after, limit=limit)
     except InterfaceError:
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": "Server Error"},
         )
-    return users
+    return {
+        "items": items,
+        "next_after": items[-1]["id"] if len(items) == limit else None,
+    }
+
+
+@router.get(
+    "/profiles/export",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_admin)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "All profiles, one JSON object per line",
+            "content": {"application/x-ndjson": {}},
+        },
+    },
+)
+async def export_profiles(
+    session_maker: Annotated[async_sessionmaker, Depends(get_session_maker)],
+    after: Annotated[int, Query(ge=0)] = 0,
+):
+    """
+    Выгрузка всех профилей в формате NDJSON.
+    Строки передаются по мере чтения из серверного курсора, память не зависит от размера таблицы.
+    """
+    return StreamingResponse(
+        export_ndjson(session_maker, ProfileCRUD, after),
+        media_type="application/x-ndjson",
+    )
@@ -15,6 +15,9 @@ def root():
         "/protected": {
             "GET": "Проверка токена на доступ к ресурсу"
         },
+        "/metrics": {
+            "GET": "Метрики приложения в формате Prometheus"
+        },
         "/api/users": {
             "GET": "Информация о всех пользователях",
             "POST": "Создание нового пользователя"
@@ -37,6 +40,16 @@ def root():
         "api/images/compare-faces": {
             "POST": "Сравнивает два загруженных изображения на предмет схожести лиц"
         },
+        "api/images/compare-faces/batch": {
+            "POST": "Сравнивает лицо на эталонном изображении с лицами на изображениях-кандидатах"
+        },
+        "api/images/gallery": {
+            "POST": "Добавляет лицо текущего пользователя в галерею",
+            "DELETE": "Удаляет лица текущего пользователя из галереи"
+        },
+        "api/images/identify": {
+            "POST": "Находит в галерее пользователей, похожих на лицо на изображении"
+        },
         "api/images/count-people": {
             "POST": "Определяет количество лиц на изображении"
         },
@@ -46,4 +59,13 @@ def root():
         "api/images/generate_avatar": {
             "POST": "Генерирует уникальный аватар по фотографии пользователя"
         },
+        "api/images/jobs": {
+            "POST": "Ставит задачу генерации изображения или аватара в очередь"
+        },
+        "api/images/jobs/{id}": {
+            "GET": "Состояние задачи генерации и оценка времени готовности"
+        },
+        "api/images/jobs/{id}/result": {
+            "GET": "Результат задачи генерации"
+        },
     }
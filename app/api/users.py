@@ -1,10 +1,13 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Body, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Body, status, Depends, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from sqlalchemy.exc import NoResultFound, InterfaceError, IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from app.core.config import settings
+from app.crud.base_crud import export_ndjson, get_session_maker
 from app.crud.user import UsersCRUD, users_crud
 from app.crud.profile import ProfileCRUD, profile_crud
 from app.core.schemas.user import User as UserSchema, default_user
@@ -12,9 +15,9 @@ from app.core.schemas.profile import Profile, default_profile
 from app.dependencies.dependencies import (
     get_current_user,
     get_current_admin,
-    oauth2_scheme,
 )
-from app.core.store import token_dict
+from app.core.store import token_dict, user_cache
+from app.core.user_import import IMPORT_MEDIA_TYPES, user_importer
 
 router = APIRouter(tags=["Users"], prefix="/api/users")
 
@@ -46,7 +49,6 @@ router = APIRouter(tags=["Users"], prefix="/api/users")
 )
 async def set_user(
     crud_user: Annotated[UsersCRUD, Depends(users_crud)],
-    crud_profile: Annotated[ProfileCRUD, Depends(profile_crud)],
     user_in: Annotated[UserSchema, Body()] = default_user,
     profile_in: Annotated[Profile, Body()] = default_profile,
 ):
@@ -54,8 +56,7 @@ async def set_user(
     Создание нового пользователя
     """
     try:
-        user = await crud_user.create(user_in)
-        profile = await crud_profile.create(user_in.username, profile_in)
+        user, profile = await crud_user.create_with_profile(user_in, profile_in)
     except InterfaceError:
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -102,9 +103,11 @@ async def about_me(
 ):
     """
     Этот маршрут защищен и требует токен. Если токен действителен, мы возвращаем информацию о пользователе.
+    Ответ кэшируется в Redis до изменения или удаления пользователя.
     """
+    username = current_user["username"]
     try:
-        user = await crud.get_by_name(current_user.get("username"))
+        user = await user_cache.fetch("me", username, lambda: crud.get_by_name(username))
     except NoResultFound:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND, content={"detail": "User not found"}
@@ -200,7 +203,6 @@ async def update_user_info(
     },
 )
 async def del_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
     current_user: Annotated[dict, Depends(get_current_user)],
     crud_user: Annotated[UsersCRUD, Depends(users_crud)],
     crud_profile: Annotated[ProfileCRUD, Depends(profile_crud)],
@@ -208,10 +210,11 @@ async def del_user(
     """
     Этот маршрут защищен и требует токен. Если токен действителен, мы можем удалить пользователя.
     """
+    username = current_user["username"]
     try:
-        user = (await crud_user.get_by_name(current_user.get("username"))).model_dump()
-        await crud_profile.delete(current_user.get("username"))
-        token_dict.del_token(token)
+        user = (await crud_user.get_by_name(username)).model_dump()
+        await crud_profile.delete(username)
+        await token_dict.revoke_user_tokens(username)
     except NoResultFound:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND, content={"detail": "User not found"}
@@ -233,23 +236,117 @@ async def del_user(
     "/",
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(get_current_admin)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Page of users",
+            "content": {"application/json": {"example": {"items": [], "next_after": None}}},
+        },
+    },
 )
 async def all_users(
     crud: Annotated[UsersCRUD, Depends(users_crud)],
+    after: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=settings.api.page_max)] = settings.api.page_size,
 ):
     """
     Этот маршрут защищен и требует токен администратора.
     Если токен действителен, мы возвращаем информацию о всех пользователях.
+    Список постраничный: следующая страница запрашивается с after=next_after.
     """
     try:
-        users = await crud.get()
-    except NoResultFound:
+        items = await crud.get(after=after, limit=limit)
+    except InterfaceError:
         return JSONResponse(
-            status_code=status.HTTP_404_NOT_FOUND, content={"detail": "User not found"}
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Server Error"},
+        )
+    return {
+        "items": items,
+        "next_after": items[-1]["id"] if len(items) == limit else None,
+    }
+
+
+@router.post(
+    "/import",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_admin)],
+    openapi_extra={
+        "requestBody": {
+            "content": {media_type: {} for media_type in IMPORT_MEDIA_TYPES},
+            "required": True,
+        }
+    },
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Import report",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "created": 2,
+                        "failed": 1,
+                        "errors": [{"line": 3, "detail": "User already exists"}],
+                    }
+                }
+            },
+        },
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE: {
+            "detail": f"Supported media types: {', '.join(IMPORT_MEDIA_TYPES)}",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "detail": "Server Error",
+        },
+    },
+)
+async def import_users(
+    request: Request,
+    session_maker: Annotated[async_sessionmaker, Depends(get_session_maker)],
+):
+    """
+    Массовое создание пользователей из CSV (первая строка - заголовок) или NDJSON.
+    Поля: username, email, password или готовый bcrypt-хэш password_hash,
+    необязательный профиль first_name, last_name, phone.
+    Тело читается потоком, строки с ошибками пропускаются и перечисляются в отчете.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in IMPORT_MEDIA_TYPES:
+        return JSONResponse(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            content={"detail": f"Supported media types: {', '.join(IMPORT_MEDIA_TYPES)}"},
+        )
+    try:
+        return await user_importer.run(
+            request.stream(),
+            media_type,
+            session_maker,
+            max_errors=settings.user_import.max_errors,
         )
     except InterfaceError:
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": "Server Error"},
         )
-    return users
+
+
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_admin)],
+    responses={
+        status.HTTP_200_OK: {
+            "description": "All users, one JSON object per line",
+            "content": {"application/x-ndjson": {}},
+        },
+    },
+)
+async def export_users(
+    session_maker: Annotated[async_sessionmaker, Depends(get_session_maker)],
+    after: Annotated[int, Query(ge=0)] = 0,
+):
+    """
+    Выгрузка всех пользователей в формате NDJSON.
+    Строки передаются по мере чтения из серверного курсора, память не зависит от размера таблицы.
+    """
+    return StreamingResponse(
+        export_ndjson(session_maker, UsersCRUD, after),
+        media_type="application/x-ndjson",
+    )
@@ -6,7 +6,6 @@ import uuid
 from app.api import router
 from app.core.models.base import async_session
 from app.core.models.user import RoleEnum
-from app.core.security import verify_password
 from app.core.models import (
     User,
     Profile,
@@ -39,17 +38,9 @@ class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         form = await request.form()
         username, password = form["username"], form["password"]
-        is_pass_ok = False
-        is_role_ok = False
         async with async_session() as session:
-            crud = UsersCRUD(session)
-            user = await crud.get_by_name(username)
-            if user:
-                role = await crud.get_role_by_name(username)
-                hash_pw = await crud.get_hash_by_name(username)
-                is_pass_ok = verify_password(password, hash_pw)
-                is_role_ok = role == RoleEnum.admins
-        if not (is_pass_ok and is_role_ok):
+            user = await UsersCRUD(session).authenticate(str(username), str(password))
+        if not (user and user.get("role") == RoleEnum.admins):
             return False
         # And update session
         request.session.update({"token": str(uuid.uuid4())})
@@ -0,0 +1,82 @@
+import json
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+class TokenCache:
+    """
+    LRU-кэш проверенных токенов текущего воркера.
+    Запись живет не дольше срока действия JWT и не дольше ttl секунд,
+    поэтому даже пропущенное сообщение об отзыве токена
+    перестает действовать за ограниченное время.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.hits = registry.counter(
+            "token_cache_hits_total", "Количество найденных в кэше токенов"
+        )
+        self.misses = registry.counter(
+            "token_cache_misses_total", "Количество токенов, не найденных в кэше"
+        )
+        self.invalidations = registry.counter(
+            "token_cache_invalidations_total",
+            "Количество токенов, удаленных из кэша при отзыве",
+        )
+        self.invalidation_latency = registry.histogram(
+            "token_cache_invalidation_latency_seconds",
+            "Задержка между отзывом токена и его удалением из кэша воркера",
+        )
+        registry.gauge(
+            "token_cache_size",
+            "Количество токенов в кэше",
+            callback=lambda: len(self.items),
+        )
+
+    def get(self, token: str) -> dict | None:
+        item = self.items.get(token)
+        if item is None or item[0] <= time.time():
+            if item is not None:
+                del self.items[token]
+            self.misses.inc()
+            return None
+        self.items.move_to_end(token)
+        self.hits.inc()
+        return item[1]
+
+    def put(self, token: str, value: dict, expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        self.items[token] = (min(expires_at, time.time() + self.ttl), value)
+        self.items.move_to_end(token)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def invalidate(self, *tokens: str) -> None:
+        for token in tokens:
+            if self.items.pop(token, None) is not None:
+                self.invalidations.inc()
+
+    def clear(self) -> None:
+        self.items.clear()
+
+    @staticmethod
+    def revoke_message(*tokens: str) -> str:
+        """Сообщение об отзыве токенов для рассылки воркерам"""
+        return json.dumps({"tokens": tokens, "published": time.time()})
+
+    def handle_revoke_message(self, data: bytes | str) -> None:
+        """Удаляем из кэша токены, отозванные в любом из воркеров"""
+        message = json.loads(data)
+        self.invalidate(*message["tokens"])
+        self.invalidation_latency.observe(max(time.time() - message["published"], 0))
+
+
+token_cache = TokenCache(
+    max_size=settings.token_cache.max_size, ttl=settings.token_cache.ttl
+)
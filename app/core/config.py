@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Literal, get_args
 
 from dotenv import load_dotenv
 from pydantic import PostgresDsn, Field
@@ -13,6 +14,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SQLA_PG_ASYNC_ENGINE = "asyncpg"
 
+# Профили качества генерации Kandinsky по возрастанию стоимости
+QualityProfile = Literal["draft", "standard", "high"]
+QUALITY_PROFILES: tuple[str, ...] = get_args(QualityProfile)
+
 
 class ConfigBase(BaseSettings):
     model_config = SettingsConfigDict(
@@ -30,6 +35,13 @@ class RedisConfig(ConfigBase):
     host: str
     port: int
 
+    socket_timeout: float = 3
+    max_connections: int = 50
+    health_check_interval: int = 30
+    retries: int = 3
+    backoff_base: float = 0.05
+    backoff_cap: float = 1.0
+
 
 class ApiConfig(ConfigBase):
     """
@@ -42,6 +54,36 @@ class ApiConfig(ConfigBase):
     kandinsky_port: int
     deepface_host: str
     deepface_port: int
+    # Максимальное количество кандидатов в пакетном сравнении лиц
+    compare_batch_max: int = 32
+    # Размер страницы административных списков по умолчанию и максимальный
+    page_size: int = 100
+    page_max: int = 1000
+
+    @property
+    def kandinsky_url(self) -> str:
+        return f"http://{self.kandinsky_host}:{self.kandinsky_port}"
+
+    @property
+    def deepface_url(self) -> str:
+        return f"http://{self.deepface_host}:{self.deepface_port}"
+
+
+class HttpConfig(ConfigBase):
+    """
+    Setting for the shared HTTP client of the image services
+    """
+
+    model_config = SettingsConfigDict(env_prefix="http_")
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60
+    connect_timeout: float = 5
+    write_timeout: float = 30
+    pool_timeout: float = 10
+    deepface_timeout: float = 120
+    kandinsky_timeout: float = 1800
+    jobs_timeout: float = 30
 
 
 class AdminConfig(ConfigBase):
@@ -54,6 +96,95 @@ class AdminConfig(ConfigBase):
     password: str
 
 
+class TokenCacheConfig(ConfigBase):
+    """
+    Setting for the in-process cache of validated tokens
+    """
+
+    model_config = SettingsConfigDict(env_prefix="token_cache_")
+    max_size: int = 10000
+    ttl: int = 60
+    channel: str = "tokens:revoked"
+
+
+class HasherConfig(ConfigBase):
+    """
+    Setting for the password hashing pool
+    """
+
+    model_config = SettingsConfigDict(env_prefix="hasher_")
+    workers: int = 4
+    max_queue: int = 64
+    use_processes: bool = False
+    retry_after: int = 1
+
+
+class UserImportConfig(ConfigBase):
+    """
+    Setting for the bulk user import
+    """
+
+    model_config = SettingsConfigDict(env_prefix="user_import_")
+    batch_size: int = 500
+    # Пул хэширования паролей импорта отделен от пула входа и регистрации
+    hash_workers: int = os.cpu_count() or 1
+    use_processes: bool = False
+    # Сколько ошибок строк возвращается в ответе, остальные только считаются
+    max_errors: int = 1000
+
+
+class ImageConfig(ConfigBase):
+    """
+    Setting for validation and re-encoding of uploaded images
+    """
+
+    model_config = SettingsConfigDict(env_prefix="image_")
+    max_bytes: int = 10 * 1024 * 1024
+    max_pixels: int = 40_000_000
+    reencode: bool = True
+    max_edge: int = 1600
+    format: Literal["JPEG", "WEBP"] = "JPEG"
+    quality: int = 90
+    workers: int = 2
+
+
+class GenerationConfig(ConfigBase):
+    """
+    Setting for Kandinsky quality profiles
+    """
+
+    model_config = SettingsConfigDict(env_prefix="generation_")
+    default_profile: QualityProfile = "standard"
+    # Самый дорогой профиль, доступный роли
+    max_profile: dict[str, QualityProfile] = {"admins": "high", "users": "standard"}
+
+
+class ResponseCacheConfig(ConfigBase):
+    """
+    Setting for the Redis cache of image analysis responses
+    """
+
+    model_config = SettingsConfigDict(env_prefix="response_cache_")
+    enabled: bool = True
+    # индексы 0-2 заняты токенами, очередью Kandinsky и кэшем эмбеддингов DeepFace
+    db: int = 3
+    ttl: int = 3600
+    max_entries: int = 10000
+    max_value_bytes: int = 64 * 1024
+
+
+class UserCacheConfig(ConfigBase):
+    """
+    Setting for the Redis read-through cache of user and profile responses
+    """
+
+    model_config = SettingsConfigDict(env_prefix="user_cache_")
+    enabled: bool = True
+    # индексы 0-3 заняты токенами, очередью Kandinsky, кэшем эмбеддингов DeepFace и кэшем ответов
+    db: int = 4
+    ttl: int = 300
+
+
 class DatabaseConfig(ConfigBase):
     """
     Setting for the PostgreSQL database
@@ -98,6 +229,14 @@ class Settings(BaseSettings):
     db: DatabaseConfig = Field(default_factory=DatabaseConfig)
     admin: AdminConfig = Field(default_factory=AdminConfig)
     api: ApiConfig = Field(default_factory=ApiConfig)
+    http: HttpConfig = Field(default_factory=HttpConfig)
+    hasher: HasherConfig = Field(default_factory=HasherConfig)
+    user_import: UserImportConfig = Field(default_factory=UserImportConfig)
+    token_cache: TokenCacheConfig = Field(default_factory=TokenCacheConfig)
+    image: ImageConfig = Field(default_factory=ImageConfig)
+    response_cache: ResponseCacheConfig = Field(default_factory=ResponseCacheConfig)
+    user_cache: UserCacheConfig = Field(default_factory=UserCacheConfig)
+    generation: GenerationConfig = Field(default_factory=GenerationConfig)
     token_timeout: int = 600
 
 
@@ -0,0 +1,130 @@
+from collections.abc import AsyncIterator, Callable
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+class CountedStream(httpx.AsyncByteStream):
+    """Тело ответа, при закрытии которого запрос перестает считаться выполняемым"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self.stream = stream
+        self.release: Callable[[], None] | None = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if self.release is not None:
+            self.release()
+            self.release = None
+        await self.stream.aclose()
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт пула соединений с учетом запросов в работе.
+    Запрос считается от отправки до закрытия ответа, в том числе потокового,
+    то есть все время, пока он занимает соединение пула.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.in_flight = 0
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.release()
+            raise
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        response.stream = CountedStream(response.stream, self.release)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class UpstreamClient:
+    """
+    Общий HTTP-клиент воркера для обращения к сервисам DeepFace и Kandinsky.
+    Соединения переиспользуются между запросами (keep-alive).
+    """
+
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+        self._transport: CountingTransport | None = None
+        registry.gauge(
+            "upstream_requests_in_flight",
+            "Количество запросов к сервисам изображений, занимающих соединение пула",
+            callback=lambda: self._transport.in_flight if self._transport else 0,
+        )
+        registry.gauge(
+            "upstream_pool_max_connections",
+            "Максимальное количество соединений пула",
+            callback=lambda: settings.http.max_connections,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Клиент, созданный при запуске приложения"""
+        if self._client is None:
+            raise RuntimeError("Upstream client is not started")
+        return self._client
+
+    def start(self) -> None:
+        """Создаем клиент с пулом соединений"""
+        if self._client is None:
+            self._transport = CountingTransport(
+                httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=settings.http.max_connections,
+                        max_keepalive_connections=settings.http.max_keepalive_connections,
+                        keepalive_expiry=settings.http.keepalive_expiry,
+                    )
+                )
+            )
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout(settings.http.deepface_timeout),
+            )
+
+    async def close(self) -> None:
+        """Закрываем соединения пула"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._transport = None
+
+    @staticmethod
+    def timeout(read: float) -> httpx.Timeout:
+        """Таймауты запроса к сервису с заданным временем ожидания ответа"""
+        return httpx.Timeout(
+            connect=settings.http.connect_timeout,
+            read=read,
+            write=settings.http.write_timeout,
+            pool=settings.http.pool_timeout,
+        )
+
+    @property
+    def deepface_timeout(self) -> httpx.Timeout:
+        return self.timeout(settings.http.deepface_timeout)
+
+    @property
+    def kandinsky_timeout(self) -> httpx.Timeout:
+        return self.timeout(settings.http.kandinsky_timeout)
+
+    @property
+    def jobs_timeout(self) -> httpx.Timeout:
+        return self.timeout(settings.http.jobs_timeout)
+
+
+upstream = UpstreamClient()
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePath
+from typing import NoReturn
+
+from fastapi import UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from PIL.JpegImagePlugin import JpegImageFile
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+# Сигнатуры поддерживаемых форматов в начале файла
+MAGIC_BYTES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+)
+
+
+def allowed_file(filename: str | None) -> bool:
+    return (
+        filename is not None
+        and "." in filename
+        and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    )
+
+
+def sniff_format(head: bytes) -> str | None:
+    """Формат изображения по первым байтам файла"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, image_format in MAGIC_BYTES:
+        if head.startswith(magic):
+            return image_format
+    return None
+
+
+def reencode(contents: bytes, max_edge: int, image_format: str, quality: int) -> bytes:
+    """
+    Уменьшение изображения до max_edge по длинной стороне и сжатие.
+    Уже сжатые JPEG/WebP в пределах размера передаются без изменений.
+    """
+    img: Image.Image = Image.open(BytesIO(contents))
+    if img.format in EXTENSIONS and max(img.size) <= max_edge:
+        return contents
+    if isinstance(img, JpegImageFile):
+        img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    buffer = BytesIO()
+    img.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+class ImageRejected(Exception):
+    """Загруженный файл не является допустимым изображением"""
+
+    def __init__(self, message: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImageProcessor:
+    """
+    Проверка загруженных изображений до отправки в сервисы обработки:
+    сигнатура формата, размер файла и количество пикселей по заголовку.
+    Допустимые изображения при необходимости уменьшаются и пережимаются
+    в пуле потоков, чтобы не занимать цикл событий.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor: ThreadPoolExecutor | None = None
+        self.rejected = registry.counter(
+            "image_rejected_total",
+            "Количество загруженных файлов, отклоненных проверкой",
+        )
+        self.reencode_time = registry.histogram(
+            "image_reencode_duration_seconds",
+            "Время уменьшения и сжатия изображения",
+        )
+        self.bytes_saved = registry.counter(
+            "image_upstream_bytes_saved_total",
+            "Уменьшение объема изображений, передаваемых сервисам, байты",
+        )
+
+    def start(self) -> None:
+        """Создаем пул потоков"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        """Останавливаем пул потоков"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def reject(
+        self, message: str, status_code: int = status.HTTP_400_BAD_REQUEST
+    ) -> NoReturn:
+        self.rejected.inc()
+        raise ImageRejected(message, status_code)
+
+    async def read(self, file: UploadFile) -> bytes:
+        """Проверенное содержимое загруженного изображения, пиксели не декодируются"""
+        config = settings.image
+        if not allowed_file(file.filename):
+            self.reject(
+                f"Неверное расширение файла '{file.filename}'. "
+                f"Допустимые расширения {list(ALLOWED_EXTENSIONS)}"
+            )
+        too_large = f"Размер файла '{file.filename}' больше {config.max_bytes} байт"
+        if file.size is not None and file.size > config.max_bytes:
+            self.reject(too_large, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        head = await file.read(12)
+        if sniff_format(head) is None:
+            self.reject(
+                f"Файл '{file.filename}' не является изображением JPEG, PNG или WebP",
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        contents = head + await file.read(config.max_bytes + 1 - len(head))
+        if len(contents) > config.max_bytes:
+            self.reject(too_large, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        try:
+            # читается только заголовок, пиксели не декодируются
+            with Image.open(BytesIO(contents)) as img:
+                width, height = img.size
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            self.reject(f"Файл '{file.filename}' поврежден")
+        if width * height > config.max_pixels:
+            self.reject(
+                f"Изображение '{file.filename}' больше {config.max_pixels} пикселей",
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        return contents
+
+    async def encode(self, filename: str, contents: bytes) -> tuple[str, bytes]:
+        """Уменьшенное и сжатое изображение для отправки сервису: имя файла и содержимое"""
+        config = settings.image
+        if not config.reencode:
+            return filename, contents
+
+        self.start()
+        started = time.perf_counter()
+        try:
+            encoded = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                reencode,
+                contents,
+                config.max_edge,
+                config.format,
+                config.quality,
+            )
+        except (OSError, ValueError):
+            self.reject(f"Файл '{filename}' поврежден")
+        self.reencode_time.observe(time.perf_counter() - started)
+        if encoded is contents:
+            return filename, contents
+        self.bytes_saved.inc(max(len(contents) - len(encoded), 0))
+        return f"{PurePath(filename).stem}.{EXTENSIONS[config.format]}", encoded
+
+    async def prepare(self, file: UploadFile) -> tuple[str, bytes]:
+        """Проверенное изображение для отправки сервису: имя файла и содержимое"""
+        contents = await self.read(file)
+        return await self.encode(str(file.filename), contents)
+
+
+image_processor = ImageProcessor(settings.image.workers)
@@ -0,0 +1,62 @@
+"""
+Метрики приложения в формате Prometheus на prometheus_client, как в сервисе DeepFace.
+Значения хранятся в памяти процесса, поэтому каждый воркер gunicorn
+отдает собственные счетчики.
+"""
+
+from collections.abc import Callable
+from typing import TypeVar
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.metrics import MetricWrapperBase
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+M = TypeVar("M", bound=MetricWrapperBase)
+
+
+class MetricsRegistry:
+    """
+    Метрики шлюза в общем реестре prometheus_client.
+    Метрика с уже зарегистрированным именем возвращается повторно:
+    кэши и пулы с метриками могут создаваться больше одного раза.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, MetricWrapperBase] = {}
+
+    def register(self, name: str, factory: Callable[[], M]) -> M:
+        if name not in self.metrics:
+            self.metrics[name] = factory()
+        return self.metrics[name]  # type: ignore[return-value]
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.register(name, lambda: Counter(name, description))
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        callback: Callable[[], float] | None = None,
+    ) -> Gauge:
+        def factory() -> Gauge:
+            gauge = Gauge(name, description)
+            if callback is not None:
+                gauge.set_function(callback)
+            return gauge
+
+        return self.register(name, factory)
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(name, lambda: Histogram(name, description, buckets=buckets))
+
+    def render(self) -> bytes:
+        return generate_latest(REGISTRY)
+
+
+registry = MetricsRegistry()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, model_validator
 from typing import Annotated
 
 
@@ -25,6 +25,37 @@ class User(UserRead):
     ]
 
 
+class UserImport(UserRead):
+    """Строка массового импорта: пароль или уже вычисленный bcrypt-хэш"""
+
+    # длина ограничена столбцом users.email, иначе COPY завершится ошибкой
+    email: Annotated[
+        EmailStr,
+        Field(max_length=30, description="Электронная почта пользователя, до 30 символов"),
+    ]
+    password: Annotated[
+        str | None,
+        Field(
+            min_length=8,
+            max_length=20,
+            description="Пароль пользователя, от 8 до 20 символов",
+        ),
+    ] = None
+    password_hash: Annotated[
+        str | None,
+        Field(
+            pattern=r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$",
+            description="bcrypt-хэш пароля из другой системы, хэширование не выполняется",
+        ),
+    ] = None
+
+    @model_validator(mode="after")
+    def check_password(self) -> "UserImport":
+        if (self.password is None) == (self.password_hash is None):
+            raise ValueError("Нужно указать либо password, либо password_hash")
+        return self
+
+
 class UserAuth(BaseModel):
     username: Annotated[str, Field()]
     password: Annotated[str, Field()]
@@ -1,15 +1,24 @@
+import asyncio
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import jwt
 import bcrypt
 import secrets
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.metrics import registry
 
 if not hasattr(bcrypt, "__about__"):
     bcrypt.__about__ = type("about", (object,), {"__version__": bcrypt.__version__})  # type: ignore[attr-defined]
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Хэш случайного пароля для проверки несуществующих пользователей,
+# чтобы время ответа не выдавало наличие логина в базе
+DUMMY_PASSWORD_HASH = pwd_context.hash(secrets.token_urlsafe(16))
+
 
 def verify_string(one_string: str, other_string: str) -> bool:
     """Функция для проверки, соответствует ли одна строка другой"""
@@ -26,6 +35,97 @@ def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Хэши списка паролей за одну задачу пула, без передачи каждого пароля отдельно"""
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _timed_call(func: Callable, *args) -> tuple:
+    """Выполнение функции в пуле с отметками времени начала и окончания"""
+    started = time.monotonic()
+    result = func(*args)
+    return result, started, time.monotonic()
+
+
+class HasherOverloaded(Exception):
+    """Очередь пула хэширования заполнена"""
+
+
+class PasswordHasher:
+    """
+    Пул для вычисления и проверки bcrypt-хэшей вне цикла событий.
+    Если все воркеры заняты и очередь заполнена, запрос сразу отклоняется.
+    """
+
+    def __init__(self, workers: int, max_queue: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.executor: Executor | None = None
+        self.pending = 0
+        self.queue_wait = registry.histogram(
+            "password_hash_queue_wait_seconds",
+            "Время ожидания задачи хэширования в очереди пула",
+        )
+        self.hash_time = registry.histogram(
+            "password_hash_duration_seconds",
+            "Время вычисления или проверки bcrypt-хэша",
+        )
+        self.rejected = registry.counter(
+            "password_hash_rejected_total",
+            "Количество задач хэширования, отклоненных из-за переполнения очереди",
+        )
+        registry.gauge(
+            "password_hash_pending",
+            "Количество задач хэширования в очереди и в работе",
+            callback=lambda: self.pending,
+        )
+
+    def start(self) -> None:
+        """Создаем пул воркеров"""
+        if self.executor is None:
+            executor_class = (
+                ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            )
+            self.executor = executor_class(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        """Останавливаем пул воркеров"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run(self, func: Callable, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected.inc()
+            raise HasherOverloaded("Password hashing pool is saturated")
+        self.start()
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _timed_call, func, *args
+            )
+        finally:
+            self.pending -= 1
+        self.queue_wait.observe(started - submitted)
+        self.hash_time.observe(finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+
+hasher = PasswordHasher(
+    workers=settings.hasher.workers,
+    max_queue=settings.hasher.max_queue,
+    use_processes=settings.hasher.use_processes,
+)
+
+
 def create_jwt_token(data: dict) -> str:
     """
     Функция для создания JWT токена.
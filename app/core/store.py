@@ -1,39 +1,431 @@
-from redis import ConnectionError, Redis
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
 
+import httpx
+from fastapi.encoders import jsonable_encoder
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.connection import AbstractConnection, Connection
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, RedisError, TimeoutError, WatchError
+
+from app.core.cache import token_cache
 from app.core.config import settings
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
 
+class RedisStore:
+    """Хранилище поверх общего асинхронного пула соединений Redis"""
 
-class TokenDict:
-    def __init__(self, host, port, db):
+    def __init__(
+        self,
+        host,
+        port,
+        db,
+        connection_class: type[AbstractConnection] = Connection,
+    ):
         self.host = host
         self.port = port
         self.db = db
-        self.timeout = 3  # seconds
-        self.connection = None
+        self.timeout = settings.redis.socket_timeout  # seconds
+        self.connection_class = connection_class
+        self.pool: ConnectionPool | None = None
+        self.connection: Redis | None = None
 
-    def connect(self):
-        """Создаем соединение с Redis"""
+    async def connect(self):
+        """Создаем пул соединений с Redis"""
+        pool = ConnectionPool(
+            host=self.host,
+            port=self.port,
+            db=self.db,
+            socket_timeout=self.timeout,
+            socket_connect_timeout=self.timeout,
+            max_connections=settings.redis.max_connections,
+            health_check_interval=settings.redis.health_check_interval,
+            retry=Retry(
+                ExponentialBackoff(
+                    cap=settings.redis.backoff_cap, base=settings.redis.backoff_base
+                ),
+                retries=settings.redis.retries,
+            ),
+            retry_on_error=[ConnectionError, TimeoutError],
+            connection_class=self.connection_class,
+        )
+        connection = Redis(connection_pool=pool)
         try:
-            connection = Redis(
-                host=self.host, port=self.port, db=self.db, socket_timeout=self.timeout
-            )
-            connection.ping()  # проверяем доступность сервера
-            self.connection = connection
+            await connection.ping()  # проверяем доступность сервера
         except Exception as e:
+            await pool.disconnect()
             raise ConnectionError(f"Failed to connect to Redis server: {str(e)}")
+        self.pool = pool
+        self.connection = connection
+
+    @property
+    def redis(self) -> Redis:
+        """Соединение, открытое connect"""
+        if self.connection is None:
+            raise ConnectionError("Redis connection is not open")
+        return self.connection
+
+    async def close(self):
+        """Закрываем соединения пула"""
+        if self.connection is not None:
+            await self.connection.aclose()
+        if self.pool is not None:
+            await self.pool.disconnect()
+        self.connection = None
+        self.pool = None
+
+
+class TokenDict(RedisStore):
+    @staticmethod
+    def user_key(username: str) -> str:
+        """Ключ множества токенов пользователя"""
+        return f"user_tokens:{username}"
 
-    def add_token(self, token: str, username: str):
-        self.connection.setex(token, settings.token_timeout * 60, username)
+    async def add_token(self, token: str, username: str):
+        timeout = settings.token_timeout * 60
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(token, timeout, username)
+            pipe.sadd(self.user_key(username), token)
+            pipe.expire(self.user_key(username), timeout)
+            await pipe.execute()
 
-    def del_token(self, token):
-        self.connection.delete(token)
+    async def del_token(self, token) -> str | None:
+        token_cache.invalidate(token)
+        value = await self.redis.getdel(token)
+        if not value:
+            return None
+        username = value.decode("utf-8")
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(self.user_key(username), token)
+            pipe.publish(
+                settings.token_cache.channel, token_cache.revoke_message(token)
+            )
+            await pipe.execute()
+        return username
+
+    async def revoke_user_tokens(self, username: str) -> list[str]:
+        """Удаляем все токены пользователя одним пакетом команд"""
+        tokens = [
+            token.decode("utf-8")
+            for token in await self.redis.smembers(self.user_key(username))  # type: ignore[misc]
+        ]
+        token_cache.invalidate(*tokens)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if tokens:
+                pipe.delete(*tokens)
+                pipe.publish(
+                    settings.token_cache.channel, token_cache.revoke_message(*tokens)
+                )
+            pipe.delete(self.user_key(username))
+            await pipe.execute()
+        return tokens
+
+    async def listen_revoked(self):
+        """
+        Слушаем канал отозванных токенов и удаляем их из кэша воркера.
+        Некорректное сообщение пропускается, после любой ошибки Redis подписка
+        восстанавливается, а кэш очищается, так как сообщения могли быть потеряны.
+        """
+        delay = settings.redis.backoff_base
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(settings.token_cache.channel)
+                    delay = settings.redis.backoff_base
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message is None:
+                            continue
+                        try:
+                            token_cache.handle_revoke_message(message["data"])
+                        except (ValueError, KeyError, TypeError) as e:
+                            log.warning("Malformed token revocation message: %r", e)
+            except RedisError as e:
+                log.warning("Token revocation channel is unavailable: %s", str(e))
+                token_cache.clear()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.redis.backoff_cap)
 
-    def get_user_by_token(self, token):
-        value = self.connection.get(token)
+    async def get_user_by_token(self, token):
+        value = await self.redis.get(token)
         return value.decode("utf-8") if value else None
 
 
+class ResponseCache(RedisStore):
+    """
+    Кэш ответов сервиса распознавания лиц по содержимому изображения.
+    Одинаковые одновременные запросы воркера ждут один общий запрос к сервису.
+    Количество записей ограничено: ключи учитываются в отсортированном
+    множестве по времени добавления, самые старые удаляются первыми.
+    Ошибки Redis не прерывают запрос, ответ просто не кэшируется.
+    """
+
+    index_key = "response:index"
+
+    def __init__(
+        self,
+        host,
+        port,
+        db,
+        ttl: int,
+        max_entries: int,
+        max_value_bytes: int,
+        enabled: bool = True,
+        connection_class: type[AbstractConnection] = Connection,
+    ):
+        super().__init__(host, port, db, connection_class)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_value_bytes = max_value_bytes
+        self.enabled = enabled
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = registry.counter(
+            "response_cache_hits_total", "Количество ответов, найденных в кэше"
+        )
+        self.misses = registry.counter(
+            "response_cache_misses_total",
+            "Количество запросов, переданных сервису изображений",
+        )
+        self.coalesced = registry.counter(
+            "response_cache_coalesced_total",
+            "Количество запросов, дождавшихся одинакового запроса в работе",
+        )
+
+    @staticmethod
+    def key(endpoint: str, contents: bytes, **params) -> str:
+        """Ключ ответа: эндпоинт, параметры обработки и хэш содержимого"""
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+        digest.update(contents)
+        return f"response:{endpoint}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> bytes | None:
+        if self.connection is None:
+            return None
+        try:
+            return await self.connection.get(key)
+        except RedisError as e:
+            log.warning("Response cache is unavailable: %s", str(e))
+            return None
+
+    async def set(self, key: str, value: bytes) -> None:
+        if self.connection is None or len(value) > self.max_value_bytes:
+            return
+        now = time.time()
+        try:
+            async with self.connection.pipeline(transaction=True) as pipe:
+                pipe.setex(key, self.ttl, value)
+                pipe.zadd(self.index_key, {key: now})
+                # истекшие записи удаляются из индекса
+                pipe.zremrangebyscore(self.index_key, "-inf", now - self.ttl)
+                pipe.zcard(self.index_key)
+                *_, size = await pipe.execute()
+            if size > self.max_entries:
+                evicted = await self.connection.zpopmin(
+                    self.index_key, size - self.max_entries
+                )
+                await self.connection.delete(*(name for name, _ in evicted))
+        except RedisError as e:
+            log.warning("Response cache is unavailable: %s", str(e))
+
+    async def _fetch(
+        self, key: str, fetch: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        response = await fetch()
+        if response.status_code == 200:
+            await self.set(key, response.content)
+        return response
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self.inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибка уже передана ожидавшим запросам
+
+    async def fetch(
+        self, key: str, fetch: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """Ответ из кэша или результат одного общего запроса к сервису"""
+        if not self.enabled:
+            return await fetch()
+        task = self.inflight.get(key)
+        if task is None:
+            cached = await self.get(key)
+            if cached is not None:
+                self.hits.inc()
+                return httpx.Response(
+                    200, content=cached, headers={"content-type": "application/json"}
+                )
+            # одинаковый запрос мог начаться за время чтения из Redis
+            task = self.inflight.get(key)
+        if task is None:
+            self.misses.inc()
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            self.coalesced.inc()
+        # отключение одного клиента не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+
+class UserCache(RedisStore):
+    """
+    Кэш ответов /me и /me/profile по логину пользователя (read-through).
+    Одинаковые одновременные чтения воркера ждут один общий запрос к базе.
+    При изменении пользователя записи удаляются и увеличивается его версия:
+    чтение из базы, начатое до изменения, не запишет в кэш устаревший ответ.
+    Ошибки Redis не прерывают запрос, ответ читается из базы.
+    """
+
+    kinds = ("me", "profile")
+
+    def __init__(
+        self,
+        host,
+        port,
+        db,
+        ttl: int,
+        enabled: bool = True,
+        connection_class: type[AbstractConnection] = Connection,
+    ):
+        super().__init__(host, port, db, connection_class)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = registry.counter(
+            "user_cache_hits_total", "Количество ответов о пользователе из кэша"
+        )
+        self.misses = registry.counter(
+            "user_cache_misses_total",
+            "Количество чтений пользователя или профиля из базы",
+        )
+        self.coalesced = registry.counter(
+            "user_cache_coalesced_total",
+            "Количество чтений, дождавшихся одинакового чтения из базы",
+        )
+        self.invalidations = registry.counter(
+            "user_cache_invalidations_total",
+            "Количество сбросов кэша пользователя при изменении или удалении",
+        )
+
+    @staticmethod
+    def key(kind: str, username: str) -> str:
+        return f"user:{username}:{kind}"
+
+    @staticmethod
+    def version_key(username: str) -> str:
+        return f"user:{username}:version"
+
+    async def _load(
+        self,
+        kind: str,
+        username: str,
+        version: bytes | None,
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        value = jsonable_encoder(await load())
+        if self.connection is None:
+            return value
+        version_key = self.version_key(username)
+        try:
+            async with self.connection.pipeline(transaction=True) as pipe:
+                # запись только если пользователь не изменился за время чтения из базы
+                await pipe.watch(version_key)
+                if await pipe.get(version_key) == version:
+                    pipe.multi()
+                    pipe.setex(self.key(kind, username), self.ttl, json.dumps(value))
+                    await pipe.execute()
+        except WatchError:
+            pass
+        except RedisError as e:
+            log.warning("User cache is unavailable: %s", str(e))
+        return value
+
+    def _done(self, flight: str, task: asyncio.Task) -> None:
+        if self.inflight.get(flight) is task:
+            del self.inflight[flight]
+        if not task.cancelled():
+            task.exception()  # ошибка уже передана ожидавшим запросам
+
+    async def fetch(
+        self, kind: str, username: str, load: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Ответ из кэша или результат одного общего чтения из базы"""
+        if not self.enabled:
+            return jsonable_encoder(await load())
+        flight = self.key(kind, username)
+        task = self.inflight.get(flight)
+        if task is None:
+            cached, version = None, None
+            if self.connection is not None:
+                try:
+                    cached, version = await self.connection.mget(
+                        flight, self.version_key(username)
+                    )
+                except RedisError as e:
+                    log.warning("User cache is unavailable: %s", str(e))
+            if cached is not None:
+                self.hits.inc()
+                return json.loads(cached)
+            # одинаковое чтение могло начаться за время обращения к Redis
+            task = self.inflight.get(flight)
+        if task is None:
+            self.misses.inc()
+            task = asyncio.create_task(self._load(kind, username, version, load))
+            self.inflight[flight] = task
+            task.add_done_callback(lambda done: self._done(flight, done))
+        else:
+            self.coalesced.inc()
+        return await asyncio.shield(task)
+
+    async def invalidate(self, *usernames: str) -> None:
+        """Сбрасываем кэш пользователей, вызывается после фиксации изменений в базе"""
+        if not self.enabled:
+            return
+        self.invalidations.inc(len(usernames))
+        for username in usernames:
+            # новые чтения не присоединяются к чтению, начатому до изменения
+            for kind in self.kinds:
+                self.inflight.pop(self.key(kind, username), None)
+        if self.connection is None:
+            return
+        try:
+            async with self.connection.pipeline(transaction=True) as pipe:
+                for username in usernames:
+                    pipe.incr(self.version_key(username))
+                    pipe.expire(self.version_key(username), self.ttl)
+                    pipe.delete(*(self.key(kind, username) for kind in self.kinds))
+                await pipe.execute()
+        except RedisError as e:
+            log.warning("User cache is unavailable: %s", str(e))
+
+
 token_dict = TokenDict(
     host=settings.redis.host, port=settings.redis.port, db=settings.redis.db
 )
-token_dict.connect()
+response_cache = ResponseCache(
+    host=settings.redis.host,
+    port=settings.redis.port,
+    db=settings.response_cache.db,
+    ttl=settings.response_cache.ttl,
+    max_entries=settings.response_cache.max_entries,
+    max_value_bytes=settings.response_cache.max_value_bytes,
+    enabled=settings.response_cache.enabled,
+)
+user_cache = UserCache(
+    host=settings.redis.host,
+    port=settings.redis.port,
+    db=settings.user_cache.db,
+    ttl=settings.user_cache.ttl,
+    enabled=settings.user_cache.enabled,
+)
@@ -0,0 +1,263 @@
+import asyncio
+import codecs
+import csv
+import json
+import time
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.schemas.profile import Profile, default_profile
+from app.core.schemas.user import UserImport
+from app.core.security import hash_passwords
+from app.crud.user import UsersCRUD
+
+CSV_MEDIA_TYPE = "text/csv"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+IMPORT_MEDIA_TYPES = (CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE)
+PROFILE_FIELDS = tuple(Profile.model_fields)
+
+
+class RowError(Exception):
+    """Строка импорта не может быть добавлена"""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    """Непустые строки тела запроса с номерами по мере поступления фрагментов"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    number, tail = 0, ""
+    async for chunk in chunks:
+        *lines, tail = (tail + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail.strip():
+        yield number + 1, tail.rstrip("\r")
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes], media_type: str
+) -> AsyncIterator[tuple[int, dict | RowError]]:
+    """
+    Записи импорта из CSV (первая строка - заголовок) или NDJSON.
+    Ошибка разбора строки возвращается вместо записи и не прерывает импорт.
+    """
+    header: list[str] | None = None
+    async for number, line in iter_lines(chunks):
+        try:
+            if media_type == NDJSON_MEDIA_TYPE:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise RowError("Строка должна быть объектом JSON")
+            else:
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [value.strip() for value in values]
+                    continue
+                if len(values) != len(header):
+                    raise RowError(f"Ожидалось {len(header)} значений, получено {len(values)}")
+                # пустые ячейки CSV считаются отсутствующими значениями
+                record = {key: value for key, value in zip(header, values) if value != ""}
+        except (RowError, ValueError, csv.Error) as e:
+            yield number, RowError(str(e))
+            continue
+        yield number, record
+
+
+def validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+class UserImporter:
+    """
+    Массовый импорт пользователей из потока CSV или NDJSON.
+    Строки проверяются и собираются в пачки; пароли пачки хэшируются
+    в собственном пуле, чтобы не занимать пул входа и регистрации,
+    а пачка вставляется одной транзакцией (COPY или executemany).
+    Пачка, не прошедшая из-за гонки с другой регистрацией или ошибки
+    данных, добавляется построчно, чтобы ошибка досталась только этой строке.
+    """
+
+    def __init__(self, batch_size: int, workers: int, use_processes: bool = False):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.use_processes = use_processes
+        self.executor: Executor | None = None
+        self.created = registry.counter(
+            "user_import_created_total",
+            "Количество пользователей, добавленных массовым импортом",
+        )
+        self.failed = registry.counter(
+            "user_import_failed_total",
+            "Количество строк массового импорта, завершившихся ошибкой",
+        )
+        self.batch_time = registry.histogram(
+            "user_import_batch_duration_seconds",
+            "Время хэширования и вставки одной пачки импорта",
+        )
+
+    def start(self) -> None:
+        """Создаем пул хэширования"""
+        if self.executor is None:
+            executor_class = (
+                ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            )
+            self.executor = executor_class(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        """Останавливаем пул хэширования"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        """Хэши паролей: список делится на части по числу воркеров пула"""
+        if not passwords:
+            return []
+        self.start()
+        loop = asyncio.get_running_loop()
+        size = -(-len(passwords) // self.workers)
+        parts = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.executor, hash_passwords, passwords[i : i + size]
+                )
+                for i in range(0, len(passwords), size)
+            )
+        )
+        return [password_hash for part in parts for password_hash in part]
+
+    async def insert(
+        self, session: AsyncSession, rows: list[tuple[int, UserImport, dict]]
+    ) -> list[tuple[int, str]]:
+        """Вставка пачки одной транзакцией, возвращаются ошибки строк с занятыми логинами"""
+        crud = UsersCRUD(session)
+        taken_usernames, taken_emails = await crud.taken(
+            [user.username for _, user, _ in rows], [user.email for _, user, _ in rows]
+        )
+        errors: list[tuple[int, str]] = []
+        free: list[tuple[int, UserImport, dict]] = []
+        for row in rows:
+            if row[1].username in taken_usernames or row[1].email in taken_emails:
+                errors.append((row[0], "User already exists"))
+            else:
+                free.append(row)
+        rows = free
+        if rows:
+            users = [
+                {
+                    "username": user.username,
+                    "email": user.email,
+                    "password_hash": user.password_hash,
+                }
+                for _, user, _ in rows
+            ]
+            profiles = {user.username: profile for _, user, profile in rows}
+            await crud.insert_many(users, profiles)
+        await session.commit()
+        return errors
+
+    async def import_batch(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        rows: list[tuple[int, UserImport, dict]],
+    ) -> list[tuple[int, str]]:
+        started = time.perf_counter()
+        plain = [user for _, user, _ in rows if user.password is not None]
+        hashes = await self.hash_many([str(user.password) for user in plain])
+        for user, password_hash in zip(plain, hashes):
+            user.password, user.password_hash = None, password_hash
+        try:
+            async with session_maker() as session:
+                errors = await self.insert(session, rows)
+        except (IntegrityError, DataError):
+            errors = []
+            for row in rows:
+                try:
+                    async with session_maker() as session:
+                        errors += await self.insert(session, [row])
+                except (IntegrityError, DataError) as e:
+                    # занятые логины уже отсеяны, здесь гонка или другое нарушение
+                    errors.append((row[0], str(e.orig)))
+        self.batch_time.observe(time.perf_counter() - started)
+        return errors
+
+    async def run(
+        self,
+        chunks: AsyncIterator[bytes],
+        media_type: str,
+        session_maker: async_sessionmaker[AsyncSession],
+        max_errors: int = 1000,
+    ) -> dict:
+        """
+        Импорт потока: возвращается количество добавленных пользователей,
+        количество ошибок и первые max_errors ошибок с номерами строк.
+        """
+        created, failed = 0, 0
+        errors: list[dict] = []
+        # повторы логина или почты внутри пачки отсекаются до обращения к базе,
+        # повторы из прошлых пачек находит проверка занятых в базе
+        seen_usernames: set[str] = set()
+        seen_emails: set[str] = set()
+        batch: list[tuple[int, UserImport, dict]] = []
+
+        def fail(number: int, detail: str) -> None:
+            nonlocal failed
+            failed += 1
+            if len(errors) < max_errors:
+                errors.append({"line": number, "detail": detail})
+
+        async def flush() -> None:
+            nonlocal created
+            batch_errors = await self.import_batch(session_maker, batch)
+            for number, detail in batch_errors:
+                fail(number, detail)
+            created += len(batch) - len(batch_errors)
+            batch.clear()
+            seen_usernames.clear()
+            seen_emails.clear()
+
+        async for number, record in iter_records(chunks, media_type):
+            if isinstance(record, RowError):
+                fail(number, str(record))
+                continue
+            try:
+                user = UserImport.model_validate(record)
+                fields = {key: record[key] for key in PROFILE_FIELDS if key in record}
+                # как и при регистрации, профиль создается для каждого пользователя
+                profile = (
+                    Profile.model_validate(fields) if fields else default_profile
+                ).model_dump()
+            except ValidationError as e:
+                fail(number, validation_detail(e))
+                continue
+            if user.username in seen_usernames or user.email in seen_emails:
+                fail(number, "Duplicate username or email in file")
+                continue
+            seen_usernames.add(user.username)
+            seen_emails.add(user.email)
+            batch.append((number, user, profile))
+            if len(batch) >= self.batch_size:
+                await flush()
+        if batch:
+            await flush()
+        self.created.inc(created)
+        self.failed.inc(failed)
+        return {"created": created, "failed": failed, "errors": errors}
+
+
+user_importer = UserImporter(
+    batch_size=settings.user_import.batch_size,
+    workers=settings.user_import.hash_workers,
+    use_processes=settings.user_import.use_processes,
+)
@@ -1,19 +1,61 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import AsyncGenerator
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.openapi.docs import (
     get_redoc_html,
     get_swagger_ui_html,
     get_swagger_ui_oauth2_redirect_html,
 )
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
+
+from app.core.config import settings
+from app.core.http_client import upstream
+from app.core.images import ImageRejected, image_processor
+from app.core.security import HasherOverloaded, hasher
+from app.core.store import response_cache, token_dict, user_cache
+from app.core.user_import import user_importer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # startup
+    hasher.start()
+    await token_dict.connect()
+    revoked_listener = asyncio.create_task(token_dict.listen_revoked())
+    if response_cache.enabled:
+        await response_cache.connect()
+    if user_cache.enabled:
+        await user_cache.connect()
+    upstream.start()
+    image_processor.start()
     yield
+    # shutdown
+    user_importer.shutdown()
+    image_processor.shutdown()
+    await upstream.close()
+    revoked_listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await revoked_listener
+    await user_cache.close()
+    await response_cache.close()
+    await token_dict.close()
+    hasher.shutdown()
+
+
+async def hasher_overloaded_handler(
+    request: Request, exc: HasherOverloaded
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": str(settings.hasher.retry_after)},
+    )
+
+
+async def image_rejected_handler(request: Request, exc: ImageRejected) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"error": str(exc)})
 
 
 def register_static_docs_routes(app: FastAPI) -> None:
@@ -50,4 +92,6 @@ def create_app(
     )
     if create_custom_static_urls:
         register_static_docs_routes(app)
+    app.add_exception_handler(HasherOverloaded, hasher_overloaded_handler)  # type: ignore[arg-type]
+    app.add_exception_handler(ImageRejected, image_rejected_handler)  # type: ignore[arg-type]
     return app
@@ -5,18 +5,49 @@ Update
 Delete
 """
 
+import json
+from collections.abc import AsyncGenerator, AsyncIterator, Callable
+from typing import Protocol
+
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from collections.abc import AsyncGenerator
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.core.models.base import async_session
 from app.core.models import User as UserModel
 
+# Количество строк, получаемых за одно обращение к серверному курсору
+STREAM_CHUNK_SIZE = 1000
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession]:
     async with async_session() as session:
         yield session
 
 
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    """
+    Фабрика сессий для потоковых ответов: тело такого ответа читается
+    из базы уже после выхода из обработчика и закрытия его зависимостей.
+    """
+    return async_session
+
+
+class StreamingCRUD(Protocol):
+    """CRUD, отдающий строки таблицы потоком через серверный курсор"""
+
+    def stream(self, after: int = 0) -> AsyncIterator[dict]: ...
+
+
+async def export_ndjson(
+    session_maker: async_sessionmaker[AsyncSession],
+    crud_class: Callable[[AsyncSession], StreamingCRUD],
+    after: int = 0,
+) -> AsyncIterator[str]:
+    """Строки таблицы в формате NDJSON по мере чтения из серверного курсора"""
+    async with session_maker() as session:
+        async for item in crud_class(session).stream(after):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
 class UsersItemsCRUD:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -5,63 +5,97 @@ Update
 Delete
 """
 
-import asyncio
+from collections.abc import AsyncIterator
 from typing import Annotated
 
 from fastapi import Depends
-from sqlalchemy import select, update, delete
+from sqlalchemy import insert, select, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.schemas.profile import Profile, default_profile
 from app.core.models import Profile as ProfileModel, User as UserModel
-from app.crud.base_crud import UsersItemsCRUD, get_async_session
+from app.core.store import user_cache
+from app.crud.base_crud import STREAM_CHUNK_SIZE, UsersItemsCRUD, get_async_session
 
 
 class ProfileCRUD(UsersItemsCRUD):
+    @staticmethod
+    def user_id_subquery(username: str):
+        return select(UserModel.id).where(UserModel.username == username).scalar_subquery()
+
     async def create(self, current_user: str, profile_in: Profile) -> Profile:
-        params = profile_in.model_dump()
-        user_id = await self.get_id_by_name(current_user)
-        params["user_id"] = user_id
-        profile = ProfileModel(**params)
-        self.session.add(profile)
-        profile_out = profile.get_schemas
+        """Идентификатор пользователя подставляется подзапросом в том же INSERT"""
+        statement = insert(ProfileModel).values(
+            **profile_in.model_dump(), user_id=self.user_id_subquery(current_user)
+        )
+        await self.session.execute(statement)
         await self.session.commit()
-        return Profile(**profile_out)
+        return profile_in
 
     async def update(self, current_user, profile_in: Profile) -> Profile:
+        """Изменение и чтение результата одним UPDATE ... RETURNING"""
         params = profile_in.model_dump()
         default_params = default_profile.model_dump()
         params = {k: w for k, w in params.items() if default_params[k] != w}
-        user_id = await self.get_id_by_name(current_user)
+        if not params:
+            return await self.get_by_name(current_user)
         statement = (
-            update(ProfileModel).where(ProfileModel.user_id == user_id).values(**params)
+            update(ProfileModel)
+            .where(ProfileModel.user_id == self.user_id_subquery(current_user))
+            .values(**params)
+            .returning(ProfileModel.first_name, ProfileModel.last_name, ProfileModel.phone)
         )
-        await self.session.execute(statement)
+        row = (await self.session.execute(statement)).one()
         await self.session.commit()
-        profile_out = await self.get_by_name(current_user)
-        return profile_out
+        await user_cache.invalidate(current_user)
+        return Profile.model_construct(**row._mapping)
 
     async def delete(self, current_user) -> Profile:
         statement = delete(UserModel).where(UserModel.username == current_user)
         profile_out = await self.get_by_name(current_user)
         await self.session.execute(statement)
         await self.session.commit()
+        await user_cache.invalidate(current_user)
         return profile_out
 
     async def get_by_name(self, username) -> Profile:
+        """
+        Только нужные столбцы без загрузки ORM-объекта.
+        Данные в базе уже проверены при записи, поэтому схема собирается без валидации.
+        """
         statement = (
-            select(ProfileModel).join(UserModel).where(UserModel.username == username)
+            select(ProfileModel.first_name, ProfileModel.last_name, ProfileModel.phone)
+            .join(UserModel)
+            .where(UserModel.username == username)
+        )
+        row = (await self.session.execute(statement)).one()
+        return Profile.model_construct(**row._mapping)
+
+    @staticmethod
+    def list_statement(after: int):
+        """Профили с id больше after по возрастанию id (keyset по первичному ключу)"""
+        return (
+            select(
+                ProfileModel.id,
+                ProfileModel.first_name,
+                ProfileModel.last_name,
+                ProfileModel.phone,
+            )
+            .where(ProfileModel.id > after)
+            .order_by(ProfileModel.id)
         )
-        profile_out = (await self.session.scalars(statement)).one().get_schemas
-        return Profile(**profile_out)
 
-    async def get(self) -> list:
-        profile_list = []
-        statement = select(ProfileModel).order_by(ProfileModel.id)
-        profiles = await self.session.scalars(statement)
-        await asyncio.sleep(0)
-        for profile in profiles:
-            profile_list.append(profile.get_schemas)
-        return profile_list
+    async def get(self, after: int = 0, limit: int = 100) -> list[dict]:
+        """Страница списка профилей после профиля с id after"""
+        rows = await self.session.execute(self.list_statement(after).limit(limit))
+        return [dict(row._mapping) for row in rows]
+
+    async def stream(self, after: int = 0) -> AsyncIterator[dict]:
+        """Все профили через серверный курсор, в памяти не больше одной пачки"""
+        result = await self.session.stream(
+            self.list_statement(after).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        async for row in result:
+            yield dict(row._mapping)
 
 
 def profile_crud(
@@ -5,92 +5,212 @@ Update
 Delete
 """
 
-import asyncio
+from collections.abc import AsyncIterator
 from typing import Annotated
 import logging
+from asyncpg import DataError as PostgresDataError, IntegrityConstraintViolationError
 from fastapi import Depends
-from sqlalchemy import select, update, delete
+from sqlalchemy import insert, select, update, delete
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.security import get_password_hash
+from app.core.security import DUMMY_PASSWORD_HASH, hasher
+from app.core.store import user_cache
+from app.core.schemas.profile import Profile
 from app.core.schemas.user import UserRead, User as UserSchema, default_user
-from app.core.models import User as UserModel
-from app.crud.base_crud import UsersItemsCRUD, get_async_session
+from app.core.models import Profile as ProfileModel, User as UserModel
+from app.core.models.user import RoleEnum
+from app.crud.base_crud import STREAM_CHUNK_SIZE, UsersItemsCRUD, get_async_session
 
 
 log = logging.getLogger(__name__)
 
 
 class UsersCRUD(UsersItemsCRUD):
-    async def create(self, user_in: UserSchema) -> UserRead:
+    async def _insert(self, user_in: UserSchema) -> int:
+        """Добавляем пользователя одним INSERT ... RETURNING, без загрузки ORM-объекта"""
         params = user_in.model_dump()
-        params["password_hash"] = get_password_hash(params.pop("password"))
-        user = UserModel(**params)
-        self.session.add(user)
-        user_out = user.get_schemas
+        params["password_hash"] = await hasher.hash(params.pop("password"))
+        statement = insert(UserModel).values(**params).returning(UserModel.id)
+        return (await self.session.execute(statement)).scalar_one()
+
+    async def create(self, user_in: UserSchema) -> UserRead:
+        await self._insert(user_in)
+        await self.session.commit()
+        log.info("Creating user")
+        return UserRead(username=user_in.username, email=user_in.email)
+
+    async def create_with_profile(
+        self, user_in: UserSchema, profile_in: Profile
+    ) -> tuple[UserRead, Profile]:
+        """
+        Пользователь и профиль создаются в одной транзакции двумя запросами:
+        идентификатор пользователя возвращается первым INSERT, повторное чтение не нужно.
+        """
+        user_id = await self._insert(user_in)
+        await self.session.execute(
+            insert(ProfileModel).values(**profile_in.model_dump(), user_id=user_id)
+        )
         await self.session.commit()
         log.info("Creating user")
-        return UserRead(**user_out)
+        return UserRead(username=user_in.username, email=user_in.email), profile_in
+
+    async def taken(
+        self, usernames: list[str], emails: list[str]
+    ) -> tuple[set[str], set[str]]:
+        """Уже занятые логины и, отдельно, адреса почты из переданных"""
+        statement = select(UserModel.username, UserModel.email).where(
+            UserModel.username.in_(usernames) | UserModel.email.in_(emails)
+        )
+        rows = (await self.session.execute(statement)).all()
+        usernames_set, emails_set = set(usernames), set(emails)
+        return (
+            {row.username for row in rows if row.username in usernames_set},
+            {row.email for row in rows if row.email in emails_set},
+        )
+
+    async def _copy(self, table: str, rows: list[dict]) -> None:
+        """Вставка строк в таблицу: COPY в PostgreSQL, executemany в остальных СУБД"""
+        connection = await self.session.connection()
+        if connection.dialect.name == "postgresql":
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+            if driver_connection is None:
+                raise RuntimeError("Соединение с базой данных закрыто")
+            columns = list(rows[0])
+            try:
+                await driver_connection.copy_records_to_table(
+                    table,
+                    columns=columns,
+                    records=[tuple(row[column] for column in columns) for row in rows],
+                )
+            # COPY идет в обход SQLAlchemy, ошибки приводятся к ее типам
+            except IntegrityConstraintViolationError as e:
+                raise IntegrityError(f"COPY {table}", None, e) from e
+            except PostgresDataError as e:
+                raise DataError(f"COPY {table}", None, e) from e
+            return
+        model = UserModel if table == UserModel.__tablename__ else ProfileModel
+        await self.session.execute(insert(model), rows)
+
+    async def insert_many(self, users: list[dict], profiles: dict[str, dict]) -> None:
+        """
+        Пакетная вставка пользователей с готовыми хэшами паролей и их профилей,
+        профиль передается для каждого пользователя.
+        Идентификаторы новых пользователей читаются одним запросом по логинам.
+        Транзакцию фиксирует вызывающий.
+        """
+        await self._copy(
+            UserModel.__tablename__,
+            [{**user, "role": RoleEnum.users.value} for user in users],
+        )
+        statement = select(UserModel.id, UserModel.username).where(
+            UserModel.username.in_(profiles)
+        )
+        rows = await self.session.execute(statement)
+        await self._copy(
+            ProfileModel.__tablename__,
+            [{**profiles[row.username], "user_id": row.id} for row in rows],
+        )
 
     async def update(self, current_user, user_in: UserSchema) -> UserRead:
+        """Изменение и чтение результата одним UPDATE ... RETURNING"""
         params = user_in.model_dump()
         default_params = default_user.model_dump()
         params = {k: w for k, w in params.items() if default_params[k] != w}
         if params.get("password"):
-            params["password_hash"] = get_password_hash(params.pop("password"))
+            params["password_hash"] = await hasher.hash(params.pop("password"))
+        if not params:
+            return await self.get_by_name(current_user)
         statement = (
-            update(UserModel).where(UserModel.username == current_user).values(**params)
+            update(UserModel)
+            .where(UserModel.username == current_user)
+            .values(**params)
+            .returning(UserModel.username, UserModel.email)
         )
-        await self.session.execute(statement)
+        row = (await self.session.execute(statement)).one()
         await self.session.commit()
-        username_new = params.get("username")
-        current_user = username_new if username_new else current_user
-        user_out = await self.get_by_name(current_user)
-        return user_out
+        # при смене логина сбрасываются записи и прежнего, и нового логина
+        await user_cache.invalidate(current_user, row.username)
+        return UserRead.model_construct(**row._mapping)
 
     async def delete(self, current_user) -> UserRead:
         statement = delete(UserModel).where(UserModel.username == current_user)
         user_out = await self.get_by_name(current_user)
         await self.session.execute(statement)
         await self.session.commit()
+        await user_cache.invalidate(current_user)
         return user_out
 
     async def get_by_name(self, username) -> UserRead:
-        statement = select(UserModel).where(UserModel.username == username)
-        user_out = (await self.session.scalars(statement)).one().get_schemas
-        return UserRead(**user_out)
+        """
+        Только нужные столбцы без загрузки ORM-объекта.
+        Данные в базе уже проверены при записи, поэтому схема собирается без валидации.
+        """
+        statement = select(UserModel.username, UserModel.email).where(
+            UserModel.username == username
+        )
+        row = (await self.session.execute(statement)).one()
+        return UserRead.model_construct(**row._mapping)
 
     async def get_id_by_name(self, username: str) -> int:
         statement = select(UserModel.id).where(UserModel.username == username)
         return (await self.session.scalars(statement)).one()
 
+    async def get_names_by_ids(self, ids: list[int]) -> dict[int, str]:
+        """Логины пользователей по идентификаторам, удаленные пользователи пропускаются"""
+        statement = select(UserModel.id, UserModel.username).where(UserModel.id.in_(ids))
+        return {row.id: row.username for row in await self.session.execute(statement)}
+
     async def get_role_by_name(self, username: str) -> str:
         statement = select(UserModel.role).where(UserModel.username == username)
         return (await self.session.scalars(statement)).one()
 
-    async def get_hash_by_name(self, username: str) -> str:
+    async def get_hash_by_name(self, username: str) -> str | None:
         statement = select(UserModel.password_hash).where(
             UserModel.username == username
         )
         return (await self.session.scalars(statement)).one()
 
-    async def get_users_and_passwords(self) -> list:
-        users_list = []
-        statement = select(UserModel).order_by(UserModel.id)
-        users = await self.session.scalars(statement)
-        await asyncio.sleep(0)
-        for user in users:
-            users_list.append(user.get_username_password)
-        return users_list
-
-    async def get(self) -> list:
-        users_list = []
-        statement = select(UserModel).order_by(UserModel.id)
-        users = await self.session.scalars(statement)
-        await asyncio.sleep(0)
-        for user in users.all():
-            users_list.append(user.get_schemas)
-        log.info("Get all users")
-        return users_list
+    async def get_auth_by_name(self, username: str) -> dict | None:
+        """Логин, хэш пароля и роль пользователя по уникальному индексу username"""
+        statement = select(
+            UserModel.username, UserModel.password_hash, UserModel.role
+        ).where(UserModel.username == username)
+        row = (await self.session.execute(statement)).one_or_none()
+        return dict(row._mapping) if row else None
+
+    async def authenticate(self, username: str, password: str) -> dict | None:
+        """
+        Проверка логина и пароля пользователя.
+        Выполняется ровно одна проверка хэша: для несуществующего пользователя
+        пароль сверяется с фиктивным хэшем, чтобы время ответа не отличалось.
+        """
+        item = await self.get_auth_by_name(username)
+        hashed_password = (item or {}).get("password_hash") or DUMMY_PASSWORD_HASH
+        is_pass_ok = await hasher.verify(password, hashed_password)
+        return item if item and is_pass_ok else None
+
+    @staticmethod
+    def list_statement(after: int):
+        """Пользователи с id больше after по возрастанию id (keyset по первичному ключу)"""
+        return (
+            select(UserModel.id, UserModel.username, UserModel.email)
+            .where(UserModel.id > after)
+            .order_by(UserModel.id)
+        )
+
+    async def get(self, after: int = 0, limit: int = 100) -> list[dict]:
+        """Страница списка пользователей после пользователя с id after"""
+        rows = await self.session.execute(self.list_statement(after).limit(limit))
+        log.info("Get users after %d", after)
+        return [dict(row._mapping) for row in rows]
+
+    async def stream(self, after: int = 0) -> AsyncIterator[dict]:
+        """Все пользователи через серверный курсор, в памяти не больше одной пачки"""
+        result = await self.session.stream(
+            self.list_statement(after).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        async for row in result:
+            yield dict(row._mapping)
 
 
 def users_crud(
@@ -6,7 +6,7 @@ import logging
 
 from app.core.models.user import RoleEnum
 from app.core.schemas.user import UserAuth
-from app.core.security import verify_password, verify_string
+from app.core.cache import token_cache
 from app.core.config import settings
 from app.core.store import token_dict
 from app.crud.user import UsersCRUD, users_crud
@@ -25,22 +25,21 @@ async def auth_user_oath2(
     Функция для извлечения информации о пользователе из OAuth2PasswordBearer авторизации.
     Проверяем логин и пароль пользователя.
     """
-    items = await crud.get_users_and_passwords()
-    for item in items:
-        is_user_ok = verify_string(credentials.username, item.get("username"))
-        is_pass_ok = verify_password(credentials.password, item.get("password_hash"))
-        if is_user_ok and is_pass_ok:
-            return item
-    else:
+    item = await crud.authenticate(credentials.username, credentials.password)
+    if item is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return item
 
 
-def get_current_user(credentials: Annotated[str, Depends(oauth2_scheme)]):
+async def get_current_user(credentials: Annotated[str, Depends(oauth2_scheme)]):
     """Получение текущего пользователя из токена"""
+    user = token_cache.get(credentials)
+    if user is not None:
+        return user
     try:
         payload = jwt.decode(credentials, settings.api.secret_key)
         username: str = payload.get("sub")
@@ -51,14 +50,16 @@ def get_current_user(credentials: Annotated[str, Depends(oauth2_scheme)]):
                 detail="Unable to validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        list_users = token_dict.get_user_by_token(credentials)
+        list_users = await token_dict.get_user_by_token(credentials)
         if list_users is None or username not in list_users:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return {"username": username, "role": role}
+        user = {"username": username, "role": role}
+        token_cache.put(credentials, user, payload.get("exp", 0))
+        return user
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
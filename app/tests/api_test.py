@@ -1,9 +1,29 @@
+import asyncio
+import json
+from io import BytesIO
 from unittest.mock import patch
+
+import httpx
+import pytest
+from PIL import Image
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.requests import Request
+
+from app.api.image import CLIENT_CLOSED_REQUEST, proxy_stream
+from app.core.http_client import CountingTransport, upstream
 from app.crud.user import UsersCRUD
-from app.core.security import get_password_hash
+from app.core.config import settings
+from app.core.schemas.user import User
+from app.core.security import DUMMY_PASSWORD_HASH, get_password_hash, hasher
+
+
+def make_image(size: tuple[int, int] = (64, 64), image_format: str = "JPEG") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, "gray").save(buffer, format=image_format)
+    return buffer.getvalue()
 
 
-def test_create_user_success(test_app_mock_db, token_dict):
+def test_create_user_success(test_app_mock_db):
     """
     Создание нового пользователя
     """
@@ -17,7 +37,6 @@ def test_create_user_success(test_app_mock_db, token_dict):
         "last_name": "Doe",
         "phone": "12345678",
     }
-    token_dict.connect()
     response = test_app_mock_db.post(
         "/api/users",
         json={"user_in": user_in, "profile_in": profile_in},
@@ -31,17 +50,16 @@ def test_create_user_success(test_app_mock_db, token_dict):
     assert resp_json["profile"]["last_name"] == "Doe"
 
 
-def test_login_success(test_app_mock_db, token_dict):
+def test_login_success(test_app_mock_db):
     """
     Авторизация пользователя. В случае успеха возвращает токен доступа
     """
-    token_dict.connect()
     item = {"username": "test_login_user", "password": "password", "role": "users"}
     item["password_hash"] = get_password_hash(item.pop("password"))
     with patch.object(
         UsersCRUD,
-        "get_users_and_passwords",
-        return_value=[item],
+        "get_auth_by_name",
+        return_value=item,
     ):
         response = test_app_mock_db.post(
             "/login",
@@ -55,6 +73,38 @@ def test_login_success(test_app_mock_db, token_dict):
         assert len(resp_json["access_token"]) > 0
 
 
+def test_login_unknown_user(test_app_mock_db):
+    """
+    Для несуществующего пользователя выполняется одна проверка фиктивного хэша
+    """
+    with (
+        patch.object(UsersCRUD, "get_auth_by_name", return_value=None),
+        patch.object(hasher, "verify", return_value=False) as verify,
+    ):
+        response = test_app_mock_db.post(
+            "/login",
+            data={"username": "unknown_user", "password": "password"},
+        )
+        assert response.status_code == 401
+        verify.assert_called_once_with("password", DUMMY_PASSWORD_HASH)
+
+
+def test_login_hasher_overloaded(test_app_mock_db):
+    """
+    При переполненной очереди хэширования запрос сразу отклоняется с кодом 503
+    """
+    with (
+        patch.object(UsersCRUD, "get_auth_by_name", return_value=None),
+        patch.object(hasher, "pending", hasher.workers + hasher.max_queue),
+    ):
+        response = test_app_mock_db.post(
+            "/login",
+            data={"username": "test_login_user", "password": "password"},
+        )
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+
 def test_protected_success(test_app_mock_db, new_token):
     """
     Проверка токена на доступ к ресурсу
@@ -120,3 +170,574 @@ def test_update_user_success(test_app_mock_db, new_token):
         assert resp_json["description"] == "User updated"
         assert resp_json["user info"]["username"] == user_in["username"]
         assert resp_json["user info"]["email"] == user_in["email"]
+
+
+@pytest.mark.asyncio
+async def test_export_users_ndjson(engine, session):
+    """
+    Выгрузка пользователей передается построчно в формате NDJSON
+    """
+    from app.main import app
+    from app.crud.base_crud import get_session_maker
+    from app.dependencies.dependencies import get_current_admin
+
+    crud = UsersCRUD(session)
+    for i in range(3):
+        await crud.create(
+            User(username=f"export{i}", email=f"export{i}@example.com", password="password")
+        )
+    app.dependency_overrides[get_current_admin] = lambda: {"username": "admin"}
+    app.dependency_overrides[get_session_maker] = lambda: async_sessionmaker(
+        bind=engine, expire_on_commit=False
+    )
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.get("/api/users/export")
+    finally:
+        del app.dependency_overrides[get_current_admin]
+        del app.dependency_overrides[get_session_maker]
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert set(rows[0]) == {"id", "username", "email"}
+    assert {f"export{i}" for i in range(3)} <= {row["username"] for row in rows}
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_import_users_csv(engine, session):
+    """
+    Массовый импорт: корректные строки добавляются, ошибки перечисляются по номерам строк
+    """
+    from app.main import app
+    from app.crud.base_crud import get_session_maker
+    from app.core.schemas.profile import default_profile
+    from app.crud.profile import ProfileCRUD
+    from app.dependencies.dependencies import get_current_admin
+
+    await UsersCRUD(session).create(
+        User(username="imported", email="imported@example.com", password="password")
+    )
+    await UsersCRUD(session).create(
+        User(username="mailer", email="m@example.com", password="password")
+    )
+    body = "\n".join(
+        [
+            "username,email,password,password_hash,first_name,phone",
+            "import0,import0@example.com,password,,Ivan,+71234567890",
+            f"import1,import1@example.com,,{DUMMY_PASSWORD_HASH},,",
+            "import0,other@example.com,password,,,",
+            "import2,not-an-email,password,,,",
+            "imported,new@example.com,password,,,",
+            # логин совпадает с почтой другого пользователя, это не конфликт
+            "m@example.com,m2@example.com,password,,,",
+            f"import3,{'a' * 30}@example.com,password,,,",
+        ]
+    )
+    app.dependency_overrides[get_current_admin] = lambda: {"username": "admin"}
+    app.dependency_overrides[get_session_maker] = lambda: async_sessionmaker(
+        bind=engine, expire_on_commit=False
+    )
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post(
+                "/api/users/import", content=body, headers={"content-type": "text/csv"}
+            )
+            unsupported = await client.post(
+                "/api/users/import", content=body, headers={"content-type": "text/plain"}
+            )
+    finally:
+        del app.dependency_overrides[get_current_admin]
+        del app.dependency_overrides[get_session_maker]
+    assert unsupported.status_code == 415
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 3
+    assert report["failed"] == 4
+    errors = {error["line"]: error["detail"] for error in report["errors"]}
+    assert sorted(errors) == [4, 5, 6, 8]
+    assert errors[6] == "User already exists"
+    assert errors[8].startswith("email:")
+    assert await UsersCRUD(session).authenticate("m@example.com", "password")
+    assert await UsersCRUD(session).authenticate("import0", "password")
+    assert (await ProfileCRUD(session).get_by_name("import0")).first_name == "Ivan"
+    assert await UsersCRUD(session).get_hash_by_name("import1") == DUMMY_PASSWORD_HASH
+    # пользователь без полей профиля получает профиль по умолчанию, как при регистрации
+    assert await ProfileCRUD(session).get_by_name("import1") == default_profile
+
+
+@pytest.mark.asyncio
+async def test_import_duplicates_across_batches(engine):
+    """
+    Повтор строки из прошлой пачки находит проверка занятых в базе
+    """
+    from app.core.user_import import CSV_MEDIA_TYPE, UserImporter
+
+    async def body():
+        yield "\n".join(
+            [
+                "username,email,password",
+                "batch0,batch0@example.com,password",
+                "batch1,batch1@example.com,password",
+                "batch0,batch2@example.com,password",
+            ]
+        ).encode()
+
+    importer = UserImporter(batch_size=2, workers=1)
+    try:
+        report = await importer.run(
+            body(), CSV_MEDIA_TYPE, async_sessionmaker(bind=engine, expire_on_commit=False)
+        )
+    finally:
+        importer.shutdown()
+    assert report["created"] == 2
+    assert report["errors"] == [{"line": 4, "detail": "User already exists"}]
+
+
+@pytest.mark.asyncio
+async def test_rename_invalidates_user_cache(session):
+    """
+    Смена логина через PUT /me сбрасывает кэш /me и /me/profile прежнего и нового логина
+    """
+    from app.main import app
+    from app.core.schemas.profile import Profile
+    from app.core.store import user_cache
+    from app.crud.base_crud import get_async_session
+    from app.dependencies.dependencies import get_current_user
+
+    await UsersCRUD(session).create_with_profile(
+        User(username="cached", email="cached@example.com", password="password"),
+        Profile(first_name="Ivan", phone="+71234567890"),
+    )
+    await user_cache.connect()
+    # устаревшие записи удаленного ранее пользователя с новым логином
+    for kind in user_cache.kinds:
+        await user_cache.connection.set(user_cache.key(kind, "renamed"), b"{}")
+    app.dependency_overrides[get_async_session] = lambda: session
+    app.dependency_overrides[get_current_user] = lambda: {
+        "username": "cached",
+        "role": "users",
+    }
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            assert (await client.get("/api/users/me")).status_code == 200
+            assert (await client.get("/api/users/me/profile")).status_code == 200
+            keys = [
+                user_cache.key(kind, username)
+                for kind in user_cache.kinds
+                for username in ("cached", "renamed")
+            ]
+            assert await user_cache.connection.exists(*keys) == 4
+            response = await client.put(
+                "/api/users/me",
+                json={
+                    "username": "renamed",
+                    "email": "renamed@example.com",
+                    "password": "password",
+                },
+            )
+            assert response.status_code == 200
+            assert await user_cache.connection.exists(*keys) == 0
+    finally:
+        del app.dependency_overrides[get_async_session]
+        del app.dependency_overrides[get_current_user]
+        await user_cache.close()
+
+
+def test_metrics(test_app_mock_db):
+    """
+    Метрики отдаются в текстовом формате Prometheus
+    """
+    response = test_app_mock_db.get("/metrics")
+    assert response.status_code == 200
+    assert "password_hash_duration_seconds_count" in response.text
+
+
+def test_generate_image_stream(test_app_mock_db, new_token):
+    """
+    Изображение от сервиса генерации передается клиенту потоком
+    """
+    token, item = new_token
+    chunks = [b"\x89PNG", b"chunk" * 1000]
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(
+            200, headers={"content-type": "image/png"}, content=stream()
+        )
+    )
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/generate_image",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"prompt": "cat"},
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == b"".join(chunks)
+
+
+def test_generate_image_upstream_error(test_app_mock_db, new_token):
+    """
+    Ошибка сервиса генерации возвращается клиенту с тем же кодом
+    """
+    token, item = new_token
+    transport = httpx.MockTransport(lambda request: httpx.Response(500))
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/generate_image",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"prompt": "cat"},
+        )
+    assert response.status_code == 500
+    assert "error" in response.json()
+
+
+def test_generate_image_upstream_overloaded(test_app_mock_db, new_token):
+    """
+    Отказ перегруженного сервиса генерации передается клиенту с Retry-After
+    """
+    token, item = new_token
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(429, headers={"Retry-After": "7"})
+    )
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/generate_image",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"prompt": "cat"},
+        )
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "7"
+
+
+@pytest.mark.asyncio
+async def test_upstream_requests_in_flight():
+    """
+    Запрос считается выполняемым до закрытия ответа, ошибка запроса тоже его освобождает
+    """
+
+    async def body():
+        yield b"image"
+
+    def handler(request):
+        if request.url.path == "/error":
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, content=body())
+
+    transport = CountingTransport(httpx.MockTransport(handler))
+    async with httpx.AsyncClient(transport=transport) as client:
+        async with client.stream("GET", "http://service/image") as response:
+            assert transport.in_flight == 1
+            assert await response.aread() == b"image"
+        assert transport.in_flight == 0
+        with pytest.raises(httpx.ConnectError):
+            await client.get("http://service/error")
+        assert transport.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_proxy_stream_cancelled_on_disconnect():
+    """
+    Отключение клиента во время генерации отменяет запрос к сервису
+    """
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return httpx.Response(200)
+
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await started.wait()
+        return {"type": "http.disconnect"}
+
+    client_request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+    transport = httpx.MockTransport(handler)
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        request = upstream.client.build_request("POST", "http://kandinsky/generate_image")
+        response = await asyncio.wait_for(proxy_stream(request, client_request), 5)
+    assert response.status_code == CLIENT_CLOSED_REQUEST
+    assert cancelled.is_set()
+
+
+def test_create_job(test_app_mock_db, new_token):
+    """
+    Задача генерации ставится в очередь от имени текущего пользователя
+    """
+    token, item = new_token
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(202, json={"id": "job-id", "status": "queued"})
+
+    transport = httpx.MockTransport(handler)
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/jobs",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"kind": "image", "prompt": "cat"},
+        )
+    assert response.status_code == 202
+    assert response.json()["id"] == "job-id"
+    assert requests[0].url.path == "/jobs"
+    assert f"user={item['username']}".encode() in requests[0].content
+    assert b"seed=" not in requests[0].content
+
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/jobs",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"kind": "image", "prompt": "cat", "seed": "42"},
+        )
+        assert response.status_code == 202
+        assert b"seed=42" in requests[1].content
+
+        response = test_app_mock_db.post(
+            "/api/image/jobs",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"kind": "image", "prompt": "cat", "seed": "-1"},
+        )
+        assert response.status_code == 422
+        assert len(requests) == 2
+
+
+def test_job_upstream_errors(test_app_mock_db, new_token):
+    """
+    Ошибки сервиса генерации и ответ не в формате JSON не приводят к сбою шлюза
+    """
+    token, item = new_token
+    responses = {
+        "/jobs": httpx.Response(429, headers={"Retry-After": "3"}, text="Too Many"),
+        "/jobs/missing": httpx.Response(404, json={"detail": "Job not found"}),
+        "/jobs/broken": httpx.Response(200, text="<html>"),
+    }
+    transport = httpx.MockTransport(lambda request: responses[request.url.path])
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/jobs",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"kind": "image", "prompt": "cat"},
+        )
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
+        for job_id, status_code in (("missing", 404), ("broken", 500)):
+            response = test_app_mock_db.get(
+                f"/api/image/jobs/{job_id}",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            assert response.status_code == status_code
+            assert "error" in response.json()
+
+
+def test_generation_profile_capped_by_role(test_app_mock_db, new_token):
+    """
+    Пользователю доступны профили не дороже standard, по умолчанию - standard
+    """
+    token, item = new_token
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(202, json={"id": "job-id", "status": "queued"})
+
+    transport = httpx.MockTransport(handler)
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/jobs",
+            headers={"Authorization": f"Bearer {token}"},
+            data={"kind": "image", "prompt": "cat", "profile": "high"},
+        )
+        assert response.status_code == 403
+        assert not requests
+
+        for data, profile in (({}, "standard"), ({"profile": "draft"}, "draft")):
+            response = test_app_mock_db.post(
+                "/api/image/jobs",
+                headers={"Authorization": f"Bearer {token}"},
+                data={"kind": "image", "prompt": "cat", **data},
+            )
+            assert response.status_code == 202
+            assert f"profile={profile}".encode() in requests[-1].content
+
+
+def test_count_people_upstream_overloaded(test_app_mock_db, new_token):
+    """
+    Отказ перегруженного сервиса DeepFace передается клиенту с Retry-After
+    """
+    token, item = new_token
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(503, headers={"Retry-After": "5"})
+    )
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/count-people",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("face.jpg", make_image())},
+        )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+
+def test_count_people_cached(test_app_mock_db, new_token):
+    """
+    Повторный запрос с тем же изображением отвечается из кэша без обращения к сервису
+    """
+    token, item = new_token
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"count people": 3})
+
+    transport = httpx.MockTransport(handler)
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        for _ in range(2):
+            response = test_app_mock_db.post(
+                "/api/image/count-people",
+                headers={"Authorization": f"Bearer {token}"},
+                files={"file": ("face.jpg", make_image((48, 48)))},
+            )
+            assert response.status_code == 200
+            assert response.json() == {"count people": 3}
+    assert len(requests) == 1
+
+
+def test_compare_faces_batch(test_app_mock_db, new_token):
+    """
+    Эталон и все кандидаты передаются сервису DeepFace одним запросом
+    """
+    token, item = new_token
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"results": [], "errors": []})
+
+    transport = httpx.MockTransport(handler)
+    with patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)):
+        response = test_app_mock_db.post(
+            "/api/image/compare-faces/batch",
+            headers={"Authorization": f"Bearer {token}"},
+            files=[
+                ("probe", ("probe.jpg", make_image())),
+                ("candidates", ("a.jpg", make_image())),
+                ("candidates", ("b.png", make_image(image_format="PNG"))),
+            ],
+        )
+    assert response.status_code == 200
+    assert len(requests) == 1
+    assert requests[0].url.path == "/compare-faces/batch"
+    assert requests[0].content.count(b'name="candidates"') == 2
+
+
+def test_identify(test_app_mock_db, new_token):
+    """
+    Идентификаторы из галереи DeepFace заменяются логинами,
+    совпадения с удаленными пользователями не возвращаются
+    """
+    token, item = new_token
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(
+            200,
+            json={
+                "matches": [
+                    {"user_id": 1, "distance": 0.1, "verified": True},
+                    {"user_id": 2, "distance": 0.7, "verified": False},
+                ]
+            },
+        )
+    )
+    with (
+        patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)),
+        patch.object(UsersCRUD, "get_names_by_ids", return_value={1: item["username"]}),
+    ):
+        response = test_app_mock_db.post(
+            "/api/image/identify",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("face.jpg", make_image())},
+        )
+    assert response.status_code == 200
+    assert response.json()["matches"] == [
+        {"user_id": 1, "distance": 0.1, "verified": True, "username": item["username"]}
+    ]
+
+
+def test_upload_not_image(test_app_mock_db, new_token):
+    """
+    Файл без сигнатуры изображения отклоняется без обращения к сервису
+    """
+    token, item = new_token
+    with patch.object(upstream, "_client") as client:
+        response = test_app_mock_db.post(
+            "/api/image/count-people",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("face.jpg", b"<html>not an image</html>")},
+        )
+    assert response.status_code == 415
+    assert "error" in response.json()
+    client.post.assert_not_called()
+
+
+def test_upload_too_many_pixels(test_app_mock_db, new_token):
+    """
+    Изображение больше лимита пикселей отклоняется по заголовку
+    """
+    token, item = new_token
+    with (
+        patch.object(settings.image, "max_pixels", 1000),
+        patch.object(upstream, "_client") as client,
+    ):
+        response = test_app_mock_db.post(
+            "/api/image/count-people",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("face.jpg", make_image((100, 100)))},
+        )
+    assert response.status_code == 413
+    client.post.assert_not_called()
+
+
+def test_upload_reencoded(test_app_mock_db, new_token):
+    """
+    Большое PNG уменьшается и пережимается в JPEG до отправки сервису
+    """
+    token, item = new_token
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"count people": 0})
+
+    transport = httpx.MockTransport(handler)
+    with (
+        patch.object(settings.image, "max_edge", 32),
+        patch.object(upstream, "_client", httpx.AsyncClient(transport=transport)),
+    ):
+        response = test_app_mock_db.post(
+            "/api/image/count-people",
+            headers={"Authorization": f"Bearer {token}"},
+            files={"file": ("face.png", make_image((128, 64), "PNG"))},
+        )
+    assert response.status_code == 200
+    body = requests[0].content
+    assert b'filename="face.jpg"' in body
+    image = Image.open(BytesIO(body[body.index(b"\xff\xd8\xff") :]))
+    assert image.size == (32, 16)
@@ -0,0 +1,36 @@
+import time
+
+from app.core.cache import TokenCache
+
+
+def test_token_cache_put_and_get():
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.put("token", {"username": "user"}, time.time() + 600)
+    assert cache.get("token") == {"username": "user"}
+    assert cache.get("unknown-token") is None
+
+
+def test_token_cache_expires_with_token():
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.put("token", {"username": "user"}, time.time() - 1)
+    assert cache.get("token") is None
+    assert "token" not in cache.items
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2, ttl=60)
+    expires_at = time.time() + 600
+    cache.put("first", {"username": "first"}, expires_at)
+    cache.put("second", {"username": "second"}, expires_at)
+    cache.get("first")
+    cache.put("third", {"username": "third"}, expires_at)
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+
+def test_token_cache_revoke_message():
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.put("token", {"username": "user"}, time.time() + 600)
+    cache.handle_revoke_message(TokenCache.revoke_message("token"))
+    assert cache.get("token") is None
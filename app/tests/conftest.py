@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 
 import pytest
@@ -5,9 +6,10 @@ import pytest_asyncio
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
-from fakeredis import FakeStrictRedis
+from fakeredis.aioredis import FakeConnection
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
+from app.core.config import settings
 from app.core.models.base import Base
 from app.core.security import create_jwt_token, get_password_hash
 
@@ -37,17 +39,36 @@ async def session(engine):
         await sess.rollback()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def fake_redis():
+    """
+    Подменяем соединения приложения с Redis на fakeredis
+    """
+    from app.core.store import response_cache, token_dict, user_cache
+
+    # fakeredis не отвечает на проверку соединения по health_check_interval
+    with (
+        patch.object(token_dict, "connection_class", FakeConnection),
+        patch.object(response_cache, "connection_class", FakeConnection),
+        patch.object(user_cache, "connection_class", FakeConnection),
+        patch.object(settings.redis, "health_check_interval", 0),
+    ):
+        yield
+
+
 @pytest.fixture(scope="module")
 def token_dict():
     """
     Создаем фикстуру для тестирования хранилища токенов
     """
-    with patch("redis.Redis") as mock_redis:
-        mock_redis.return_value = FakeStrictRedis()
-        from app.core.store import TokenDict
+    from app.core.store import TokenDict
 
-        td = TokenDict(host="localhost", port=6379, db=0)
-        return td
+    return TokenDict(
+        host=settings.redis.host,
+        port=settings.redis.port,
+        db=settings.redis.db,
+        connection_class=FakeConnection,
+    )
 
 
 @pytest.fixture(scope="module")
@@ -55,7 +76,6 @@ def new_token(token_dict):
     """
     Создаем новый токен
     """
-    token_dict.connect()
     item = {
         "username": "test_user",
         "password": "password",
@@ -64,7 +84,13 @@ def new_token(token_dict):
     }
     item["password_hash"] = get_password_hash(item.pop("password"))
     token = create_jwt_token({"sub": item.get("username"), "role": item.get("role")})
-    token_dict.add_token(token=token, username=item.get("username"))
+
+    async def add_token():
+        await token_dict.connect()
+        await token_dict.add_token(token=token, username=item.get("username"))
+        await token_dict.close()
+
+    asyncio.run(add_token())
     return token, item
 
 
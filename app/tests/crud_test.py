@@ -20,6 +20,45 @@ async def test_create_user(session):
     assert found_user.email == "test@example.com"
 
 
+@pytest.mark.asyncio
+async def test_authenticate_user(session):
+    crud = UsersCRUD(session)
+    user = await crud.authenticate("test_user", "password")
+    assert user["username"] == "test_user"
+    assert await crud.authenticate("test_user", "wrong_password") is None
+    assert await crud.authenticate("unknown_user", "password") is None
+
+
+@pytest.mark.asyncio
+async def test_get_names_by_ids(session):
+    crud = UsersCRUD(session)
+    user_id = await crud.get_id_by_name("test_user")
+    assert await crud.get_names_by_ids([user_id, user_id + 1000]) == {
+        user_id: "test_user"
+    }
+
+
+@pytest.mark.asyncio
+async def test_users_keyset_pages_and_stream(session):
+    crud = UsersCRUD(session)
+    for i in range(3):
+        await crud.create(
+            User(username=f"page_user{i}", email=f"page{i}@example.com", password="password")
+        )
+    pages, after = [], 0
+    while True:
+        page = await crud.get(after=after, limit=2)
+        pages.extend(page)
+        if len(page) < 2:
+            break
+        after = page[-1]["id"]
+    ids = [item["id"] for item in pages]
+    assert ids == sorted(ids)
+    assert {f"page_user{i}" for i in range(3)} <= {item["username"] for item in pages}
+    assert [item async for item in crud.stream()] == pages
+    assert [item async for item in crud.stream(after=ids[-2])] == pages[-1:]
+
+
 @pytest.mark.asyncio
 async def test_create_profile(session):
     crud = ProfileCRUD(session)
@@ -35,6 +74,19 @@ async def test_create_profile(session):
     assert found_profile.phone == "+71111111111"
 
 
+@pytest.mark.asyncio
+async def test_create_user_with_profile(session):
+    crud = UsersCRUD(session)
+    new_user = User(username="pair_user", email="pair@example.com", password="password")
+    new_profile = Profile(first_name="pair_first", last_name="pair_last", phone="+73333333333")
+    user, profile = await crud.create_with_profile(new_user, new_profile)
+    assert user.username == "pair_user"
+    assert profile == new_profile
+    found_profile = await ProfileCRUD(session).get_by_name(username="pair_user")
+    assert found_profile.first_name == "pair_first"
+    assert found_profile.phone == "+73333333333"
+
+
 @pytest.mark.asyncio
 async def test_update_user(session):
     crud = UsersCRUD(session)
@@ -1,30 +1,173 @@
-def test_token_dict_connect(token_dict):
-    token_dict.connect()
+import asyncio
+import time
+from contextlib import suppress
+
+import httpx
+import pytest
+from fakeredis.aioredis import FakeConnection
+
+from app.core.cache import token_cache
+from app.core.config import settings
+from app.core.store import ResponseCache, UserCache
+
+
+@pytest.mark.asyncio
+async def test_token_dict_connect(token_dict):
+    await token_dict.connect()
     assert token_dict.connection is not None
+    await token_dict.close()
+    assert token_dict.connection is None
 
 
-def test_token_dict_add_and_get(token_dict):
-    token_dict.connect()
+@pytest.mark.asyncio
+async def test_token_dict_add_and_get(token_dict):
+    await token_dict.connect()
     # Добавляем токен
     token = "sample-token"
     username = "test-user"
-    token_dict.add_token(token, username)
+    await token_dict.add_token(token, username)
 
     # Проверяем сохранение токена
-    retrieved_token = token_dict.get_user_by_token(token)
+    retrieved_token = await token_dict.get_user_by_token(token)
     assert retrieved_token == username
+    await token_dict.close()
 
 
-def test_token_dict_delete(token_dict):
-    token_dict.connect()
+@pytest.mark.asyncio
+async def test_token_dict_delete(token_dict):
+    await token_dict.connect()
     # Добавляем токен
     token = "another-sample-token"
     username = "another-test-user"
-    token_dict.add_token(token, username)
+    await token_dict.add_token(token, username)
 
     # Удаляем токен
-    token_dict.del_token(token)
+    assert await token_dict.del_token(token) == username
 
     # Проверяем удаление
-    deleted_username = token_dict.get_user_by_token(token)
+    deleted_username = await token_dict.get_user_by_token(token)
     assert deleted_username is None
+    await token_dict.close()
+
+
+@pytest.mark.asyncio
+async def test_token_dict_revoke_user_tokens(token_dict):
+    await token_dict.connect()
+    username = "revoked-user"
+    tokens = ["first-token", "second-token"]
+    for token in tokens:
+        await token_dict.add_token(token, username)
+
+    # Удаляем все токены пользователя
+    revoked = await token_dict.revoke_user_tokens(username)
+    assert sorted(revoked) == sorted(tokens)
+    for token in tokens:
+        assert await token_dict.get_user_by_token(token) is None
+    await token_dict.close()
+
+
+@pytest.mark.asyncio
+async def test_token_dict_listen_revoked(token_dict):
+    await token_dict.connect()
+    token_cache.put("cached-token", {"username": "user"}, time.time() + 600)
+    listener = asyncio.create_task(token_dict.listen_revoked())
+    await asyncio.sleep(0.1)
+
+    # Некорректное сообщение пропускается, подписка продолжает работать
+    await token_dict.connection.publish(settings.token_cache.channel, "not json")
+    await token_dict.connection.publish(settings.token_cache.channel, '{"tokens": 1}')
+    # Сообщение об отзыве токена из другого воркера
+    await token_dict.connection.publish(
+        settings.token_cache.channel, token_cache.revoke_message("cached-token")
+    )
+    for _ in range(20):
+        if token_cache.get("cached-token") is None:
+            break
+        await asyncio.sleep(0.05)
+    assert "cached-token" not in token_cache.items
+
+    listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await listener
+    await token_dict.close()
+
+
+@pytest.mark.asyncio
+async def test_response_cache_single_flight():
+    cache = ResponseCache(
+        host=settings.redis.host,
+        port=settings.redis.port,
+        db=settings.response_cache.db,
+        ttl=60,
+        max_entries=2,
+        max_value_bytes=1024,
+        connection_class=FakeConnection,
+    )
+    await cache.connect()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"count people": 1})
+
+    # Одинаковые одновременные запросы ждут один запрос к сервису
+    key = cache.key("count-people", b"image")
+    responses = await asyncio.gather(*(cache.fetch(key, fetch) for _ in range(5)))
+    assert calls == 1
+    assert all(response.json() == {"count people": 1} for response in responses)
+
+    # Следующий запрос отвечается из Redis
+    assert (await cache.fetch(key, fetch)).json() == {"count people": 1}
+    assert calls == 1
+
+    # Самые старые записи вытесняются при превышении max_entries
+    for contents in (b"second", b"third"):
+        await cache.fetch(cache.key("count-people", contents), fetch)
+    assert await cache.get(key) is None
+    assert await cache.connection.zcard(cache.index_key) == 2
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_user_cache_read_through():
+    cache = UserCache(
+        host=settings.redis.host,
+        port=settings.redis.port,
+        db=settings.user_cache.db,
+        ttl=60,
+        connection_class=FakeConnection,
+    )
+    await cache.connect()
+    await cache.invalidate("cached_user", "renamed_user")
+    calls = 0
+    released = asyncio.Event()
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await released.wait()
+        return {"username": "cached_user", "email": f"v{calls}@example.com"}
+
+    # Одновременные чтения ждут один запрос к базе, следующее - из Redis
+    released.set()
+    results = await asyncio.gather(
+        *(cache.fetch("me", "cached_user", load) for _ in range(5))
+    )
+    assert calls == 1
+    assert all(result["email"] == "v1@example.com" for result in results)
+    assert (await cache.fetch("me", "cached_user", load))["email"] == "v1@example.com"
+    assert calls == 1
+
+    # Чтение, начатое до изменения пользователя, не записывает устаревший ответ
+    await cache.invalidate("cached_user")
+    released.clear()
+    stale = asyncio.create_task(cache.fetch("me", "cached_user", load))
+    await asyncio.sleep(0.01)
+    await cache.invalidate("cached_user", "renamed_user")
+    released.set()
+    assert (await stale)["email"] == "v2@example.com"
+    assert await cache.connection.get(cache.key("me", "cached_user")) is None
+    assert (await cache.fetch("me", "cached_user", load))["email"] == "v3@example.com"
+    await cache.close()
@@ -0,0 +1,106 @@
+"""
+Процессорное время и пик выделенной памяти на один вызов get_by_name:
+загрузка ORM-объекта со сборкой схемы через get_schemas и валидацию
+против выборки только нужных столбцов.
+Время считается по потоку цикла событий (time.thread_time): запрос
+выполняется в потоке aiosqlite и в замер не входит.
+
+Запуск из корня проекта:
+    ENV_STATE=dev python -m benchmarks.crud_reads
+"""
+
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.core.models import Base, Profile as ProfileModel, User as UserModel
+from app.core.schemas.profile import Profile
+from app.core.schemas.user import UserRead
+from app.crud.profile import ProfileCRUD
+from app.crud.user import UsersCRUD
+
+DB_URL = "sqlite+aiosqlite:///:memory:"
+USERS = 1_000
+CALLS = 2_000
+
+
+async def orm_user(session, username: str) -> UserRead:
+    """Прежний способ: ORM-объект, словарь get_schemas и валидация схемы"""
+    statement = select(UserModel).where(UserModel.username == username)
+    return UserRead(**(await session.scalars(statement)).one().get_schemas)
+
+
+async def orm_profile(session, username: str) -> Profile:
+    statement = (
+        select(ProfileModel).join(UserModel).where(UserModel.username == username)
+    )
+    return Profile(**(await session.scalars(statement)).one().get_schemas)
+
+
+async def fill(session) -> None:
+    await session.execute(
+        insert(UserModel),
+        [
+            {"username": f"user{i}", "email": f"user{i}@example.com"}
+            for i in range(USERS)
+        ],
+    )
+    await session.execute(
+        insert(ProfileModel),
+        [
+            {
+                "first_name": "Ivan",
+                "last_name": "Ivanov",
+                "phone": "+71234567890",
+                "user_id": i + 1,
+            }
+            for i in range(USERS)
+        ],
+    )
+    await session.commit()
+
+
+async def measure(session, read) -> tuple[float, float]:
+    """Среднее время потока цикла событий на вызов в микросекундах и пик памяти в КБ"""
+    started = time.thread_time()
+    for i in range(CALLS):
+        await read(session, f"user{i % USERS}")
+    cpu = (time.thread_time() - started) / CALLS * 1_000_000
+    peaks = []
+    tracemalloc.start()
+    for i in range(CALLS // 10):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await read(session, f"user{i % USERS}")
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    session.expunge_all()
+    return cpu, statistics.median(peaks) / 1024
+
+
+async def main() -> None:
+    engine = create_async_engine(DB_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    cases = {
+        "user orm": orm_user,
+        "user rows": lambda session, name: UsersCRUD(session).get_by_name(name),
+        "profile orm": orm_profile,
+        "profile rows": lambda session, name: ProfileCRUD(session).get_by_name(name),
+    }
+    print(f"{'read':>12} {'cpu, us':>11} {'peak, KB/call':>14}")
+    async with session_maker() as session:
+        await fill(session)
+        for name, read in cases.items():
+            median, allocated = await measure(session, read)
+            print(f"{name:>12} {median:>11.0f} {allocated:>14.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Сравнение пропускной способности запросов к сервису изображений:
+новый httpx.AsyncClient на каждый запрос против общего клиента с пулом соединений.
+В качестве сервиса используется локальная заглушка.
+
+Запуск из корня проекта:
+    ENV_STATE=dev python -m benchmarks.http_pool
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, File, UploadFile
+
+from app.core.http_client import UpstreamClient
+
+HOST = "127.0.0.1"
+PORT = 8765
+REQUESTS = 500
+CONCURRENCY = 50
+PAYLOAD = b"\xff\xd8\xff" + b"0" * 64 * 1024
+
+stub = FastAPI()
+
+
+@stub.post("/count-people")
+async def count_people(file: UploadFile = File(...)):
+    await file.read()
+    return {"count people": 1}
+
+
+def run_stub() -> uvicorn.Server:
+    """Запускаем заглушку сервиса в отдельном потоке"""
+    server = uvicorn.Server(
+        uvicorn.Config(stub, host=HOST, port=PORT, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_requests(send) -> float:
+    """Количество запросов в секунду при заданной конкурентности"""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one():
+        async with semaphore:
+            response = await send()
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    url = f"http://{HOST}:{PORT}/count-people"
+    files = {"file": ("image.jpg", PAYLOAD)}
+
+    async def new_client_per_request():
+        async with httpx.AsyncClient() as client:
+            return await client.post(url, files=files, timeout=None)
+
+    upstream = UpstreamClient()
+    upstream.start()
+
+    async def shared_client():
+        return await upstream.client.post(
+            url, files=files, timeout=upstream.deepface_timeout
+        )
+
+    per_request = await run_requests(new_client_per_request)
+    shared = await run_requests(shared_client)
+    stats = upstream.pool_stats()
+    await upstream.close()
+
+    print(f"{'client':>22} {'requests/s':>12}")
+    print(f"{'new per request':>22} {per_request:>12.0f}")
+    print(f"{'shared pool':>22} {shared:>12.0f}")
+    print(f"speedup: x{shared / per_request:.2f}, pool after run: {stats}")
+
+
+if __name__ == "__main__":
+    server = run_stub()
+    asyncio.run(main())
+    server.should_exit = True
@@ -0,0 +1,71 @@
+"""
+Замер времени авторизации в зависимости от количества пользователей в таблице.
+
+Запуск из корня проекта:
+    ENV_STATE=dev python -m benchmarks.login
+"""
+
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.core.models import Base, User as UserModel
+from app.core.security import get_password_hash
+from app.crud.user import UsersCRUD
+
+DB_URL = "sqlite+aiosqlite:///:memory:"
+TABLE_SIZES = (10, 1_000, 10_000, 100_000)
+ROUNDS = 5
+
+
+async def fill_users(session, start: int, stop: int, password_hash: str) -> None:
+    """Заполняем таблицу пользователей пачками с одинаковым хэшем пароля"""
+    batch = 10_000
+    for offset in range(start, stop, batch):
+        rows = [
+            {
+                "username": f"user{i}",
+                "email": f"user{i}@example.com",
+                "password_hash": password_hash,
+            }
+            for i in range(offset, min(offset + batch, stop))
+        ]
+        await session.execute(insert(UserModel), rows)
+    await session.commit()
+
+
+async def measure(session, username: str, password: str) -> float:
+    """Медианное время одной авторизации в миллисекундах"""
+    crud = UsersCRUD(session)
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        await crud.authenticate(username, password)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main() -> None:
+    engine = create_async_engine(DB_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    password_hash = get_password_hash("password")
+
+    print(f"{'users':>10} {'existing, ms':>14} {'unknown, ms':>14}")
+    filled = 0
+    async with session_maker() as session:
+        for size in TABLE_SIZES:
+            await fill_users(session, filled, size, password_hash)
+            filled = size
+            existing = await measure(session, f"user{size - 1}", "password")
+            unknown = await measure(session, "unknown_user", "password")
+            print(f"{size:>10} {existing:>14.1f} {unknown:>14.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Пропускная способность массового импорта пользователей, строк в минуту:
+строки с готовыми bcrypt-хэшами (только разбор и вставка) и строки
+с паролями, которые хэшируются в пуле импорта.
+База SQLite в памяти, вставка через executemany; в PostgreSQL
+вместо нее используется COPY.
+
+Запуск из корня проекта:
+    ENV_STATE=dev python -m benchmarks.user_import [--hashed 10000] [--plain 200]
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.core.config import settings
+from app.core.models import Base
+from app.core.security import get_password_hash
+from app.core.user_import import CSV_MEDIA_TYPE, UserImporter
+
+DB_URL = "sqlite+aiosqlite:///:memory:"
+CHUNK_SIZE = 64 * 1024
+
+
+async def body(prefix: str, rows: int, password_hash: str | None) -> AsyncIterator[bytes]:
+    """CSV-файл фрагментами, как при чтении тела запроса"""
+    lines = ["username,email,password,password_hash,first_name,last_name,phone"]
+    for i in range(rows):
+        password = "" if password_hash else "password"
+        lines.append(
+            f"{prefix}{i},{prefix}{i}@example.com,{password},{password_hash or ''},"
+            "Ivan,Ivanov,+71234567890"
+        )
+    data = "\n".join(lines).encode()
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i : i + CHUNK_SIZE]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hashed", type=int, default=10_000)
+    parser.add_argument("--plain", type=int, default=200)
+    args = parser.parse_args()
+    engine = create_async_engine(DB_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    importer = UserImporter(
+        batch_size=settings.user_import.batch_size,
+        workers=settings.user_import.hash_workers,
+        use_processes=settings.user_import.use_processes,
+    )
+    cases = {
+        "password_hash": ("hashed", args.hashed, get_password_hash("password")),
+        "password": ("plain", args.plain, None),
+    }
+    print(f"hash workers: {importer.workers}")
+    print(f"{'rows with':>14} {'rows':>7} {'seconds':>8} {'rows/min':>9}")
+    for name, (prefix, rows, password_hash) in cases.items():
+        started = time.perf_counter()
+        report = await importer.run(
+            body(prefix, rows, password_hash), CSV_MEDIA_TYPE, session_maker
+        )
+        elapsed = time.perf_counter() - started
+        assert report["created"] == rows, report
+        print(f"{name:>14} {rows:>7} {elapsed:>8.2f} {rows / elapsed * 60:>9.0f}")
+    importer.shutdown()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())